@@ -0,0 +1,81 @@
+# Import packages
+import json
+
+import pytest
+
+from wallet_analyzer.checkpoint import ScreeningCheckpoint, helper_resumable_feeds, helper_truncate_partial_line
+
+## Helpers
+def helper_write_feed(path, wallet_addresses, torn_line: bytes = b"") -> None:
+    """
+    A function to write a JSON Lines feed of screened wallets, optionally followed by a partially written line.
+    """
+    with open(path, "wb") as f:
+        for wallet_address in wallet_addresses:
+            f.write(json.dumps({"wallet_address": wallet_address, "pnl": 1.0}).encode("utf-8") + b"\n")
+        f.write(torn_line)
+
+## Torn last line
+@pytest.mark.parametrize("content, expected", [
+    (b"", b""),
+    (b'{"a": 1}\n', b'{"a": 1}\n'),
+    (b'{"a": 1}\n{"a": 2}\n{"a"', b'{"a": 1}\n{"a": 2}\n'),
+    (b'{"a": 1', b""),
+    (b'{"a": 1}\n' + b"x" * 200_000, b'{"a": 1}\n'), # The partial line spans several of the blocks read backwards
+    (b"x" * 200_000, b""),
+])
+def test_truncate_partial_line(tmp_path, content, expected):
+    path = tmp_path / "feed.jsonl"
+    path.write_bytes(content)
+    helper_truncate_partial_line(str(path))
+    assert path.read_bytes() == expected
+
+## Resume
+def test_new_run_truncates_the_old_feed(tmp_path):
+    feed_path = tmp_path / "screener.jsonl"
+    helper_write_feed(feed_path, ["w1", "w2"])
+
+    checkpoint = ScreeningCheckpoint(str(feed_path))
+    assert not checkpoint.is_resumed
+    assert checkpoint.completed_wallets == set()
+    assert feed_path.read_bytes() == b""
+
+def test_resume_collects_the_completed_wallets(tmp_path):
+    feed_path = tmp_path / "screener.jsonl"
+    selection = [("w1", 3.0), ("w2", 2.0), ("w3", 1.5), ("w4", 1.0)]
+    ScreeningCheckpoint(str(feed_path)).save_selection(selection)
+
+    # Killed while writing the item of w3
+    helper_write_feed(feed_path, ["w2", "w1"], torn_line=b'{"wallet_address": "w3", "pn')
+    checkpoint = ScreeningCheckpoint(str(feed_path))
+    assert checkpoint.is_resumed
+    assert checkpoint.selected_wallets == selection
+    assert checkpoint.completed_wallets == {"w1", "w2"}
+    assert feed_path.read_bytes().endswith(b"\n")
+
+    # The resumed run appends the remaining wallets, then finishes, so that the next run starts afresh
+    with open(feed_path, "ab") as f:
+        f.write(b'{"wallet_address": "w3"}\n{"wallet_address": "w4"}\n')
+    assert ScreeningCheckpoint(str(feed_path)).completed_wallets == {"w1", "w2", "w3", "w4"}
+    checkpoint.finish()
+    checkpoint = ScreeningCheckpoint(str(feed_path))
+    assert not checkpoint.is_resumed
+    assert feed_path.read_bytes() == b""
+
+def test_resume_without_a_feed(tmp_path):
+    feed_path = tmp_path / "screener.jsonl"
+    ScreeningCheckpoint(str(feed_path)).save_selection([("w1", 1.0)])
+
+    checkpoint = ScreeningCheckpoint(str(feed_path))
+    assert checkpoint.is_resumed
+    assert checkpoint.completed_wallets == set()
+
+## Feeds
+def test_resumable_feeds():
+    feeds = {
+        "screener.jsonl": {"format": "jsonlines", "item_export_kwargs": {"ensure_ascii": False}},
+        "screener.parquet": {"format": "parquet"},
+    }
+    assert helper_resumable_feeds(feeds) == {
+        "screener.jsonl": {"format": "jsonlines", "overwrite": False, "item_export_kwargs": {"ensure_ascii": False, "flush_every_item": True}},
+    }
@@ -0,0 +1,47 @@
+# Import packages
+import logging
+
+import pytest
+
+from wallet_analyzer.helper_functions import (
+    helper_normalize_number,
+    helper_normalize_numbers_in_pct_gains,
+    helper_normalize_numbers_in_txn_data,
+    helper_normalize_numbers_in_vol_liq_mcap,
+    helper_parse_number,
+)
+
+## Number normalization
+@pytest.mark.parametrize("value, expected", [
+    ("$1.2K", 1200.0),
+    ("-$1,234.5K", -1234500.0),
+    ("+$12.3K", 12300.0),
+    ("$-5", -5.0),
+    ("<$0.01", 0.01),
+    ("45.2%", 45.2),
+    ("1B%", 1e9),
+    ("$0.0₅123", 0.00000123),
+    (" 3 M ", 3e6),
+    (None, None),
+    ("", None),
+    ("N/A", None),
+])
+def test_normalize_number(value, expected):
+    if expected is None:
+        assert helper_normalize_number(value) is None
+    else:
+        assert helper_normalize_number(value) == pytest.approx(expected)
+
+def test_normalize_number_units():
+    assert helper_normalize_numbers_in_vol_liq_mcap("$2.5B") == pytest.approx(2500.0)
+    assert helper_normalize_numbers_in_vol_liq_mcap("$250K") == pytest.approx(0.25)
+    assert helper_normalize_numbers_in_pct_gains("1,234%") == pytest.approx(1234.0)
+    assert helper_normalize_numbers_in_txn_data("<$1K") == pytest.approx(1000.0)
+
+@pytest.mark.parametrize("value", ["1.2k", "−$3K"]) # A lowercase suffix, and a Unicode minus sign
+def test_unparseable_numbers_are_logged(caplog, value):
+    helper_parse_number.cache_clear()
+    with caplog.at_level(logging.DEBUG, logger="wallet_analyzer.helper_functions"):
+        assert helper_normalize_number(value) is None
+        assert helper_normalize_number(value) is None
+    assert [record.getMessage() for record in caplog.records] == [f"Unparseable number string: {value!r}"]
@@ -0,0 +1,24 @@
+# Import packages
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from wallet_analyzer.benchmarks.parse_benchmark import BENCHMARK_CASES, FIXTURES_DIR, helper_build_fake_response
+from wallet_analyzer.helper_functions import helper_page_ready
+
+## Readiness markers
+# The parse pool mode only looks for each spider's readiness_marker in the body, so the marker has to agree with the
+# readiness_xpath on the saved pages: both match the fully loaded pages, and neither matches the not loaded ones
+@pytest.mark.parametrize("case", BENCHMARK_CASES, ids=[case.name for case in BENCHMARK_CASES])
+def test_readiness_marker_agrees_with_xpath(case):
+    with open(os.path.join(FIXTURES_DIR, case.fixture), encoding="utf-8") as f:
+        browser_html = f.read()
+    expected = not case.name.endswith("_not_loaded")
+    spider_cls = case.spider_cls
+
+    xpath_spider = SimpleNamespace(readiness_xpath=spider_cls.readiness_xpath, readiness_marker=spider_cls.readiness_marker, parse_pool=None)
+    assert helper_page_ready(xpath_spider, helper_build_fake_response(case, browser_html)) is expected
+
+    marker_spider = SimpleNamespace(readiness_xpath=spider_cls.readiness_xpath, readiness_marker=spider_cls.readiness_marker, parse_pool=object())
+    assert helper_page_ready(marker_spider, helper_build_fake_response(case, browser_html)) is expected
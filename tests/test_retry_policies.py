@@ -0,0 +1,138 @@
+# Import packages
+import logging
+
+import pytest
+from tenacity import RetryCallState
+from zyte_api.aio.errors import RequestError
+
+from wallet_analyzer import retry_policies
+from wallet_analyzer.retry_policies import CircuitBreaker, CustomRetryFactory, RetryBudget
+
+## Helpers
+def helper_circuit_breaker() -> CircuitBreaker:
+    return CircuitBreaker(failure_threshold=3, window_secs=10, open_secs=60, num_probes=2)
+
+def helper_failed_attempt(status: int, url: str = "https://gmgn.ai/sol/address/w1", attempt_number: int = 1) -> RetryCallState:
+    """
+    A function to build the retry state of a Zyte API attempt that failed with an HTTP status.
+    """
+    exc = RequestError(request_info=None, history=(), status=status, query={"url": url}, response_content=b"")
+    retry_state = RetryCallState(retry_object=None, fn=None, args=(), kwargs={})
+    retry_state.attempt_number = attempt_number
+    retry_state.set_exception((type(exc), exc, None))
+    retry_state.upcoming_sleep = 5.0
+    return retry_state
+
+## Circuit breaker
+def test_breaker_opens_after_failure_threshold_within_window():
+    breaker = helper_circuit_breaker()
+    breaker.record_failure(0.0)
+    breaker.record_failure(5.0)
+    breaker.record_failure(12.0) # The first failure left the window
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.admission_delay(12.0) == 0.0
+
+    breaker.record_failure(13.0)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.is_open(13.0)
+    assert breaker.admission_delay(43.0) == pytest.approx(30.0)
+    assert breaker.transitions == [CircuitBreaker.OPEN]
+
+def test_breaker_ignores_late_successes_while_open():
+    breaker = helper_circuit_breaker()
+    for now in (0.0, 1.0, 2.0):
+        breaker.record_failure(now)
+    breaker.record_success(3.0) # A request sent before the breaker opened
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_breaker_half_opens_and_admits_probes():
+    breaker = helper_circuit_breaker()
+    for now in (0.0, 1.0, 2.0):
+        breaker.record_failure(now)
+    assert not breaker.is_open(62.0)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # Two probes go through, then the requests wait
+    assert breaker.admission_delay(62.0) == 0.0
+    assert breaker.admission_delay(62.5) == 0.0
+    assert breaker.admission_delay(63.0) == 1.0
+
+    # Probes that never came back are re-admitted after open_secs
+    assert breaker.admission_delay(122.0) == 0.0
+    assert breaker.transitions == [CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN]
+
+def test_breaker_probe_success_closes():
+    breaker = helper_circuit_breaker()
+    for now in (0.0, 1.0, 2.0):
+        breaker.record_failure(now)
+    assert breaker.admission_delay(62.0) == 0.0
+    breaker.record_success(63.0)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.transitions == [CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN, CircuitBreaker.CLOSED]
+
+    # The failures before it opened no longer count
+    breaker.record_failure(64.0)
+    breaker.record_failure(65.0)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_breaker_probe_failure_reopens():
+    breaker = helper_circuit_breaker()
+    for now in (0.0, 1.0, 2.0):
+        breaker.record_failure(now)
+    assert breaker.admission_delay(62.0) == 0.0
+    breaker.record_failure(63.0)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.admission_delay(63.0) == pytest.approx(60.0)
+    assert not breaker.is_open(123.0)
+    assert breaker.transitions == [CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN]
+
+## Retry budget
+def test_retry_budget_minimum_retries():
+    budget = RetryBudget(ratio=0.2, window_secs=60, min_retries=3)
+    assert [budget.try_spend(float(i)) for i in range(5)] == [True, True, True, False, False]
+
+def test_retry_budget_ratio_of_successes():
+    budget = RetryBudget(ratio=0.2, window_secs=60, min_retries=3)
+    for i in range(50):
+        budget.record_success(i * 0.1) # Several successes per bucket
+    assert sum(budget.try_spend(10.0) for _ in range(20)) == 10
+
+def test_retry_budget_sliding_window():
+    budget = RetryBudget(ratio=0.2, window_secs=60, min_retries=3)
+    for i in range(50):
+        budget.record_success(0.0)
+    assert sum(budget.try_spend(30.0) for _ in range(20)) == 10
+
+    # The successes leave the window at 60 seconds, the retries at 90 seconds
+    assert sum(budget.try_spend(60.0) for _ in range(20)) == 0
+    assert sum(budget.try_spend(90.0) for _ in range(20)) == 3
+    assert (budget.successes, budget.retries) == (0, 3)
+
+## Retry policy
+def test_failing_retry_observer_does_not_fail_the_policy(monkeypatch, caplog):
+    observed = []
+
+    def failing_observer(exc):
+        raise RuntimeError("observer bug")
+
+    monkeypatch.setattr(retry_policies, "RETRY_OBSERVERS", [failing_observer, observed.append])
+    retry_factory = CustomRetryFactory()
+    retry_state = helper_failed_attempt(521)
+    with caplog.at_level(logging.ERROR, logger="wallet_analyzer.retry_policies"):
+        assert retry_factory.stop(retry_state) is False
+
+    assert observed == [retry_state.outcome.exception()]
+    assert "observer bug" in caplog.text
+    assert retry_factory.stats["retry_policy/observer_errors"] == 1
+    assert retry_factory.stats["retry_policy/gmgn.ai/retries/521"] == 1
+
+def test_retry_policy_fails_fast_while_the_breaker_is_open(monkeypatch):
+    monkeypatch.setattr(retry_policies, "RETRY_OBSERVERS", [])
+    retry_factory = CustomRetryFactory()
+    stops = [retry_factory.stop(helper_failed_attempt(521)) for _ in range(retry_factory.breaker_failure_threshold)]
+    assert stops == [False] * (retry_factory.breaker_failure_threshold - 1) + [True]
+    assert retry_factory.stats["retry_policy/gmgn.ai/breaker/open"] == 1
+    assert retry_factory.stats["retry_policy/gmgn.ai/breaker/fail_fast"] == 1
+
+    # The other sites are not affected
+    assert retry_factory.stop(helper_failed_attempt(521, url="https://dexcheck.ai/app/wallet-analyzer/w1")) is False
@@ -0,0 +1,134 @@
+# Import packages
+import sqlite3
+import time
+
+from wallet_analyzer.seen_wallets import BloomFilter, SeenWalletIndex
+
+## Helpers
+def helper_open_index(tmp_path, source: str = "gmgn_ai_wallet_screener", freshness_secs: int = 3600, **kwargs) -> SeenWalletIndex:
+    return SeenWalletIndex(str(tmp_path / "seen_wallets.sqlite3"), source, freshness_secs, bloom_capacity=1000, **kwargs)
+
+def helper_screened_at(tmp_path, source: str = "gmgn_ai_wallet_screener") -> dict:
+    """
+    A function to read the screening times of a source straight from the database.
+    """
+    connection = sqlite3.connect(str(tmp_path / "seen_wallets.sqlite3"))
+    try:
+        return dict(connection.execute("SELECT wallet_address, last_screened_at FROM seen_wallets WHERE source = ?", (source,)))
+    finally:
+        connection.close()
+
+## Bloom filter
+def test_bloom_filter_has_no_false_negatives(tmp_path):
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f"wallet{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    assert sum(f"other{i}" in bloom for i in range(10000)) < 300
+
+    bloom.save(str(tmp_path / "bloom"), watermark=12.5)
+    loaded = BloomFilter(capacity=1000, error_rate=0.01)
+    assert loaded.load(str(tmp_path / "bloom")) == 12.5
+    assert loaded.bits == bloom.bits
+    assert BloomFilter(capacity=2000, error_rate=0.01).load(str(tmp_path / "bloom")) is None
+
+## Freshness window
+def test_freshness_window(tmp_path):
+    index = helper_open_index(tmp_path)
+    index.mark_screened("w1", screened_at=1000.0)
+    index.mark_screened("w2", screened_at=3000.0)
+    assert index.is_fresh("w1", now=1001.0) # Known at once, before being written
+    index.close()
+
+    index = helper_open_index(tmp_path)
+    assert index.is_fresh("w1", now=4599.0)
+    assert not index.is_fresh("w2", now=6600.0) # Checked once per run: w2 was 3600 seconds old
+    assert not index.is_fresh("w3", now=1001.0)
+    assert index.num_skipped == 1
+    assert index.is_fresh("w2", now=10.0 ** 9) is False
+    index.close()
+
+    index = helper_open_index(tmp_path)
+    assert not index.is_fresh("w1", now=4600.0)
+    assert index.is_fresh("w2", now=4600.0)
+    index.close()
+
+    index = helper_open_index(tmp_path, freshness_secs=0)
+    assert not index.is_fresh("w2", now=3000.0)
+    index.close()
+
+def test_sources_are_separate(tmp_path):
+    index = helper_open_index(tmp_path)
+    index.mark_screened("w1", screened_at=1000.0)
+    index.close()
+
+    index = helper_open_index(tmp_path, source="dex_check_wallet_screener")
+    assert index.last_screened_at("w1") is None
+    index.close()
+
+## Batched writes
+def test_screening_times_are_written_in_batches(tmp_path):
+    index = helper_open_index(tmp_path, batch_size=100, flush_secs=60)
+    for i in range(250):
+        index.mark_screened(f"wallet{i}", screened_at=1000.0 + i)
+    index.close()
+
+    assert helper_screened_at(tmp_path) == {f"wallet{i}": 1000.0 + i for i in range(250)}
+    assert index.writer.num_written == 250
+    assert index.writer.num_batches == 3
+
+def test_screening_times_are_flushed_after_flush_secs(tmp_path):
+    index = helper_open_index(tmp_path, batch_size=100, flush_secs=0.05)
+    index.mark_screened("w1", screened_at=1000.0)
+    deadline = time.monotonic() + 5
+    while not helper_screened_at(tmp_path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert helper_screened_at(tmp_path) == {"w1": 1000.0}
+    assert index.writer.is_alive()
+    index.close()
+
+## Bloom filter watermark
+def test_bloom_filter_is_reused_when_up_to_date(tmp_path):
+    index = helper_open_index(tmp_path)
+    index.mark_screened("w1", screened_at=1000.0)
+    index.close()
+
+    # A wallet added behind the index's back with the same watermark is not seen: the saved Bloom filter was reused
+    connection = sqlite3.connect(str(tmp_path / "seen_wallets.sqlite3"))
+    with connection:
+        connection.execute("INSERT INTO seen_wallets VALUES ('gmgn_ai_wallet_screener', 'w0', 500.0)")
+    connection.close()
+    index = helper_open_index(tmp_path)
+    assert index.last_screened_at("w1") == 1000.0
+    assert index.last_screened_at("w0") is None
+    index.close()
+
+def test_bloom_filter_is_rebuilt_after_a_later_screening(tmp_path):
+    index = helper_open_index(tmp_path)
+    index.mark_screened("w1", screened_at=1000.0)
+    index.close()
+
+    # Screened by a run that crashed before saving its Bloom filter
+    connection = sqlite3.connect(str(tmp_path / "seen_wallets.sqlite3"))
+    with connection:
+        connection.execute("INSERT INTO seen_wallets VALUES ('gmgn_ai_wallet_screener', 'w2', 2000.0)")
+    connection.close()
+    index = helper_open_index(tmp_path)
+    assert index.last_screened_at("w1") == 1000.0
+    assert index.last_screened_at("w2") == 2000.0
+    index.close()
+
+def test_bloom_filter_is_rebuilt_when_missing_or_resized(tmp_path):
+    index = helper_open_index(tmp_path)
+    index.mark_screened("w1", screened_at=1000.0)
+    index.close()
+
+    index = SeenWalletIndex(str(tmp_path / "seen_wallets.sqlite3"), "gmgn_ai_wallet_screener", 3600, bloom_capacity=5000)
+    assert index.last_screened_at("w1") == 1000.0
+    index.close()
+
+    (tmp_path / "seen_wallets.sqlite3.gmgn_ai_wallet_screener.bloom").unlink()
+    index = helper_open_index(tmp_path)
+    assert index.last_screened_at("w1") == 1000.0
+    index.close()
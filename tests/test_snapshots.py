@@ -0,0 +1,124 @@
+# Import packages
+import random
+
+import pytest
+
+from wallet_analyzer.items import DexScreenerTopGainers
+from wallet_analyzer.snapshots import GainerSnapshotStore, helper_snapshot_schema
+
+SCHEMA = helper_snapshot_schema()
+
+## Helpers
+def helper_random_value(rng: random.Random, type_code: str):
+    """
+    A function to draw a random value of a snapshot field, None included.
+    """
+    if rng.random() < 0.2:
+        return None
+    if type_code == "q":
+        return rng.randint(-10**12, 10**12)
+    if type_code == "d":
+        return rng.uniform(-1e6, 1e6)
+    return "".join(rng.choice("abcXYZ 0.9$€−") for _ in range(rng.randint(0, 12)))
+
+def helper_random_snapshots(seed: int, num_snapshots: int, num_pairs: int = 30) -> list:
+    """
+    A function to draw a series of (timestamp, {pair URL: values}) leaderboards, in which pairs leave and come back, and whose fields
+    change, become None and come back from None.
+    """
+    rng = random.Random(seed)
+    current = {f"https://dexscreener.com/solana/pair{i}": {field_name: helper_random_value(rng, type_code) for field_name, type_code in SCHEMA}
+               for i in range(num_pairs)}
+    snapshots, timestamp = [], 1_700_000_000.0
+    for _ in range(num_snapshots):
+        timestamp += rng.choice([0.001, 1.0, 300.0, 3600.5])
+        for values in current.values():
+            for field_name, type_code in SCHEMA:
+                if rng.random() < 0.3:
+                    values[field_name] = helper_random_value(rng, type_code)
+        present = rng.sample(sorted(current), rng.randint(0, num_pairs))
+        snapshots.append((timestamp, {pair_url: dict(current[pair_url]) for pair_url in present}))
+    return snapshots
+
+def helper_items(rows: dict) -> list:
+    return [DexScreenerTopGainers(asset_url=pair_url, **values) for pair_url, values in rows.items()]
+
+def helper_expected_rows(timestamp: float, rows: dict) -> dict:
+    return {pair_url: {"snapshot_at": timestamp, "asset_url": pair_url, **values} for pair_url, values in rows.items()}
+
+## Round trip
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("keyframe_interval", [1, 2, 7])
+def test_random_snapshots_round_trip(tmp_path, seed, keyframe_interval):
+    snapshots = helper_random_snapshots(seed, 40)
+    store = GainerSnapshotStore(str(tmp_path), keyframe_interval=keyframe_interval)
+    for timestamp, rows in snapshots:
+        store.append(timestamp, helper_items(rows))
+
+    # Reopening the store reads the same snapshots
+    for reader in (store, GainerSnapshotStore(str(tmp_path), keyframe_interval=keyframe_interval)):
+        assert reader.timestamps() == [timestamp for timestamp, _ in snapshots]
+        assert [entry[3] for entry in reader.index] == [int(i % keyframe_interval == 0) for i in range(len(snapshots))]
+        for timestamp, rows in snapshots:
+            leaderboard = reader.leaderboard_at(timestamp)
+            assert {row["asset_url"]: row for row in leaderboard} == helper_expected_rows(timestamp, rows)
+            ranks = [row["asset_gain_rank"] for row in leaderboard]
+            assert ranks == sorted(ranks, key=lambda rank: (rank is None, rank))
+
+        for pair_url in {pair_url for _, rows in snapshots for pair_url in rows}:
+            expected = [helper_expected_rows(timestamp, rows)[pair_url] for timestamp, rows in snapshots if pair_url in rows]
+            assert reader.pair_series(pair_url) == expected
+            start, end = snapshots[len(snapshots) // 4][0], snapshots[3 * len(snapshots) // 4][0]
+            assert reader.pair_series(pair_url, start, end) == [row for row in expected if start <= row["snapshot_at"] <= end]
+
+def test_leaderboard_between_snapshots(tmp_path):
+    snapshots = helper_random_snapshots(0, 12)
+    store = GainerSnapshotStore(str(tmp_path), keyframe_interval=4)
+    for timestamp, rows in snapshots:
+        store.append(timestamp, helper_items(rows))
+
+    assert store.leaderboard_at(snapshots[0][0] - 1) == []
+    for (timestamp, rows), (next_timestamp, _) in zip(snapshots, snapshots[1:] + [(float("inf"), None)]):
+        between = min(timestamp + 0.0005, (timestamp + next_timestamp) / 2)
+        assert {row["asset_url"]: row for row in store.leaderboard_at(between)} == helper_expected_rows(timestamp, rows)
+
+## Edge cases
+def test_none_transitions_across_keyframes(tmp_path):
+    pair_url = "https://dexscreener.com/solana/pair"
+    prices = [1.5, None, None, 1.5, 2.0, None, 2.0, 2.0, None]
+    store = GainerSnapshotStore(str(tmp_path), keyframe_interval=3)
+    for i, price in enumerate(prices):
+        store.append(float(i), [DexScreenerTopGainers(asset_url=pair_url, asset_price=price, asset_gain_rank=1)])
+
+    assert [row["asset_price"] for row in store.pair_series(pair_url)] == prices
+    for i, price in enumerate(prices):
+        assert store.leaderboard_at(float(i))[0]["asset_price"] == price
+
+def test_pair_leaves_and_comes_back(tmp_path):
+    pair_url, other_url = "https://dexscreener.com/solana/pair", "https://dexscreener.com/solana/other"
+    store = GainerSnapshotStore(str(tmp_path), keyframe_interval=4)
+    # Present in snapshots 0, 1 and 5 (after the keyframe at 4, which it is absent from), and 7 (within the same keyframe interval)
+    present_in = {0: 10, 1: 11, 5: 11, 7: 11}
+    for i in range(9):
+        items = [DexScreenerTopGainers(asset_url=other_url, asset_gain_rank=2)]
+        if i in present_in:
+            items.append(DexScreenerTopGainers(asset_url=pair_url, asset_gain_rank=1, num_makers=present_in[i], dex="raydium"))
+        store.append(float(i), items)
+
+    series = store.pair_series(pair_url)
+    assert [row["snapshot_at"] for row in series] == [0.0, 1.0, 5.0, 7.0]
+    assert [(row["num_makers"], row["dex"]) for row in series] == [(10, "raydium"), (11, "raydium"), (11, "raydium"), (11, "raydium")]
+    for i in range(9):
+        leaderboard = store.leaderboard_at(float(i))
+        assert [row["asset_url"] for row in leaderboard] == ([pair_url] if i in present_in else []) + [other_url]
+
+def test_non_increasing_timestamp_is_rejected(tmp_path):
+    store = GainerSnapshotStore(str(tmp_path), keyframe_interval=2)
+    store.append(10.0, [DexScreenerTopGainers(asset_url="https://dexscreener.com/solana/pair", asset_gain_rank=1)])
+    for timestamp in (10.0, 9.0):
+        with pytest.raises(ValueError):
+            store.append(timestamp, [DexScreenerTopGainers(asset_url="https://dexscreener.com/solana/pair", asset_gain_rank=2)])
+
+    # The rejected snapshots left nothing behind
+    store.append(11.0, [DexScreenerTopGainers(asset_url="https://dexscreener.com/solana/pair", asset_gain_rank=3)])
+    assert [row["asset_gain_rank"] for row in GainerSnapshotStore(str(tmp_path)).pair_series("https://dexscreener.com/solana/pair")] == [1, 3]
@@ -0,0 +1,218 @@
+# Offline benchmark of the spider callbacks, without spending any Zyte API credits
+#
+# Usage, from the directory that contains scrapy.cfg:
+#     python -m wallet_analyzer.benchmarks.parse_benchmark                  # Compare against the saved baseline
+#     python -m wallet_analyzer.benchmarks.parse_benchmark --save-baseline  # Save the results as the new baseline
+#
+# Each saved browserHtml fixture (including the degraded, not fully loaded pages) is wrapped in a fake Zyte API
+# response carrying raw_api_response and fed to the spider callback. The benchmark reports the pages/sec, items/sec,
+# per-field extraction time and peak memory of each case, and exits with a non-zero status if a case is slower (or
+# uses more memory) than the baseline by more than the tolerance. The baseline depends on the machine, so save it on
+# the machine that runs the comparison.
+
+# Import libraries
+import argparse
+import gc
+import json
+import logging
+import math
+import os
+import sys
+import time
+import tracemalloc
+from typing import NamedTuple
+
+import scrapy
+from scrapy.settings import Settings
+from scrapy_zyte_api.responses import ZyteAPITextResponse
+
+from wallet_analyzer.spiders.dex_screener_top_gainers import DexScreenerTopGainersSpider
+from wallet_analyzer.spiders.dex_screener_top_traders import DexScreenerTopTradersSpider
+from wallet_analyzer.spiders.dex_check_wallet_screener import DexCheckWalletScreenerSpider
+from wallet_analyzer.spiders.gmgn_ai_wallet_screener import GmgnAiWalletScreenerSpider
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCHMARK_DIR, "fixtures")
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "parse_benchmark_baseline.json")
+WALLET_ADDRESS = "5Q544fKrFoe6tsEbD7S8EmxGTJYAKtTVhAW5Q5pge4j1"
+WALLET_META = {"wallet_address": WALLET_ADDRESS, "wallet_count": 1, "tot_num_wallets": 1}
+MIN_FIELD_TIME_US = 50
+MIN_ROUND_SECS = 0.2
+TOP_TRADERS_META = {"asset_name": "TOK0", "asset_url": "https://dexscreener.com/solana/pair0"}
+
+## Benchmark cases
+class BenchmarkCase(NamedTuple):
+    name: str
+    spider_cls: type
+    callback: str
+    plan: str
+    fixture: str
+    url: str
+    meta: dict
+
+BENCHMARK_CASES = [
+    BenchmarkCase("top_gainers", DexScreenerTopGainersSpider, "parse_top_gainers", "top_gainers_plan", "dex_screener_top_gainers.html", DexScreenerTopGainersSpider.base_url, {}),
+    BenchmarkCase("top_gainers_not_loaded", DexScreenerTopGainersSpider, "parse_top_gainers", "top_gainers_plan", "dex_screener_top_gainers_not_loaded.html", DexScreenerTopGainersSpider.base_url, {}),
+    BenchmarkCase("top_traders", DexScreenerTopTradersSpider, "parse_top_traders", "top_traders_plan", "dex_screener_top_traders.html", TOP_TRADERS_META["asset_url"], TOP_TRADERS_META),
+    BenchmarkCase("top_traders_not_loaded", DexScreenerTopTradersSpider, "parse_top_traders", "top_traders_plan", "dex_screener_top_traders_not_loaded.html", TOP_TRADERS_META["asset_url"], TOP_TRADERS_META),
+    BenchmarkCase("dex_check_wallet", DexCheckWalletScreenerSpider, "parse_wallet_data", "wallet_data_plan", "dex_check_wallet_screener.html", DexCheckWalletScreenerSpider.base_url.format(wallet_address=WALLET_ADDRESS), WALLET_META),
+    BenchmarkCase("dex_check_wallet_not_loaded", DexCheckWalletScreenerSpider, "parse_wallet_data", "wallet_data_plan", "dex_check_wallet_screener_not_loaded.html", DexCheckWalletScreenerSpider.base_url.format(wallet_address=WALLET_ADDRESS), WALLET_META),
+    BenchmarkCase("gmgn_ai_wallet", GmgnAiWalletScreenerSpider, "parse_wallet_data", "wallet_data_plan", "gmgn_ai_wallet_screener.html", GmgnAiWalletScreenerSpider.base_url.format(wallet_address=WALLET_ADDRESS), WALLET_META),
+    BenchmarkCase("gmgn_ai_wallet_not_loaded", GmgnAiWalletScreenerSpider, "parse_wallet_data", "wallet_data_plan", "gmgn_ai_wallet_screener_not_loaded.html", GmgnAiWalletScreenerSpider.base_url.format(wallet_address=WALLET_ADDRESS), WALLET_META),
+]
+
+## Helper functions
+def helper_build_fake_response(case: BenchmarkCase, browser_html: str) -> ZyteAPITextResponse:
+    """
+    A function to wrap a browserHtml fixture in a Zyte API response, as returned by scrapy-zyte-api for the case's request.
+    """
+    api_response = {
+        "url": case.url,
+        "statusCode": 200,
+        "browserHtml": browser_html,
+        "actions": [{"action": "waitForSelector", "elapsedTime": 0.0, "status": "success"}],
+    }
+    return ZyteAPITextResponse.from_api_response(api_response, request=scrapy.Request(case.url, meta=dict(case.meta)))
+
+def helper_run_callback(spider, case: BenchmarkCase, response):
+    """
+    A function to run a callback on a response and count the items and the requests (e.g. retries) it yields.
+    """
+    num_items, num_requests = 0, 0
+    for output in getattr(spider, case.callback)(response):
+        if isinstance(output, scrapy.Request):
+            num_requests += 1
+        else:
+            num_items += 1
+    return num_items, num_requests
+
+def helper_benchmark_case(case: BenchmarkCase, iterations: int, rounds: int, keep_raw_fields: bool = False) -> dict:
+    """
+    A function to benchmark a callback on a fixture: throughput and per-field extraction time over at least the given number of pages (best of the rounds), and peak memory of one page.
+    """
+    with open(os.path.join(FIXTURES_DIR, case.fixture), encoding="utf-8") as f:
+        browser_html = f.read()
+    spider = case.spider_cls()
+    spider.settings = Settings(dict(case.spider_cls.custom_settings, KEEP_RAW_FIELDS=keep_raw_fields))
+
+    # Warm up the normalizer caches, as in a real crawl, and parse enough pages per round for the fast cases to last MIN_ROUND_SECS
+    start = time.perf_counter()
+    num_items, num_requests = helper_run_callback(spider, case, helper_build_fake_response(case, browser_html))
+    iterations = max(iterations, math.ceil(MIN_ROUND_SECS / (time.perf_counter() - start)))
+
+    # Measure the throughput, best of the rounds. The responses are built beforehand, but each one parses its HTML in the timed loop
+    elapsed = float("inf")
+    for _ in range(rounds):
+        responses = [helper_build_fake_response(case, browser_html) for _ in range(iterations)]
+        gc.collect()
+        start = time.perf_counter()
+        for response in responses:
+            helper_run_callback(spider, case, response)
+        elapsed = min(elapsed, time.perf_counter() - start)
+
+    # Measure the time spent on each field on an already parsed page, best of the rounds
+    response = helper_build_fake_response(case, browser_html)
+    response.selector
+    field_timings = {}
+    for _ in range(rounds):
+        round_timings = {}
+        for _ in range(iterations):
+            getattr(spider, case.plan).time_fields(response, round_timings)
+        for field, seconds in round_timings.items():
+            field_timings[field] = min(field_timings.get(field, seconds), seconds)
+
+    # Measure the peak memory of one page, from the raw HTML to the yielded items
+    gc.collect()
+    tracemalloc.start()
+    helper_run_callback(spider, case, helper_build_fake_response(case, browser_html))
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "items_per_page": num_items,
+        "requests_per_page": num_requests,
+        "pages_per_sec": iterations / elapsed,
+        "items_per_sec": iterations * num_items / elapsed,
+        "peak_memory_kib": peak_memory / 1024,
+        "field_time_us_per_page": {field: seconds / iterations * pow(10, 6) for field, seconds in field_timings.items()},
+    }
+
+def helper_compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    A function to list the regressions of the results against the baseline, beyond the relative tolerance.
+    Per-field times under MIN_FIELD_TIME_US per page are too noisy to compare and are ignored.
+    """
+    regressions = []
+    for case_name, result in results.items():
+        base = baseline.get(case_name)
+        if base is None:
+            continue
+        if result["pages_per_sec"] < base["pages_per_sec"] * (1 - tolerance):
+            regressions.append(f"{case_name}: {result['pages_per_sec']:.1f} pages/sec, baseline {base['pages_per_sec']:.1f}")
+        if result["peak_memory_kib"] > base["peak_memory_kib"] * (1 + tolerance):
+            regressions.append(f"{case_name}: {result['peak_memory_kib']:.0f} KiB peak memory, baseline {base['peak_memory_kib']:.0f}")
+        if result["items_per_page"] != base["items_per_page"]:
+            regressions.append(f"{case_name}: {result['items_per_page']} items per page, baseline {base['items_per_page']}")
+        for field, field_time in result["field_time_us_per_page"].items():
+            base_field_time = base["field_time_us_per_page"].get(field)
+            if base_field_time is not None and base_field_time >= MIN_FIELD_TIME_US and field_time > base_field_time * (1 + tolerance):
+                regressions.append(f"{case_name}.{field}: {field_time:.1f} us/page, baseline {base_field_time:.1f}")
+    return regressions
+
+def helper_print_results(results: dict) -> None:
+    """
+    A function to print the benchmark results as a table, followed by the slowest fields of each case.
+    """
+    print(f"{'case':<30}{'pages/sec':>12}{'items/sec':>14}{'items/page':>12}{'requests/page':>15}{'peak KiB':>11}")
+    for case_name, result in results.items():
+        print(f"{case_name:<30}{result['pages_per_sec']:>12.1f}{result['items_per_sec']:>14.1f}{result['items_per_page']:>12}{result['requests_per_page']:>15}{result['peak_memory_kib']:>11.0f}")
+    print()
+    for case_name, result in results.items():
+        slowest_fields = sorted(result["field_time_us_per_page"].items(), key=lambda field_time: field_time[1], reverse=True)[:5]
+        print(f"{case_name}: " + ", ".join(f"{field} {field_time:.1f} us" for field, field_time in slowest_fields))
+
+## Main
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the spider callbacks on saved browserHtml fixtures")
+    parser.add_argument("--iterations", type=int, default=50, help="Minimum number of pages parsed per round")
+    parser.add_argument("--rounds", type=int, default=3, help="Number of timed rounds per case, the best one is kept")
+    parser.add_argument("--cases", nargs="*", help="Only run these cases")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Path of the baseline results")
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the new baseline instead of comparing")
+    parser.add_argument("--keep-raw-fields", action="store_true", help="Emit the raw strings of the normalized fields, as with the KEEP_RAW_FIELDS setting")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Relative slowdown (or memory growth) reported as a regression")
+    args = parser.parse_args(argv)
+
+    # Silence the spiders' per-page logs, which would dominate the timings
+    logging.disable(logging.CRITICAL)
+    results = {}
+    for case in BENCHMARK_CASES:
+        if args.cases and case.name not in args.cases:
+            continue
+        results[case.name] = helper_benchmark_case(case, iterations=args.iterations, rounds=args.rounds, keep_raw_fields=args.keep_raw_fields)
+    logging.disable(logging.NOTSET)
+    helper_print_results(results)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved the baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}, run with --save-baseline first")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = helper_compare_to_baseline(results, baseline, tolerance=args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%} of the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"\nNo regression beyond {args.tolerance:.0%} of the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+# Run the whole spider chain (top gainers -> top traders -> DexCheck and GMGN wallet screeners) in a single process
+#
+# Usage, from the directory that contains scrapy.cfg:
+#     python -m wallet_analyzer.chain
+#
+# Instead of waiting for each stage to finish writing its feed, every scraped top gainer immediately schedules its
+# top traders request, and every newly seen wallet immediately schedules both wallet screeners. Each spider keeps its
+# own feed. The downstream spiders are kept open while their upstream spider is still running.
+#
+# In chained mode the wallet screeners screen every new wallet that bought and sold the asset, since the top K
+# wallets (WALLET_SELECTION_TOP_K) can only be known once all the top traders have been scraped.
+# The chained runner also joins the results of the wallet screeners into one profile per wallet (see
+# wallet_analyzer.pipelines.WalletProfileJoinPipeline), which separate runs of the spiders only do with
+# WALLET_PROFILE_JOIN_ENABLED.
+#
+# Polling mode, to follow the fast-moving gainers:
+#     python -m wallet_analyzer.chain --poll-interval 300
+#
+# With a poll interval (--poll-interval, or the CHAIN_POLL_INTERVAL_SECS setting), the chain runs until it is
+# interrupted, and re-polls the top gainers listing every poll interval, bypassing the HTTP cache. The spiders stay
+# open between the cycles, so the reactor and the Zyte API connections stay warm. Each leaderboard is diffed against
+# the previous one: the top traders are only scraped again for the pairs that entered the leaderboard, or whose stats
+# changed materially (by the relative changes of CHAIN_POLL_CHANGE_THRESHOLDS) since their top traders were last
+# scraped. The wallet screeners are only scheduled for the wallets discovered since the chain started. Each cycle
+# logs a poll_cycle event and adds a snapshot to the top gainers snapshot store. The feeds and the SQLite history
+# hold the results of every cycle: each cycle sends the chain_cycle_started signal to the open spiders, on which the
+# SQLite history starts a new run per spider, so that a cycle does not overwrite the rows of the previous ones.
+
+# Import libraries
+import argparse
+import time
+
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+from scrapy.exceptions import DontCloseSpider
+from scrapy.utils.project import get_project_settings
+from itemadapter import ItemAdapter
+
+from wallet_analyzer.spiders.dex_screener_top_gainers import DexScreenerTopGainersSpider
+from wallet_analyzer.spiders.dex_screener_top_traders import DexScreenerTopTradersSpider
+from wallet_analyzer.spiders.dex_check_wallet_screener import DexCheckWalletScreenerSpider
+from wallet_analyzer.spiders.gmgn_ai_wallet_screener import GmgnAiWalletScreenerSpider
+from wallet_analyzer.signals import chain_cycle_started
+from wallet_analyzer.structured_logging import helper_log_event
+from wallet_analyzer.wallet_selection import helper_is_trader_who_bought_and_sold, helper_trader_score
+
+
+def helper_is_material_change(previous, current, thresholds):
+    """
+    A function to check whether any stat of a pair changed by at least its relative threshold, e.g. {"asset_24_hr_txns": 0.25}.
+    """
+    for field_name, threshold in thresholds.items():
+        previous_value, current_value = previous.get(field_name), current.get(field_name)
+        if previous_value is None or current_value is None:
+            if previous_value != current_value:
+                return True
+        elif abs(current_value - previous_value) >= threshold * abs(previous_value):
+            return True
+    return False
+
+
+class WalletAnalyzerChain:
+    # The upstream spider of each chained spider
+    upstream_spiders = {
+        DexScreenerTopTradersSpider.name: DexScreenerTopGainersSpider.name,
+        DexCheckWalletScreenerSpider.name: DexScreenerTopTradersSpider.name,
+        GmgnAiWalletScreenerSpider.name: DexScreenerTopTradersSpider.name,
+    }
+
+    def __init__(self, settings=None, poll_interval=None):
+        if settings is None:
+            settings = get_project_settings()
+            # All the chained spiders share the same process, hence the same log file
+            settings.set("LOG_FILE", "wallet_analyzer_chain.log", priority="cmdline")
+            # The wallet screeners' results are joined into profiles as they are scraped
+            settings.set("WALLET_PROFILE_JOIN_ENABLED", True, priority="cmdline")
+        self.process = CrawlerProcess(settings)
+        self.crawlers = {}
+        self.open_spiders = {}
+        self.closed_spiders = set()
+        self.pending_requests = {}
+        self.seen_wallets = set()
+
+        for spider_cls in (DexScreenerTopGainersSpider, DexScreenerTopTradersSpider, DexCheckWalletScreenerSpider, GmgnAiWalletScreenerSpider):
+            crawler = self.process.create_crawler(spider_cls)
+            crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+            crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+            crawler.signals.connect(self.spider_idle, signal=signals.spider_idle)
+            crawler.signals.connect(self.item_scraped, signal=signals.item_scraped)
+            self.crawlers[spider_cls.name] = crawler
+            self.pending_requests[spider_cls.name] = []
+
+        # Polling mode, from the settings of the top gainers spider unless the poll interval is given
+        gainers_settings = self.crawlers[DexScreenerTopGainersSpider.name].settings
+        self.poll_interval = poll_interval if poll_interval is not None else gainers_settings.getfloat("CHAIN_POLL_INTERVAL_SECS", 0)
+        self.change_thresholds = gainers_settings.getdict("CHAIN_POLL_CHANGE_THRESHOLDS")
+        self.scoring = gainers_settings.get("WALLET_SELECTION_SCORING", "pct_pnl")
+        self.pct_pnl_weight = gainers_settings.getfloat("WALLET_SELECTION_PCT_PNL_WEIGHT", 0.5)
+        self.traded_pairs = {} # The stats of each pair when its top traders were last scheduled
+        self.previous_pairs = set() # The pairs of the previous leaderboard
+        self.cycle = 1
+        self.cycle_started_at = time.monotonic()
+        self.cycle_pairs = set()
+        self.cycle_counts = {}
+        self.cycle_active = True
+        self.next_poll = None
+
+    def start(self):
+        # Start all the spiders, the downstream ones without any start requests
+        for spider_name, crawler in self.crawlers.items():
+            self.process.crawl(crawler, chained=spider_name in self.upstream_spiders)
+        self.process.start()
+
+    def schedule(self, spider_name, build_request, **kwargs):
+        # Build the request with the downstream spider and inject it into its engine, or buffer it until the spider is open
+        crawler = self.crawlers[spider_name]
+        if spider_name in self.open_spiders:
+            spider = self.open_spiders[spider_name]
+
+            # Skip the wallets that the spider screened recently
+            seen_wallet_index = getattr(spider, "seen_wallet_index", None)
+            if seen_wallet_index is not None and "wallet_address" in kwargs and seen_wallet_index.is_fresh(kwargs["wallet_address"]):
+                return
+            crawler.engine.crawl(build_request(spider, **kwargs))
+        else:
+            self.pending_requests[spider_name].append((build_request, kwargs))
+
+    def item_scraped(self, item, response, spider):
+        adapter = ItemAdapter(item)
+        if spider.name == DexScreenerTopGainersSpider.name:
+            # Schedule the top traders of the pairs that entered the leaderboard, or whose stats changed materially since
+            # their top traders were last scraped
+            asset_url = adapter.get("asset_url")
+            self.cycle_pairs.add(asset_url)
+            previous = self.traded_pairs.get(asset_url)
+            if asset_url not in self.previous_pairs:
+                change = "entered"
+            elif helper_is_material_change(previous, adapter, self.change_thresholds):
+                change = "changed"
+            else:
+                change = "unchanged"
+            self.count(spider, f"pairs_{change}")
+            if change == "unchanged":
+                return
+            self.traded_pairs[asset_url] = {field_name: adapter.get(field_name) for field_name in self.change_thresholds}
+            self.schedule(
+                DexScreenerTopTradersSpider.name,
+                DexScreenerTopTradersSpider.build_top_traders_request,
+                asset_name=adapter.get("asset_name"),
+                asset_url=asset_url,
+                refresh=previous is not None # Scraped in an earlier cycle, so the cached page and the duplicate filter are bypassed
+            )
+        elif spider.name == DexScreenerTopTradersSpider.name:
+            # Schedule both wallet screeners for every newly seen wallet, prioritized by its score as a trader of the asset
+            if not helper_is_trader_who_bought_and_sold(adapter):
+                return
+            wallet_address = adapter["wallet_address"]
+            if wallet_address in self.seen_wallets:
+                return
+            self.seen_wallets.add(wallet_address)
+            gainers_spider = self.open_spiders.get(DexScreenerTopGainersSpider.name)
+            if gainers_spider is not None:
+                self.count(gainers_spider, "new_wallets")
+            trader_score = helper_trader_score(adapter, scoring=self.scoring, pct_pnl_weight=self.pct_pnl_weight)
+            for spider_cls in (DexCheckWalletScreenerSpider, GmgnAiWalletScreenerSpider):
+                self.schedule(
+                    spider_cls.name,
+                    spider_cls.build_wallet_request,
+                    wallet_address=wallet_address,
+                    wallet_count=len(self.seen_wallets),
+                    tot_num_wallets=None, # Unknown until the top traders spider has finished
+                    trader_score=trader_score
+                )
+
+    def spider_opened(self, spider):
+        # Flush the requests that were scheduled before the spider was open
+        self.open_spiders[spider.name] = spider
+        pending_requests, self.pending_requests[spider.name] = self.pending_requests[spider.name], []
+        for build_request, kwargs in pending_requests:
+            self.schedule(spider.name, build_request, **kwargs)
+
+    def spider_idle(self, spider):
+        # In polling mode, the top gainers spider has finished a cycle once it is idle: keep it open until the next poll
+        if self.poll_interval > 0 and spider.name == DexScreenerTopGainersSpider.name:
+            if self.cycle_active:
+                self.finish_cycle(spider)
+            if self.next_poll is None:
+                from twisted.internet import reactor # The reactor installed by the crawler process
+                delay = max(0.0, self.cycle_started_at + self.poll_interval - time.monotonic())
+                self.next_poll = reactor.callLater(delay, self.poll, spider)
+            raise DontCloseSpider
+
+        # Keep a downstream spider open as long as its upstream spider may still schedule requests
+        upstream_spider_name = self.upstream_spiders.get(spider.name)
+        if upstream_spider_name is not None and upstream_spider_name not in self.closed_spiders:
+            raise DontCloseSpider
+
+    def count(self, spider, key):
+        self.cycle_counts[key] = self.cycle_counts.get(key, 0) + 1
+        self.crawlers[spider.name].stats.inc_value(f"chain_poll/{key}", spider=spider)
+
+    def finish_cycle(self, spider):
+        # Log the diff of the cycle's leaderboard against the previous one
+        self.cycle_active = False
+        helper_log_event(
+            spider, "poll_cycle", cycle=self.cycle, secs=round(time.monotonic() - self.cycle_started_at, 3),
+            num_pairs=len(self.cycle_pairs), num_left=len(self.previous_pairs - self.cycle_pairs),
+            **{f"num_{key}": value for key, value in sorted(self.cycle_counts.items())}
+        )
+        self.crawlers[spider.name].stats.set_value("chain_poll/cycles", self.cycle, spider=spider)
+        self.previous_pairs, self.cycle_pairs, self.cycle_counts = self.cycle_pairs, set(), {}
+
+    def poll(self, spider):
+        # Re-poll the top gainers listing, unless the spider was closed in the meantime (e.g. on shutdown)
+        self.next_poll = None
+        if spider.name not in self.open_spiders:
+            return
+        self.cycle += 1
+        self.cycle_started_at = time.monotonic()
+        self.cycle_active = True
+        for spider_name, open_spider in self.open_spiders.items():
+            self.crawlers[spider_name].signals.send_catch_log(chain_cycle_started, spider=open_spider, cycle=self.cycle)
+        self.crawlers[spider.name].engine.crawl(spider.build_top_gainers_request(refresh=True))
+
+    def spider_closed(self, spider, reason):
+        self.open_spiders.pop(spider.name, None)
+        self.closed_spiders.add(spider.name)
+        if spider.name == DexScreenerTopGainersSpider.name and self.next_poll is not None and self.next_poll.active():
+            self.next_poll.cancel()
+
+
+def run_chain(poll_interval=None):
+    WalletAnalyzerChain(poll_interval=poll_interval).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the whole spider chain in a single process")
+    parser.add_argument("--poll-interval", type=float, default=None, help="Re-poll the top gainers every POLL_INTERVAL seconds until interrupted (default: CHAIN_POLL_INTERVAL_SECS, 0 runs the chain once)")
+    args = parser.parse_args()
+    run_chain(poll_interval=args.poll_interval)
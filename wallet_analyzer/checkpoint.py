@@ -0,0 +1,97 @@
+# Import packages
+import os
+from typing import List, Optional, Set, Tuple
+
+from wallet_analyzer.helper_functions import helper_json_dumps, helper_json_loads
+
+## Resumable feeds
+def helper_resumable_feeds(feeds: dict) -> dict:
+    """
+    A function to turn the feeds of a wallet screener into resumable feeds: the JSON Lines feeds are appended to and flushed after every item, and the columnar feeds, which cannot be appended to, are left out.
+    """
+    resumable_feeds = {}
+    for uri, feed_options in feeds.items():
+        if feed_options.get("format") != "jsonlines":
+            continue
+        item_export_kwargs = dict(feed_options.get("item_export_kwargs", {}), flush_every_item=True)
+        resumable_feeds[uri] = dict(feed_options, overwrite=False, item_export_kwargs=item_export_kwargs)
+    return resumable_feeds
+
+def helper_truncate_partial_line(path: str) -> None:
+    """
+    A function to cut off a partially written last line (e.g. if the process was killed while writing it) from a JSON Lines file.
+    """
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+
+        # Look backwards for the end of the last complete line
+        position = size
+        while position > 0:
+            block_size = min(65536, position)
+            f.seek(position - block_size)
+            block = f.read(block_size)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                f.truncate(position - block_size + newline + 1)
+                return
+            position -= block_size
+        f.truncate(0)
+
+## Screening checkpoint
+class ScreeningCheckpoint:
+    """
+    The durable state of a resumable wallet screening run. The run's wallet selection is saved in a manifest next to the
+    feed, and the feed itself (flushed after every item) records the completed wallets, so a wallet counts as completed
+    exactly when its item has been written, whatever the order in which the concurrent requests complete.
+    The manifest is removed once the run has finished, so the next run starts afresh.
+    """
+
+    def __init__(self, feed_path: str):
+        self.feed_path = feed_path
+        self.manifest_path = f"{feed_path}.resume.json"
+        self.selected_wallets: Optional[List[Tuple[str, float]]] = None
+        self.completed_wallets: Set[str] = set()
+
+        if os.path.exists(self.manifest_path):
+            # Resume the interrupted run: reuse its selection and collect the wallets already in the feed
+            with open(self.manifest_path, "rb") as f:
+                self.selected_wallets = [tuple(wallet) for wallet in helper_json_loads(f.read())["selected_wallets"]]
+            if os.path.exists(feed_path):
+                helper_truncate_partial_line(feed_path)
+                with open(feed_path, "rb") as f:
+                    for line in f:
+                        wallet_address = helper_json_loads(line).get("wallet_address") if line.strip() else None
+                        if wallet_address is not None:
+                            self.completed_wallets.add(wallet_address)
+        elif os.path.exists(feed_path):
+            # Start a new run, the feed being appended to from now on
+            open(feed_path, "wb").close()
+
+    @property
+    def is_resumed(self) -> bool:
+        return self.selected_wallets is not None
+
+    def save_selection(self, selected_wallets: List[Tuple[str, float]]) -> None:
+        """
+        Save the wallet selection of a new run, atomically.
+        """
+        self.selected_wallets = selected_wallets
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(helper_json_dumps({"selected_wallets": selected_wallets}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    def finish(self) -> None:
+        """
+        Mark the run as finished.
+        """
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
@@ -0,0 +1,49 @@
+# Import packages
+import math
+from typing import Optional
+
+## AIMD concurrency limit
+class AIMDConcurrencyLimit:
+    """
+    An in-flight request limit for one target site, adapted with AIMD (additive increase, multiplicative decrease).
+    Each successful response raises the limit by about `increase` per window of `limit` responses, up to the ceiling. A throttled or failed
+    attempt, or a latency that rises above latency_tolerance times the latency of the uncongested site, cuts the limit by decrease_factor,
+    at most once per cooldown_secs so that a burst of errors from the same window only counts once.
+    """
+
+    def __init__(self, start: int, ceiling: int, increase: float = 1.0, decrease_factor: float = 0.5, latency_tolerance: float = 2.0, cooldown_secs: float = 10.0, floor: int = 1):
+        self.ceiling = ceiling
+        self.floor = floor
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.cooldown_secs = cooldown_secs
+        self.limit = float(max(floor, min(start, ceiling)))
+        self.latency_ewma = None
+        self.base_latency = None # Lowest smoothed latency, drifting slowly upwards so that a permanently slower site is not mistaken for congestion
+        self.last_decrease_at = -math.inf
+
+    @property
+    def concurrency(self) -> int:
+        return max(self.floor, int(self.limit))
+
+    def on_success(self, latency: Optional[float], now: float) -> None:
+        """
+        Record a successful response and its latency in seconds.
+        """
+        if latency is not None:
+            self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+            self.base_latency = self.latency_ewma if self.base_latency is None else min(self.latency_ewma, self.base_latency * 1.01)
+            if self.latency_ewma > self.latency_tolerance * self.base_latency:
+                self.on_congestion(now)
+                return
+        self.limit = min(float(self.ceiling), self.limit + self.increase / self.limit)
+
+    def on_congestion(self, now: float) -> None:
+        """
+        Record a throttled or failed attempt (or a latency spike).
+        """
+        if now - self.last_decrease_at < self.cooldown_secs:
+            return
+        self.last_decrease_at = now
+        self.limit = max(float(self.floor), self.limit * self.decrease_factor)
@@ -0,0 +1,145 @@
+# Define here the custom feed exporters
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/exporters.html
+
+import time
+from dataclasses import is_dataclass
+from typing import get_type_hints
+
+from itemadapter import ItemAdapter
+from scrapy.exporters import BaseItemExporter, JsonLinesItemExporter
+
+from wallet_analyzer.helper_functions import helper_arrow_type, helper_json_dumps, pa, pq
+
+
+class FastJsonLinesItemExporter(JsonLinesItemExporter):
+    # Writes one JSON document per line as soon as each item is scraped, using orjson when it is installed.
+    # The downstream spiders read these feeds lazily with helper_stream_json_lines. With flush_every_item (set for the
+    # resumable feeds), each line is handed to the OS as soon as it is written, so it survives a crash of the process.
+    #
+    # Like the columnar exporters, it reports the time spent writing each item to the metrics extension (as the
+    # feed_write stage), when it is enabled.
+
+    metrics = None
+
+    def __init__(self, file, flush_every_item=False, **kwargs):
+        super().__init__(file, **kwargs)
+        self.flush_every_item = flush_every_item
+
+    @classmethod
+    def from_crawler(cls, crawler, file, **kwargs):
+        exporter = cls(file, **kwargs)
+        exporter.metrics = getattr(crawler, "metrics", None)
+        exporter.spider_name = crawler.spider.name
+        return exporter
+
+    def export_item(self, item):
+        start = time.perf_counter()
+        itemdict = dict(self._get_serialized_fields(item))
+        self.file.write(helper_json_dumps(itemdict) + b"\n")
+        if self.flush_every_item:
+            self.file.flush()
+        if self.metrics is not None:
+            self.metrics.observe("feed_write", time.perf_counter() - start, spider=self.spider_name, feed_format="jsonlines")
+
+
+class ColumnarItemExporter(BaseItemExporter):
+    # Buffers the items into typed columns and writes them as record batches of batch_size rows, to a Parquet file (one
+    # row group per batch) or to an Arrow IPC file, which can be memory-mapped. The readers (the notebooks, or
+    # stream_top_wallets) can then read only the columns they need, e.g. wallet_address, trader_pnl and trader_bought_usd.
+    #
+    # The schema is stable per item type: it is derived from the type hints of the item dataclass (see items.py), so
+    # that a column keeps its type even when a batch only holds missing values. For dict items, the schema is inferred
+    # from the first batch, and the keys that were not in it are dropped. A feed holds a single item type.
+    #
+    # The batch size and compression default to the COLUMNAR_FEED_BATCH_SIZE and COLUMNAR_FEED_COMPRESSION settings, and
+    # can be overridden per feed with the batch_size and compression keys of the feed's item_export_kwargs. Requires
+    # pyarrow. A feed without any item is left empty, as there is no schema to write.
+
+    file_format = None # "parquet" or "arrow"
+    metrics = None
+
+    def __init__(self, file, batch_size=10000, compression="zstd", **kwargs):
+        if pa is None:
+            raise ImportError(f"The {self.file_format} feed exporter requires pyarrow")
+        super().__init__(dont_fail=True, **kwargs)
+        self.file = file
+        self.batch_size = batch_size
+        self.compression = None if compression in (None, "none") else compression
+        self.item_cls = None
+        self.field_names = None
+        self.schema = None
+        self.columns = None
+        self.num_buffered = 0
+        self.writer = None
+
+    @classmethod
+    def from_crawler(cls, crawler, file, **kwargs):
+        kwargs.setdefault("batch_size", crawler.settings.getint("COLUMNAR_FEED_BATCH_SIZE", 10000))
+        kwargs.setdefault("compression", crawler.settings.get("COLUMNAR_FEED_COMPRESSION", "zstd"))
+        exporter = cls(file, **kwargs)
+        exporter.metrics = getattr(crawler, "metrics", None)
+        exporter.spider_name = crawler.spider.name
+        return exporter
+
+    def export_item(self, item):
+        start = time.perf_counter()
+        if self.field_names is None:
+            self.item_cls = type(item)
+            self.field_names = list(self.fields_to_export or ItemAdapter(item).field_names())
+            self.columns = {field_name: [] for field_name in self.field_names}
+        elif type(item) is not self.item_cls:
+            raise ValueError(f"A columnar feed holds a single item type, got {type(item).__name__} after {self.item_cls.__name__}")
+
+        if is_dataclass(item):
+            for field_name, column in self.columns.items():
+                column.append(getattr(item, field_name, None))
+        else:
+            for field_name, column in self.columns.items():
+                column.append(item.get(field_name))
+        self.num_buffered += 1
+        if self.num_buffered >= self.batch_size:
+            self.write_batch()
+        if self.metrics is not None:
+            # The batch writes are included, so the cost of writing the batches is spread over their items
+            self.metrics.observe("feed_write", time.perf_counter() - start, spider=self.spider_name, feed_format=self.file_format)
+
+    def get_schema(self, batch):
+        # The Arrow type of each field from the type hints of the item dataclass, else from the values of the first batch
+        hints = get_type_hints(self.item_cls) if is_dataclass(self.item_cls) else {}
+        schema_fields = []
+        for field_name in self.field_names:
+            arrow_type = helper_arrow_type(hints.get(field_name))
+            if arrow_type is None:
+                arrow_type = batch.schema.field(field_name).type
+                arrow_type = pa.string() if pa.types.is_null(arrow_type) else arrow_type
+            schema_fields.append(pa.field(field_name, arrow_type))
+        return pa.schema(schema_fields)
+
+    def write_batch(self):
+        if self.num_buffered == 0:
+            return
+        if self.schema is None:
+            self.schema = self.get_schema(pa.RecordBatch.from_pydict(self.columns))
+            if self.file_format == "parquet":
+                self.writer = pq.ParquetWriter(self.file, self.schema, compression=self.compression or "none")
+            else:
+                self.writer = pa.ipc.new_file(self.file, self.schema, options=pa.ipc.IpcWriteOptions(compression=self.compression))
+        self.writer.write_batch(pa.RecordBatch.from_pydict(self.columns, schema=self.schema))
+        for column in self.columns.values():
+            column.clear()
+        self.num_buffered = 0
+
+    def finish_exporting(self):
+        self.write_batch()
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ParquetItemExporter(ColumnarItemExporter):
+    file_format = "parquet"
+
+
+class ArrowItemExporter(ColumnarItemExporter):
+    file_format = "arrow"
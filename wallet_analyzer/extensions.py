@@ -0,0 +1,473 @@
+# Define here the custom extensions
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/extensions.html
+
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.reactor import listen_tcp
+from itemadapter import ItemAdapter
+from twisted.internet import task, threads
+from twisted.web import server
+from urllib.parse import urlparse
+
+from wallet_analyzer.checkpoint import ScreeningCheckpoint
+from wallet_analyzer.concurrency import AIMDConcurrencyLimit
+from wallet_analyzer.helper_functions import helper_json_dumps
+from wallet_analyzer.metrics import MetricsRegistry, MetricsResource
+from wallet_analyzer.parse_pool import ParsePool
+from wallet_analyzer.retry_policies import RETRY_OBSERVERS, get_retry_factory, get_site
+from wallet_analyzer.seen_wallets import SeenWalletIndex
+from wallet_analyzer.structured_logging import ActionLogRingBuffer, RequestLogSampler, helper_log_event
+
+
+class SeenWalletIndexExtension:
+    # Opens the persistent seen-wallet index for the wallet screeners and exposes it as spider.seen_wallet_index, so
+    # that the spiders (and the chained runner) can skip the wallets screened within SEEN_WALLET_FRESHNESS_SECS.
+    # A wallet is marked as screened once an item with at least one extracted stat has been scraped for it. The marks
+    # are written to the database in batches (SEEN_WALLET_BATCH_SIZE, SEEN_WALLET_FLUSH_SECS) by a thread of the
+    # index, which is stopped in a thread of the reactor's pool when the spider closes.
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.index = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("SEEN_WALLET_INDEX_ENABLED"):
+            raise NotConfigured
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        return ext
+
+    def spider_opened(self, spider):
+        settings = self.crawler.settings
+        self.index = SeenWalletIndex(
+            path=settings.get("SEEN_WALLET_INDEX_PATH"),
+            source=spider.name,
+            freshness_secs=settings.getint("SEEN_WALLET_FRESHNESS_SECS"),
+            bloom_capacity=settings.getint("SEEN_WALLET_BLOOM_CAPACITY"),
+            bloom_error_rate=settings.getfloat("SEEN_WALLET_BLOOM_ERROR_RATE"),
+            batch_size=settings.getint("SEEN_WALLET_BATCH_SIZE"),
+            flush_secs=settings.getfloat("SEEN_WALLET_FLUSH_SECS")
+        )
+        spider.seen_wallet_index = self.index
+
+    def spider_closed(self, spider):
+        self.crawler.stats.set_value("seen_wallets/skipped", self.index.num_skipped, spider=spider)
+        # Let the writer finish in a thread of the reactor's pool, then save the Bloom filter
+        d = threads.deferToThread(self.index.stop_writer)
+        d.addCallback(lambda _: self.crawler.stats.set_value("seen_wallets/batches", self.index.writer.num_batches, spider=spider))
+        d.addCallback(lambda _: self.index.close())
+        return d
+
+    def item_scraped(self, item, response, spider):
+        adapter = ItemAdapter(item)
+        wallet_address = adapter.get("wallet_address")
+        has_stats = any(value is not None for field_name, value in adapter.items() if field_name != "wallet_address" and not field_name.endswith("_raw"))
+        if wallet_address is not None and has_stats:
+            self.index.mark_screened(wallet_address)
+            self.crawler.stats.inc_value("seen_wallets/marked", spider=spider)
+
+
+class ScreeningCheckpointExtension:
+    # Makes the standalone runs of the wallet screeners resumable when SCREENING_RESUME_ENABLED is set. The spider's
+    # JSON Lines feed is appended to and flushed after every item (see helper_resumable_feeds), and doubles as the
+    # checkpoint of the completed wallets, while the run's wallet selection is saved in a manifest next to it. The
+    # checkpoint is exposed as spider.screening_checkpoint, so that after a crash or a kill, the next run reuses the
+    # selection and only schedules the wallets that are not in the feed yet. The manifest is removed once the run has
+    # finished, and the next run starts a new feed.
+    #
+    # Stats: resume/completed_before_start (wallets already screened when the run was resumed).
+
+    def __init__(self, crawler, checkpoint):
+        self.crawler = crawler
+        self.checkpoint = checkpoint
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("SCREENING_RESUME_ENABLED"):
+            raise NotConfigured
+        feed_paths = [uri.removeprefix("file://") for uri, feed_options in crawler.settings.getdict("FEEDS").items() if feed_options.get("format") == "jsonlines"]
+        if not feed_paths:
+            raise NotConfigured
+
+        # Load the checkpoint before the feed exporter opens the feed
+        ext = cls(crawler, ScreeningCheckpoint(feed_paths[0]))
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        spider.screening_checkpoint = self.checkpoint
+        if self.checkpoint.is_resumed:
+            self.crawler.stats.set_value("resume/completed_before_start", len(self.checkpoint.completed_wallets), spider=spider)
+
+    def spider_closed(self, spider, reason):
+        if reason == "finished":
+            self.checkpoint.finish()
+
+
+class AdaptiveConcurrencyExtension:
+    # Adapts the in-flight request limit (downloader slot concurrency) of each target site, e.g. dexscreener.com,
+    # dexcheck.ai and gmgn.ai, with AIMD: the limit grows while the responses come back at a steady latency, and is cut
+    # on throttling (429), errors (500, 521, ...) or latency spikes. The failed attempts that the Zyte API client retries internally are
+    # reported by the retry policy (RETRY_OBSERVERS), so the crawl backs off before the retries pile up.
+    #
+    # Each site starts at CONCURRENT_REQUESTS_PER_DOMAIN and never exceeds its ceiling in ADAPTIVE_CONCURRENCY_CEILINGS
+    # (or ADAPTIVE_CONCURRENCY_MAX), while CONCURRENT_REQUESTS caps the total. A ceiling above CONCURRENT_REQUESTS could
+    # never be reached, so it is lowered to CONCURRENT_REQUESTS: raise both to crawl a site faster. The current limit of
+    # each site is exposed in the stats as adaptive_concurrency/<site>/limit, together with its number of increases and
+    # decreases and of the throttled and failed attempts.
+
+    THROTTLING_STATUSES = {429}
+    ERROR_STATUSES = {500, 502, 503, 504, 520, 521}
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        settings = crawler.settings
+        self.start = settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN")
+        self.max_concurrency = settings.getint("ADAPTIVE_CONCURRENCY_MAX")
+        self.ceilings = settings.getdict("ADAPTIVE_CONCURRENCY_CEILINGS")
+        self.total_concurrency = settings.getint("CONCURRENT_REQUESTS")
+        self.increase = settings.getfloat("ADAPTIVE_CONCURRENCY_INCREASE")
+        self.decrease_factor = settings.getfloat("ADAPTIVE_CONCURRENCY_DECREASE_FACTOR")
+        self.latency_tolerance = settings.getfloat("ADAPTIVE_CONCURRENCY_LATENCY_TOLERANCE")
+        self.cooldown_secs = settings.getfloat("ADAPTIVE_CONCURRENCY_COOLDOWN_SECS")
+        self.limits = {}
+        self.slot_keys = {} # The downloader slot of each site (e.g. zyte-api@gmgn.ai in Zyte API transparent mode)
+        self.spider = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("ADAPTIVE_CONCURRENCY_ENABLED"):
+            raise NotConfigured
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        return ext
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        RETRY_OBSERVERS.append(self.retry_attempt_failed)
+
+    def spider_closed(self, spider):
+        RETRY_OBSERVERS.remove(self.retry_attempt_failed)
+
+    def get_limit(self, site):
+        if site not in self.limits:
+            self.limits[site] = AIMDConcurrencyLimit(
+                start=self.start,
+                ceiling=min(int(self.ceilings.get(site, self.max_concurrency)), self.total_concurrency),
+                increase=self.increase,
+                decrease_factor=self.decrease_factor,
+                latency_tolerance=self.latency_tolerance,
+                cooldown_secs=self.cooldown_secs
+            )
+            self.crawler.stats.set_value(f"adaptive_concurrency/{site}/limit", self.limits[site].concurrency, spider=self.spider)
+            self.crawler.stats.max_value(f"adaptive_concurrency/{site}/max_limit", self.limits[site].concurrency, spider=self.spider)
+        return self.limits[site]
+
+    def apply(self, site):
+        # Resize the downloader slot of the site, which may have been recreated since the last change
+        slot = self.crawler.engine.downloader.slots.get(self.slot_keys.get(site))
+        if slot is not None:
+            slot.concurrency = self.limits[site].concurrency
+
+    def record_change(self, site, previous_concurrency):
+        concurrency = self.limits[site].concurrency
+        if concurrency == previous_concurrency:
+            return
+        direction = "increases" if concurrency > previous_concurrency else "decreases"
+        stats = self.crawler.stats
+        stats.set_value(f"adaptive_concurrency/{site}/limit", concurrency, spider=self.spider)
+        stats.inc_value(f"adaptive_concurrency/{site}/{direction}", spider=self.spider)
+        stats.max_value(f"adaptive_concurrency/{site}/max_limit", concurrency, spider=self.spider)
+        helper_log_event(self.spider, "concurrency_change", level=logging.DEBUG, site=site, direction=direction[:-1], concurrency=concurrency)
+        self.apply(site)
+
+    def request_reached_downloader(self, request, spider):
+        site = urlparse_cached(request).hostname
+        self.get_limit(site)
+        self.slot_keys[site] = self.crawler.engine.downloader.get_slot_key(request)
+        self.apply(site)
+
+    def response_received(self, response, request, spider):
+        site = urlparse_cached(request).hostname
+        limit = self.get_limit(site)
+        previous_concurrency = limit.concurrency
+        if response.status in self.THROTTLING_STATUSES or response.status in self.ERROR_STATUSES:
+            kind = "throttled" if response.status in self.THROTTLING_STATUSES else "errors"
+            self.crawler.stats.inc_value(f"adaptive_concurrency/{site}/{kind}", spider=spider)
+            limit.on_congestion(time.monotonic())
+        else:
+            limit.on_success(request.meta.get("download_latency"), time.monotonic())
+        self.record_change(site, previous_concurrency)
+
+    def retry_attempt_failed(self, exc):
+        # Only react to the sites crawled by this spider, since the retry policy is shared by all the crawlers of the process
+        query = getattr(exc, "query", None) or {}
+        site = urlparse(query.get("url", "")).hostname
+        if site not in self.limits:
+            return
+        kind = "throttled" if getattr(exc, "status", None) in self.THROTTLING_STATUSES else "errors"
+        self.crawler.stats.inc_value(f"adaptive_concurrency/{site}/{kind}", spider=self.spider)
+        previous_concurrency = self.limits[site].concurrency
+        self.limits[site].on_congestion(time.monotonic())
+        self.record_change(site, previous_concurrency)
+
+
+class StructuredLoggingExtension:
+    # The production log mode (LOG_MODE = "production"), which keeps the logs of the big runs small and cheap to write:
+    #   - the per-request events (e.g. wallet_request and wallet_parsed) are only logged for a deterministic sample of
+    #     LOG_SAMPLE_RATE of the requests, exposed as spider.log_sampler (see helper_log_event)
+    #   - the Zyte API action logs of the last LOG_ACTION_BUFFER_SIZE pages are kept in spider.action_log_buffer, and
+    #     only written by the page readiness middleware for the pages that are not fully loaded or whose request failed
+    #   - a summary event is logged every LOG_SUMMARY_INTERVAL seconds, and once more when the spider closes
+    # The debug log mode (the default) logs every event, including the action logs of every page at DEBUG level.
+    #
+    # Stats: action_log/flushed (action logs written from the buffer).
+
+    def __init__(self, crawler, interval):
+        self.crawler = crawler
+        self.interval = interval
+        self.sampler = RequestLogSampler(crawler.settings.getfloat("LOG_SAMPLE_RATE", 0.01))
+        self.action_log_buffer = ActionLogRingBuffer(crawler.settings.getint("LOG_ACTION_BUFFER_SIZE", 1000))
+        self.task = None
+        self.items_prev = 0
+        self.pages_prev = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if crawler.settings.get("LOG_MODE", "debug") != "production":
+            raise NotConfigured
+        ext = cls(crawler, crawler.settings.getfloat("LOG_SUMMARY_INTERVAL", 60))
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        spider.log_sampler = self.sampler
+        spider.action_log_buffer = self.action_log_buffer
+        if self.interval:
+            self.task = task.LoopingCall(self.log_summary, spider, "progress")
+            self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        self.crawler.stats.set_value("action_log/flushed", self.action_log_buffer.num_flushed, spider=spider)
+        self.log_summary(spider, "closed", reason=reason)
+
+    def log_summary(self, spider, event, **fields):
+        stats = self.crawler.stats
+        items = stats.get_value("item_scraped_count", 0, spider=spider)
+        pages = stats.get_value("response_received_count", 0, spider=spider)
+        engine = self.crawler.engine
+        helper_log_event(
+            spider,
+            f"summary_{event}",
+            pages=pages,
+            items=items,
+            pages_per_min=round((pages - self.pages_prev) * 60 / self.interval) if self.interval else None,
+            items_per_min=round((items - self.items_prev) * 60 / self.interval) if self.interval else None,
+            in_flight=len(engine.downloader.active) if engine is not None else None,
+            not_ready=stats.get_value("readiness/not_ready", 0, spider=spider),
+            dropped=stats.get_value("readiness/gave_up", 0, spider=spider),
+            errors=stats.get_value("log_count/ERROR", 0, spider=spider),
+            action_logs_flushed=self.action_log_buffer.num_flushed,
+            **fields
+        )
+        self.pages_prev, self.items_prev = pages, items
+
+
+class MetricsExtension:
+    # Opt-in with METRICS_ENABLED. Records where the time of a crawl goes, per spider and per site, as latency
+    # histograms of its stages:
+    #   - queue_wait: from the scheduling of a request to its arrival in the downloader
+    #   - zyte_round_trip: from the arrival in the downloader to the Zyte API response (including the wait for a slot)
+    #   - zyte_actions: the time taken by the browser actions, from the action logs of the Zyte API
+    #   - zyte_render: the rest of the round trip (network, Zyte API queue and rendering)
+    #   - parse: the time spent in the spider callback (timed by WalletAnalyzerSpiderMiddleware)
+    #   - feed_write: the time spent writing an item to a feed (timed by the feed exporters, per feed format)
+    # together with the Zyte API requests by outcome (success, http_<status> or error), the failed attempts retried by
+    # the Zyte API client, the retries and backoff time of the retry policy, the scraped items and items per second,
+    # the in-flight requests and the depth of the scheduler queue.
+    #
+    # The metrics are served in the Prometheus text format on http://METRICS_HOST:<port>/metrics while the crawl is live,
+    # on the first free port of the METRICS_PORT range, and written as a JSON snapshot (with the estimated percentiles
+    # of each stage) to METRICS_SNAPSHOT_PATH when the spider closes, so that runs can be compared. The registry is
+    # exposed as crawler.metrics as soon as the extension is built, before the spider is opened, so that the feed
+    # exporters, the middlewares and the parse pool can find it.
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        settings = crawler.settings
+        self.registry = MetricsRegistry(settings.getlist("METRICS_LATENCY_BUCKETS", [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]))
+        self.port_range = [int(port) for port in settings.getlist("METRICS_PORT", [9410, 9420])]
+        self.host = settings.get("METRICS_HOST", "127.0.0.1")
+        self.snapshot_path = settings.get("METRICS_SNAPSHOT_PATH")
+        self.retry_factory = get_retry_factory(settings.get("ZYTE_API_RETRY_POLICY"))
+        self.retry_stats_at_open = {}
+        self.sites = set()
+        self.spider = None
+        self.port = None
+        self.started_at = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("METRICS_ENABLED"):
+            raise NotConfigured
+        ext = cls(crawler)
+        crawler.metrics = ext.registry
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(ext.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(ext.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(ext.request_left_downloader, signal=signals.request_left_downloader)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        return ext
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        self.started_at = time.monotonic()
+        if self.retry_factory is not None:
+            self.retry_stats_at_open = dict(self.retry_factory.stats)
+        RETRY_OBSERVERS.append(self.retry_attempt_failed)
+        if self.port_range and self.port_range[0]:
+            self.port = listen_tcp(self.port_range, self.host, server.Site(MetricsResource(self.render_metrics)))
+            address = self.port.getHost()
+            spider.logger.info(f"Serving the metrics on http://{address.host}:{address.port}/metrics")
+
+    def spider_closed(self, spider, reason):
+        RETRY_OBSERVERS.remove(self.retry_attempt_failed)
+        if self.port is not None:
+            self.port.stopListening()
+        if self.snapshot_path:
+            self.write_snapshot(spider, reason)
+
+    def request_scheduled(self, request, spider):
+        request.meta["metrics_scheduled_at"] = time.monotonic()
+
+    def request_reached_downloader(self, request, spider):
+        now = time.monotonic()
+        request.meta["metrics_reached_downloader_at"] = now
+        scheduled_at = request.meta.get("metrics_scheduled_at")
+        if scheduled_at is not None:
+            site = urlparse_cached(request).hostname
+            self.sites.add(site)
+            self.registry.observe("queue_wait", now - scheduled_at, spider=spider.name, site=site)
+
+    def response_downloaded(self, response, request, spider):
+        reached_downloader_at = request.meta.get("metrics_reached_downloader_at")
+        if reached_downloader_at is None:
+            return
+        site = urlparse_cached(request).hostname
+        round_trip_secs = time.monotonic() - reached_downloader_at
+        self.registry.observe("zyte_round_trip", round_trip_secs, spider=spider.name, site=site)
+        actions = (getattr(response, "raw_api_response", None) or {}).get("actions")
+        if actions:
+            actions_secs = sum(action.get("elapsedTime", 0) for action in actions)
+            self.registry.observe("zyte_actions", actions_secs, spider=spider.name, site=site)
+            self.registry.observe("zyte_render", max(0.0, round_trip_secs - actions_secs), spider=spider.name, site=site)
+        outcome = "success" if 200 <= response.status < 300 else f"http_{response.status}"
+        self.registry.inc("zyte_requests_total", spider=spider.name, site=site, outcome=outcome)
+        request.meta["metrics_downloaded"] = True
+
+    def request_left_downloader(self, request, spider):
+        # The requests that left the downloader without a response have failed
+        if request.meta.pop("metrics_downloaded", False) or "metrics_reached_downloader_at" not in request.meta:
+            return
+        self.registry.inc("zyte_requests_total", spider=spider.name, site=urlparse_cached(request).hostname, outcome="error")
+
+    def item_scraped(self, item, response, spider):
+        self.registry.inc("items_scraped_total", spider=spider.name)
+
+    def retry_attempt_failed(self, exc):
+        # Only count the sites crawled by this spider, since the retry policy is shared by all the crawlers of the process
+        site = get_site((getattr(exc, "query", None) or {}).get("url"))
+        if site not in self.sites:
+            return
+        reason = getattr(exc, "status", None) or type(exc).__name__
+        self.registry.inc("zyte_attempt_failures_total", spider=self.spider.name, site=site, reason=reason)
+
+    def refresh(self):
+        # Update the gauges, and copy the counters of the retry policy since the spider opened
+        spider_name = self.spider.name
+        engine = self.crawler.engine
+        if engine is not None:
+            self.registry.set_gauge("in_flight_requests", len(engine.downloader.active), spider=spider_name)
+            if engine.slot is not None:
+                self.registry.set_gauge("scheduler_queue_depth", len(engine.slot.scheduler), spider=spider_name)
+        elapsed_secs = time.monotonic() - self.started_at
+        num_items = sum(value for (name, _), value in self.registry.counters.items() if name == "items_scraped_total")
+        self.registry.set_gauge("items_per_second", num_items / elapsed_secs if elapsed_secs else 0, spider=spider_name)
+        if self.retry_factory is not None:
+            for key, value in self.retry_factory.stats.items():
+                _, site, *counter = key.split("/")
+                if site in self.sites and counter in (["retries"], ["backoff_wait_secs"]):
+                    name = "retries_total" if counter == ["retries"] else "backoff_wait_seconds_total"
+                    self.registry.set_counter(name, value - self.retry_stats_at_open.get(key, 0), spider=spider_name, site=site)
+
+    def render_metrics(self):
+        if self.spider is not None:
+            self.refresh()
+        return self.registry.to_prometheus()
+
+    def write_snapshot(self, spider, reason):
+        self.refresh()
+        now = datetime.now(tz=timezone.utc)
+        path = self.snapshot_path % {"name": spider.name, "time": now.replace(microsecond=0).isoformat().replace(":", "-")}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        snapshot = dict(spider=spider.name, finished_at=now.isoformat(), reason=reason, elapsed_secs=time.monotonic() - self.started_at, **self.registry.to_dict())
+        with open(path, "wb") as f:
+            f.write(helper_json_dumps(snapshot))
+        spider.logger.info(f"Wrote the metrics snapshot to {path}")
+
+
+class ParsePoolExtension:
+    # Moves the parsing of the rendered pages off the reactor thread when PARSE_POOL_ENABLED is set. The large DOMs of
+    # the browserHtml pages are otherwise parsed, and scanned by dozens of XPath expressions, on the reactor thread,
+    # which stalls the downloads under high concurrency. The pool (see parse_pool.ParsePool) is exposed as
+    # spider.parse_pool: the callbacks (parse_top_gainers, parse_top_traders and parse_wallet_data) hand it the HTML of
+    # the response and return a Deferred of the items, while PARSE_POOL_WORKERS worker processes (0 for one per core)
+    # build the selectors and run the extraction plans. The worker processes are shared by the crawlers of a process,
+    # e.g. the spiders of the chained runner.
+    #
+    # Stats: parse_pool/pages, parse_pool/worker_secs, parse_pool/errors, parse_pool/queue_depth (pages waiting for or
+    # being parsed by a worker) and parse_pool/max_queue_depth. With the metrics extension, the parse_worker and
+    # parse_pool_wait stages and the parse_pool_queue_depth gauge are also reported, while the parse stage only times
+    # what is left on the reactor thread.
+
+    def __init__(self, crawler, num_workers):
+        self.crawler = crawler
+        self.num_workers = num_workers
+        self.parse_pool = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("PARSE_POOL_ENABLED"):
+            raise NotConfigured
+        ext = cls(crawler, crawler.settings.getint("PARSE_POOL_WORKERS", 0) or None)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        self.parse_pool = ParsePool(spider, num_workers=self.num_workers, stats=self.crawler.stats, metrics=getattr(self.crawler, "metrics", None))
+        spider.parse_pool = self.parse_pool
+        self.crawler.stats.set_value("parse_pool/workers", self.parse_pool.num_workers, spider=spider)
+
+    def spider_closed(self, spider):
+        self.parse_pool.close()
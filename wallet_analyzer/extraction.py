@@ -0,0 +1,165 @@
+# Import packages
+import re
+import time
+from dataclasses import make_dataclass
+from typing import Callable, Iterator, List, NamedTuple, Optional
+from lxml import etree
+
+## Field specifications
+class FieldSpec(NamedTuple):
+    """
+    A field to extract. The XPath is evaluated relative to the named anchor (or to the row/page when anchor is None), or the
+    raw value is taken from another field (source) instead. When a normalizer is set, the field is emitted as name (the
+    normalized value) and, if keep_raw and the raw strings are requested, name_raw (the raw string).
+    """
+    name: str
+    xpath: Optional[str] = None
+    normalizer: Optional[Callable] = None
+    anchor: Optional[str] = None
+    source: Optional[str] = None
+    keep_raw: bool = True
+
+## Extraction engine
+def helper_first_string(result) -> Optional[str]:
+    """
+    A function to return the first string of an XPath result, like parsel's .get() for text and attribute nodes.
+    """
+    if isinstance(result, list):
+        if not result:
+            return None
+        result = result[0]
+    return None if result is None else str(result)
+
+class ExtractionPlan:
+    """
+    A declarative plan that extracts all the fields of a page (or of each row of a page) in one pass.
+    All the XPath expressions are compiled once, when the spider class is defined. The anchors (e.g. the stat cards of a
+    wallet page, or the cells of a table row) are located with a single XPath per row and indexed by the anchor_key_xpath,
+    so each field only has to evaluate a short relative XPath from its anchor.
+    With an item_cls (a slotted dataclass from items.py), the plan builds items, or instances of raw_item_cls, a subclass
+    with the name_raw fields, when the raw strings are requested.
+    """
+
+    def __init__(self, fields: List[FieldSpec], row_xpath: Optional[str] = None, anchor_xpath: Optional[str] = None, anchor_key_xpath: str = "string(text())", item_cls: Optional[type] = None):
+        self.fields = fields
+        self.item_cls = item_cls
+        self.raw_item_cls = None
+        if item_cls is not None:
+            raw_fields = [(f"{field.name}_raw", Optional[str], None) for field in fields if field.normalizer is not None and field.keep_raw]
+            self.raw_item_cls = make_dataclass(f"{item_cls.__name__}WithRaw", raw_fields, bases=(item_cls,), slots=True)
+        self.row_xpath = etree.XPath(row_xpath) if row_xpath is not None else None
+        self.anchor_xpath = etree.XPath(anchor_xpath) if anchor_xpath is not None else None
+        self.anchor_key_xpath = etree.XPath(anchor_key_xpath)
+        # Read attribute keys (e.g. "string(@class)") straight from the element, which is much cheaper than an XPath evaluation
+        anchor_key_attribute = re.fullmatch(r"string\(@([\w-]+)\)", anchor_key_xpath)
+        self.anchor_key_attribute = anchor_key_attribute.group(1) if anchor_key_attribute is not None else None
+        self.compiled_fields = [(field, etree.XPath(field.xpath) if field.xpath is not None else None) for field in fields]
+
+    @staticmethod
+    def _get_root(response_or_node):
+        # Accept a Scrapy response, a parsel Selector, or an lxml element
+        selector = getattr(response_or_node, "selector", response_or_node)
+        return getattr(selector, "root", selector)
+
+    def _find_anchors(self, node) -> dict:
+        anchors = {}
+        if self.anchor_xpath is not None:
+            for anchor in self.anchor_xpath(node):
+                if self.anchor_key_attribute is not None:
+                    anchor_key = anchor.get(self.anchor_key_attribute, "")
+                else:
+                    anchor_key = str(self.anchor_key_xpath(anchor))
+                anchors.setdefault(anchor_key, anchor)
+        return anchors
+
+    def _extract_raw(self, node) -> dict:
+        anchors = self._find_anchors(node)
+        raw_values = {}
+        for field, xpath in self.compiled_fields:
+            if xpath is None:
+                raw_values[field.name] = raw_values.get(field.source)
+                continue
+            context = node if field.anchor is None else anchors.get(field.anchor)
+            raw_values[field.name] = helper_first_string(xpath(context)) if context is not None else None
+        return raw_values
+
+    def extract_raw(self, response_or_node) -> dict:
+        """
+        Extract the raw strings of all the fields of a page (or of a single row), without normalizing them.
+        """
+        return self._extract_raw(self._get_root(response_or_node))
+
+    def normalize(self, raw_values: dict, keep_raw: bool = True) -> dict:
+        """
+        Build the output dictionary from the raw strings, applying the normalizer of each field.
+        """
+        output = {}
+        for field in self.fields:
+            raw_value = raw_values[field.name]
+            if field.normalizer is None:
+                output[field.name] = raw_value
+                continue
+            if keep_raw and field.keep_raw:
+                output[f"{field.name}_raw"] = raw_value
+            output[field.name] = field.normalizer(raw_value)
+        return output
+
+    def extract(self, response_or_node, keep_raw: bool = True) -> dict:
+        """
+        Extract and normalize all the fields of a page (or of a single row).
+        """
+        return self.normalize(self.extract_raw(response_or_node), keep_raw=keep_raw)
+
+    def extract_rows(self, response_or_node, keep_raw: bool = True) -> Iterator[dict]:
+        """
+        Extract and normalize all the fields of each row matched by the row_xpath.
+        """
+        for row in self.row_xpath(self._get_root(response_or_node)):
+            yield self.normalize(self._extract_raw(row), keep_raw=keep_raw)
+
+    def build_item(self, raw_values: dict, keep_raw: bool = False, **extra_fields):
+        """
+        Build an item of the plan's item_cls (raw_item_cls if keep_raw) from the raw strings, with the extra fields (e.g. taken from the request meta).
+        """
+        item_cls = self.raw_item_cls if keep_raw else self.item_cls
+        return item_cls(**extra_fields, **self.normalize(raw_values, keep_raw=keep_raw))
+
+    def extract_item(self, response_or_node, keep_raw: bool = False, **extra_fields):
+        """
+        Extract all the fields of a page into an item.
+        """
+        return self.build_item(self.extract_raw(response_or_node), keep_raw=keep_raw, **extra_fields)
+
+    def extract_row_items(self, response_or_node, keep_raw: bool = False, **extra_fields) -> Iterator:
+        """
+        Extract all the fields of each row matched by the row_xpath into an item.
+        """
+        for row in self.row_xpath(self._get_root(response_or_node)):
+            yield self.build_item(self._extract_raw(row), keep_raw=keep_raw, **extra_fields)
+
+    def time_fields(self, response_or_node, timings: dict) -> None:
+        """
+        Add the time spent selecting the rows, locating the anchors, and extracting and normalizing each field to timings, in seconds.
+        """
+        root = self._get_root(response_or_node)
+        start = time.perf_counter()
+        nodes = self.row_xpath(root) if self.row_xpath is not None else [root]
+        timings["(rows)"] = timings.get("(rows)", 0.0) + time.perf_counter() - start
+
+        for node in nodes:
+            start = time.perf_counter()
+            anchors = self._find_anchors(node)
+            timings["(anchors)"] = timings.get("(anchors)", 0.0) + time.perf_counter() - start
+
+            raw_values = {}
+            for field, xpath in self.compiled_fields:
+                start = time.perf_counter()
+                if xpath is None:
+                    raw_value = raw_values.get(field.source)
+                else:
+                    context = node if field.anchor is None else anchors.get(field.anchor)
+                    raw_value = helper_first_string(xpath(context)) if context is not None else None
+                raw_values[field.name] = raw_value
+                if field.normalizer is not None:
+                    field.normalizer(raw_value)
+                timings[field.name] = timings.get(field.name, 0.0) + time.perf_counter() - start
@@ -1,55 +1,151 @@
 # Import packages
 import re
-from typing import Any
+import json
+import logging
+import weakref
+from functools import lru_cache
+from typing import Any, Iterator, List, Optional, Tuple, get_args
+from urllib.parse import urlparse
+
+# orjson is an optional, faster JSON codec. Fall back to the standard library if it is not installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# pyarrow is an optional dependency of the columnar (Parquet and Arrow IPC) feeds
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa, pq = None, None
+
+logger = logging.getLogger(__name__)
+
+## Number normalization engine
+# Grammar of the numbers rendered by DexScreener, DexCheck, and GMGN, e.g. "-$1,234.5K", "+$12.3K", "<$0.01", "45.2%", "1B%", "$0.0₁₂1467"
+# The subscript digits compress a run of zeros after the decimal point, e.g. "0.0₅123" is 0.00000123
+NUMBER_PATTERN = re.compile(
+    r"\s*(?P<sign>[-+])?\s*<?\s*\$?\s*(?P<sign_after_currency>[-+])?"
+    r"(?P<mantissa>\d[\d,]*(?:\.\d*)?|\.\d+)"
+    r"(?:(?P<num_zeros>[₀₁₂₃₄₅₆₇₈₉]+)(?P<significand>\d+))?"
+    r"\s*(?P<suffix>[KMBT])?\s*%?\s*"
+)
+SUBSCRIPT_DIGITS = str.maketrans("₀₁₂₃₄₅₆₇₈₉", "0123456789")
+SUFFIX_MULTIPLIERS = {None: 1, "K": pow(10, 3), "M": pow(10, 6), "B": pow(10, 9), "T": pow(10, 12)}
+NUMBER_CACHE_SIZE = 65536
+
+@lru_cache(maxsize=NUMBER_CACHE_SIZE)
+def helper_parse_number(value: str) -> Optional[Tuple[float, int]]:
+    """
+    A function to parse a raw number string into its mantissa and suffix multiplier in a single pass. Repeated strings are served from the cache.
+    """
+    match = NUMBER_PATTERN.fullmatch(value)
+    if match is None:
+        # Logged once per distinct string, thanks to the cache, so that the formats the grammar misses (e.g. "1.2k", or "−$3K" with a
+        # Unicode minus sign) can be spotted in the debug logs instead of silently normalizing to None
+        if value.strip():
+            logger.debug(f"Unparseable number string: {value!r}")
+        return None
+
+    mantissa = match.group("mantissa").replace(",", "")
+    if match.group("num_zeros") is not None:
+        mantissa = "0." + "0" * int(match.group("num_zeros").translate(SUBSCRIPT_DIGITS)) + match.group("significand")
+    number = float(mantissa)
+    if "-" in (match.group("sign"), match.group("sign_after_currency")):
+        number = -number
+
+    return number, SUFFIX_MULTIPLIERS[match.group("suffix")]
+
+def helper_normalize_number(value: Optional[str], unit: int = 1) -> Optional[float]:
+    """
+    A function to normalize a raw number string (e.g. "$1.2K", "45%", "<$0.01") to a float expressed in the given unit. Returns None for missing or unparseable values.
+    """
+    if value is None:
+        return None
+    parsed = helper_parse_number(value)
+    if parsed is None:
+        return None
+
+    number, multiplier = parsed
+    if multiplier == unit:
+        return number
+    elif multiplier > unit:
+        return number * (multiplier // unit)
+    else:
+        return number / (unit // multiplier)
+
+## JSON Lines interchange between the spider stages
+def helper_json_dumps(obj: Any) -> bytes:
+    """
+    A function to serialize an object to UTF-8 encoded JSON bytes using the fastest available codec.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+def helper_json_loads(data: bytes) -> Any:
+    """
+    A function to deserialize JSON bytes using the fastest available codec.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def helper_stream_json_lines(path: str) -> Iterator[dict]:
+    """
+    A function to lazily read a JSON Lines feed one record at a time, so memory stays flat regardless of the file size.
+    """
+    with open(path, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield helper_json_loads(line)
+
+## Columnar interchange between the spider stages
+def helper_arrow_type(type_hint: Any):
+    """
+    A function to map the type hint of an item field (e.g. Optional[float]) to an Arrow type. Returns None for the types without a fixed mapping.
+    """
+    arguments = [argument for argument in get_args(type_hint) if argument is not type(None)]
+    if len(arguments) == 1:
+        type_hint = arguments[0]
+    return {str: pa.string(), int: pa.int64(), float: pa.float64(), bool: pa.bool_()}.get(type_hint)
+
+def helper_stream_columnar_batches(path: str, columns: List[str], batch_size: int = 100000) -> Iterator[dict]:
+    """
+    A function to lazily read the given columns of a Parquet (.parquet) or Arrow IPC (.arrow) feed, one batch of up to batch_size rows at a time, as a dictionary of lists.
+    The file is memory-mapped and the other columns are never read.
+    """
+    if path.endswith(".arrow"):
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i).select(columns)
+                for offset in range(0, batch.num_rows, batch_size):
+                    yield batch.slice(offset, batch_size).to_pydict()
+    else:
+        for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=batch_size, columns=columns):
+            yield batch.to_pydict()
 
 ## Helper functions
 def helper_normalize_numbers_in_vol_liq_mcap(value: str) -> float:
     """
     A function to normalize the volume, liquidity, and market capitalization values in millions and thousands.
     """
-    if value.find("T") != -1:
-        value = float(re.sub(pattern="T", repl="", string=value)) * 1000000
-    elif value.find("B") != -1:
-        value = float(re.sub(pattern="B", repl="", string=value)) * 1000
-    elif value.find("M") != -1:
-        value = float(re.sub(pattern="M", repl="", string=value))
-    elif value.find("K") != -1:
-        value = float(re.sub(pattern="K", repl="", string=value)) / 1000
-    else:
-        value = float(value)
-    
-    return value
+    return helper_normalize_number(value, unit=pow(10, 6))
 
 def helper_normalize_numbers_in_pct_gains(value: str) -> float:
     """
     A function to normalize the percentage gains in the last 5 minutes, 1 hour, 6 hours, and 24 hours.
     """
-    if value.find("B") != -1:
-        value = float(re.sub(pattern="%|B|,", repl="", string=value)) * pow(10, 9)
-    elif value.find("M") != -1:
-        value = float(re.sub(pattern="%|M|,", repl="", string=value)) * pow(10, 6)
-    elif value.find("K") != -1:
-        value = float(re.sub(pattern="%|K|,", repl="", string=value)) * pow(10, 3)
-    else:
-        value = float(re.sub(pattern="%|,", repl="", string=value))
-    
-    return value
+    return helper_normalize_number(value)
 
 def helper_normalize_numbers_in_txn_data(value: str) -> float:
     """
-    A function to normalize the percentage gains in the last 5 minutes, 1 hour, 6 hours, and 24 hours.
+    A function to normalize the transaction data (amounts in USD and crypto units, number of TXNs, and PnL).
     """
-    if value is not None:
-        if value.find("B") != -1:
-            value = float(re.sub(pattern=r"\$|B|,|<", repl="", string=value)) * pow(10, 9)
-        elif value.find("M") != -1:
-            value = float(re.sub(pattern=r"\$|M|,|<", repl="", string=value)) * pow(10, 6)
-        elif value.find("K") != -1:
-            value = float(re.sub(pattern=r"\$|K|,|<", repl="", string=value)) * pow(10, 3)
-        else:
-            value = float(re.sub(pattern=r"\$|,|<", repl="", string=value))
-    
-    return value
+    return helper_normalize_number(value)
 
 def helper_treat_none_before_data_type_change(value: str, data_type: Any):
     """
@@ -60,4 +156,69 @@ def helper_treat_none_before_data_type_change(value: str, data_type: Any):
             value = int(value)
         elif data_type == "float":
             value = float(value)
-    return value
\ No newline at end of file
+    return value
+
+def helper_normalize_integer(value: Optional[str]) -> Optional[int]:
+    """
+    A function to normalize a raw count string (e.g. "1,234", "1.2K") to an integer.
+    """
+    return helper_treat_none_before_data_type_change(value=helper_normalize_number(value), data_type="int")
+
+def helper_dex_screener_url(path: Optional[str]) -> Optional[str]:
+    """
+    A function to turn a relative DexScreener link into an absolute URL.
+    """
+    return None if path is None else "https://dexscreener.com" + path
+
+WALLET_ADDRESS_PATTERN = re.compile(r"(?<=account/).*")
+
+def helper_extract_wallet_address(sol_scan_url: Optional[str]) -> Optional[str]:
+    """
+    A function to extract the wallet address from a SOL scan account URL.
+    """
+    if sol_scan_url is None:
+        return None
+    match = WALLET_ADDRESS_PATTERN.search(sol_scan_url)
+    return None if match is None else match.group()
+
+# Path segments that identify an entity (e.g. a wallet or pair address, a numeric ID) rather than a page type
+URL_ID_SEGMENT_PATTERN = re.compile(r"[A-Za-z0-9]{20,}|\d+")
+
+def helper_url_pattern(url: str) -> str:
+    """
+    A function to reduce a URL to the pattern of its page type, e.g. "https://gmgn.ai/sol/address/5Q54..." to "gmgn.ai/sol/address/*".
+    """
+    parsed_url = urlparse(url)
+    segments = ["*" if URL_ID_SEGMENT_PATTERN.fullmatch(segment) else segment for segment in parsed_url.path.split("/")]
+    return parsed_url.netloc + "/".join(segments)
+
+## Page readiness
+# Whether each response is a fully loaded page, kept with the response (and dropped with it) rather than in the request meta,
+# which is copied into the retried requests
+_PAGE_READINESS = weakref.WeakKeyDictionary()
+
+def helper_page_ready(spider, response) -> Optional[bool]:
+    """
+    A function to check that a page is fully loaded with the spider's readiness_xpath, once per response, so that the HTTP cache storage and the
+    page readiness and tiered fetch middlewares share a single evaluation of the XPath. Returns None if the spider has no readiness selector or the response is not a text response.
+    When the spider's pages are parsed by its parse pool, the reactor thread does not build the DOM: it only looks for the spider's readiness_marker
+    in the body, and the worker process evaluates the XPath when it parses the page.
+    """
+    readiness_xpath = getattr(spider, "readiness_xpath", None)
+    if readiness_xpath is None or not hasattr(response, "xpath"):
+        return None
+    ready = _PAGE_READINESS.get(response)
+    if ready is None:
+        readiness_marker = getattr(spider, "readiness_marker", None)
+        if readiness_marker is not None and getattr(spider, "parse_pool", None) is not None:
+            ready = readiness_marker.encode(response.encoding) in response.body
+        else:
+            ready = response.xpath(readiness_xpath).get() is not None
+        _PAGE_READINESS[response] = ready
+    return ready
+
+def helper_set_page_ready(response, ready: bool) -> None:
+    """
+    A function to record that a response is (or is not) a fully loaded page without evaluating the XPath, e.g. for the pages served from the HTTP cache, which only stores fully loaded pages.
+    """
+    _PAGE_READINESS[response] = ready
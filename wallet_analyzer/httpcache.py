@@ -0,0 +1,103 @@
+# Define here the custom HTTP cache storages
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
+
+import gzip
+import hashlib
+import logging
+import os
+import time
+from base64 import b64decode, b64encode
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from scrapy_zyte_api.responses import ZyteAPIResponse, ZyteAPITextResponse
+
+from wallet_analyzer.helper_functions import helper_json_dumps, helper_json_loads, helper_page_ready, helper_set_page_ready
+
+logger = logging.getLogger(__name__)
+
+
+class EntityCacheStorage:
+    # Caches the rendered Zyte API responses on disk, keyed by the logical entity of the request (the wallet address or
+    # the pair URL) rather than by the full Zyte API request fingerprint, so that changes in the actions or in the Zyte
+    # API parameters do not invalidate the cache. Entries are gzip-compressed JSON files and expire after
+    # HTTPCACHE_EXPIRATION_SECS, which each spider sets in its custom settings. Pages that fail the spider's
+    # readiness_xpath check are never stored, and the pages served from the cache are known to be ready, so the readiness
+    # middlewares do not evaluate the XPath again.
+    #
+    # Enabled through the HTTPCACHE_STORAGE setting. Hits and misses are counted by HttpCacheMiddleware
+    # (httpcache/hit and httpcache/miss), evictions of expired entries as httpcache/evict, and pages that were not
+    # stored because they were not fully loaded as httpcache/not_ready.
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings["HTTPCACHE_DIR"])
+        self.expiration_secs = settings.getint("HTTPCACHE_EXPIRATION_SECS")
+        self.compression_level = settings.getint("HTTPCACHE_GZIP_COMPRESSION_LEVEL", 6)
+        self.stats = None
+
+    def open_spider(self, spider):
+        self.stats = spider.crawler.stats
+        logger.debug("Using entity cache storage in %(cachedir)s", {"cachedir": self.cachedir}, extra={"spider": spider})
+
+    def close_spider(self, spider):
+        pass
+
+    def retrieve_response(self, spider, request):
+        path = self._get_request_path(spider, request)
+        if not os.path.exists(path):
+            return None
+
+        # Evict the entry if it is older than the spider's time to live
+        if 0 < self.expiration_secs < time.time() - os.stat(path).st_mtime:
+            os.remove(path)
+            self.stats.inc_value("httpcache/evict", spider=spider)
+            return None
+
+        with gzip.open(path, "rb") as f:
+            entry = helper_json_loads(f.read())
+
+        # Rebuild a Zyte API response, so that the callbacks can still access response.raw_api_response
+        api_response = entry.get("raw_api_response")
+        if api_response is not None:
+            response_cls = ZyteAPITextResponse if api_response.get("browserHtml") or api_response.get("httpResponseBody") else ZyteAPIResponse
+            response = response_cls.from_api_response(api_response, request=request)
+            helper_set_page_ready(response, True)
+            return response
+
+        headers = Headers({key: values for key, values in entry["headers"].items()})
+        body = b64decode(entry["body"])
+        response_cls = responsetypes.from_args(headers=headers, url=entry["url"], body=body)
+        response = response_cls(url=entry["url"], status=entry["status"], headers=headers, body=body, request=request)
+        helper_set_page_ready(response, True)
+        return response
+
+    def store_response(self, spider, request, response):
+        # Do not cache pages that were not fully loaded (the result of the check is shared with the readiness middlewares)
+        if helper_page_ready(spider, response) is False:
+            self.stats.inc_value("httpcache/not_ready", spider=spider)
+            return
+
+        entry = {"url": response.url, "status": response.status}
+        api_response = getattr(response, "raw_api_response", None)
+        if api_response is not None:
+            entry["raw_api_response"] = api_response
+        else:
+            entry["headers"] = {key.decode("latin-1"): [value.decode("latin-1") for value in values] for key, values in response.headers.items()}
+            entry["body"] = b64encode(response.body).decode("ascii")
+
+        # Write to a temporary file first, so that concurrent readers never see a partial entry
+        path = self._get_request_path(spider, request)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wb", compresslevel=self.compression_level) as f:
+            f.write(helper_json_dumps(entry))
+        os.replace(tmp_path, path)
+
+    def _get_request_path(self, spider, request):
+        # Key the entry by the logical entity: the wallet address, then the pair URL, then the request URL
+        entity = request.meta.get("wallet_address") or request.meta.get("asset_url") or request.url
+        key = hashlib.sha1(entity.encode("utf-8")).hexdigest()
+        return os.path.join(self.cachedir, spider.name, key[:2], f"{key}.json.gz")
@@ -5,30 +5,151 @@ from dotenv import load_dotenv
 # Load the environment variables from the .env file
 load_dotenv()
 
+# Log mode: "debug" logs every request and the Zyte API action logs of every page, "production" logs structured,
+# sampled events and periodic summaries (see wallet_analyzer.extensions.StructuredLoggingExtension)
+LOG_MODE = os.getenv("WALLET_ANALYZER_LOG_MODE", "debug")
+
 # Custom scrapy settings
 custom_scrapy_settings = {
     "FEED_EXPORT_ENCODING": "utf-8", # UTF-8 deals with all types of characters
     "FEED_EXPORT_TIMEOUT": 180, # Set the timeout parameter to 120 seconds
+    "FEED_EXPORTERS": {
+        "jsonlines": "wallet_analyzer.exporters.FastJsonLinesItemExporter", # Stream one JSON document per line with orjson (falls back to json)
+        "parquet": "wallet_analyzer.exporters.ParquetItemExporter", # Columnar feeds, written in record batches (requires pyarrow)
+        "arrow": "wallet_analyzer.exporters.ArrowItemExporter",
+    },
+    "COLUMNAR_FEED_BATCH_SIZE": 10000, # Rows per record batch (and per Parquet row group) of the columnar feeds
+    "COLUMNAR_FEED_COMPRESSION": "zstd", # Compression of the columnar feeds: "zstd", "lz4", "none", or for Parquet only "snappy" or "gzip"
+    "KEEP_RAW_FIELDS": False, # Also export the raw strings of the normalized fields as <field>_raw, for debugging the normalizers
+    "PARSE_POOL_ENABLED": False, # Parse the pages in worker processes instead of on the reactor thread (see wallet_analyzer.extensions.ParsePoolExtension)
+    "PARSE_POOL_WORKERS": 0, # Number of worker processes of the parse pool (0 for one per core)
     "RETRY_TIMES": 3, # Retry failed requests up to 3 times
     "AUTOTHROTTLE_ENABLED": False, # Disables the AutoThrottle extension (recommended to be used if you are not using proxy services)
     "RANDOMIZE_DOWNLOAD_DELAY": False, # Should not be used with proxy services. If enabled, Scrapy will wait a random amount of time (between 0.5 * DOWNLOAD_DELAY and 1.5 * DOWNLOAD_DELAY) while fetching requests from the same website
-    "CONCURRENT_REQUESTS": 15, # The maximum number of concurrent (i.e. simultaneous) requests that will be performed by the Scrapy downloader
+    "CONCURRENT_REQUESTS": 15, # The maximum number of concurrent (i.e. simultaneous) requests across all sites, which is also the size of the Zyte API connection pool. Raise it together with ADAPTIVE_CONCURRENCY_CEILINGS, within the account's allowance
+    "CONCURRENT_REQUESTS_PER_DOMAIN": 8, # The starting in-flight limit of each site, then adapted by the adaptive concurrency extension up to its ceiling
     "DOWNLOAD_TIMEOUT": 120, # Setting the timeout parameter to 60 seconds as per the ScraperAPI documentation
     "ROBOTSTXT_OBEY": False, # Don't obey the Robots.txt rules
-    "LOG_LEVEL": "DEBUG", # Set the level of logging to DEBUG
+    "LOG_MODE": LOG_MODE,
+    "LOG_LEVEL": "DEBUG" if LOG_MODE == "debug" else "INFO", # Set the level of logging to DEBUG, or to INFO in production log mode
+    "LOG_SAMPLE_RATE": 0.01, # Share of the requests whose per-request events are logged in production log mode
+    "LOG_ACTION_BUFFER_SIZE": 1000, # Number of pages whose Zyte API action logs are kept in memory in production log mode, to be written if the page fails
+    "LOG_SUMMARY_INTERVAL": 60, # Seconds between the summary events in production log mode
+    # Metrics settings (see wallet_analyzer.extensions.MetricsExtension)
+    "METRICS_ENABLED": False, # Serve and snapshot the per-stage latency metrics (opt-in, e.g. with -s METRICS_ENABLED=True)
+    "METRICS_HOST": "127.0.0.1", # Only serve the metrics locally
+    "METRICS_PORT": [9410, 9420], # Port range of the Prometheus endpoint, the first free port is used (one per concurrent crawler)
+    "METRICS_LATENCY_BUCKETS": [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120], # Upper bounds of the latency histograms, in seconds
+    "METRICS_SNAPSHOT_PATH": "metrics/%(name)s_%(time)s.json", # JSON snapshot written when the spider closes
+    # Cache the rendered pages by wallet address or pair URL. Each spider sets its own HTTPCACHE_EXPIRATION_SECS
+    "HTTPCACHE_ENABLED": True,
+    "HTTPCACHE_STORAGE": "wallet_analyzer.httpcache.EntityCacheStorage",
+    "HTTPCACHE_DIR": "httpcache", # Stored in the .scrapy directory of the project
+    "HTTPCACHE_EXPIRATION_SECS": 3600, # Entries older than one hour are evicted
+    "HTTPCACHE_IGNORE_HTTP_CODES": [429, 500, 502, 503, 504, 521], # Never cache throttled or failed responses
+    # Seen-wallet index settings (enabled by the wallet screeners)
+    "SEEN_WALLET_INDEX_ENABLED": False,
+    "SEEN_WALLET_INDEX_PATH": "seen_wallets.sqlite3", # Shared by all the runs and spiders
+    "SEEN_WALLET_FRESHNESS_SECS": 86400, # Skip the wallets screened by the same spider within the last 24 hours (0 disables skipping)
+    "SEEN_WALLET_BLOOM_CAPACITY": 1000000, # Expected number of screened wallets per spider
+    "SEEN_WALLET_BLOOM_ERROR_RATE": 0.01, # False positive rate of the Bloom filter, which only costs an extra database lookup
+    "SEEN_WALLET_BATCH_SIZE": 500, # Screened wallets per write transaction
+    "SEEN_WALLET_FLUSH_SECS": 2.0, # Longest time a screened wallet waits before being written
+    # Resumable wallet screening (standalone runs of the wallet screeners)
+    "SCREENING_RESUME_ENABLED": False, # Checkpoint the completed wallets in the appended feed, and resume an interrupted run where it stopped
+    # Wallet screening time budget (see wallet_analyzer.middlewares.ScreeningTimeBudgetMiddleware)
+    "SCREENING_TIME_BUDGET_SECS": 0, # Finish the wallet screening within N seconds, skipping the lowest-priority wallets that cannot be screened in time (0 disables the budget)
+    "SCREENING_SKIPPED_WALLETS_PATH": "%(name)s_skipped_wallets.jsonl", # The wallets skipped by the time budget, in rank order, to queue for the next run
+    # Adaptive concurrency settings (AIMD per target site)
+    "ADAPTIVE_CONCURRENCY_ENABLED": True,
+    "ADAPTIVE_CONCURRENCY_MAX": 15, # Ceiling of the in-flight limit of the sites that are not listed in ADAPTIVE_CONCURRENCY_CEILINGS
+    "ADAPTIVE_CONCURRENCY_CEILINGS": {"dexscreener.com": 15, "dexcheck.ai": 15, "gmgn.ai": 15}, # Ceiling of the in-flight limit of each site, at most CONCURRENT_REQUESTS (e.g. raise both with -s for an account with a higher allowance)
+    "ADAPTIVE_CONCURRENCY_INCREASE": 1.0, # Additive increase of the limit per window of successful responses
+    "ADAPTIVE_CONCURRENCY_DECREASE_FACTOR": 0.5, # Multiplicative decrease of the limit on throttling, errors, or latency spikes
+    "ADAPTIVE_CONCURRENCY_LATENCY_TOLERANCE": 2.0, # A smoothed latency above twice the site's uncongested latency counts as congestion
+    "ADAPTIVE_CONCURRENCY_COOLDOWN_SECS": 10, # Decrease the limit of a site at most once every 10 seconds
+    # Page readiness settings (for the spiders that define a readiness_xpath)
+    "READINESS_ENABLED": True,
+    "READINESS_MAX_ATTEMPTS": 4, # Attempts per page, including the first one, before an incomplete page is dropped
+    "READINESS_STRATEGIES": ["longer_timeout", "extra_wait", "fresh_session"], # Render strategy of each retry, each one adding to the previous ones
+    "READINESS_TIMEOUT_MULTIPLIER": 2.0, # Longer waitForSelector timeouts (capped at the Zyte API maximum of 15 seconds)
+    "READINESS_EXTRA_WAIT_SECS": 5, # Duration of the extra waitForTimeout action
+    # Tiered fetch settings (for the spiders or requests whose fetch_mode is "tiered")
+    "TIERED_FETCH_ENABLED": True,
+    "TIERED_FETCH_MEMORY_PATH": "tiered_fetch_memory.json", # The tier that worked last per URL pattern, shared by all the runs and spiders
+    "TIERED_FETCH_REPROBE_SECS": 86400, # Try the plain HTTP tier again for a URL pattern that needed a browser a day ago
+    # Wallet selection settings
+    "WALLET_SELECTION_PATH": "dex_screener_top_traders.jsonl", # The top traders feed to select the wallets from, or its columnar (.parquet or .arrow) version
+    "WALLET_SELECTION_TOP_K": 250, # Number of unique wallets to screen (0 screens all of them)
+    "WALLET_SELECTION_SCORING": "pct_pnl", # Score the traders by "abs_pnl", "pct_pnl", or a "blend" of both
+    "WALLET_SELECTION_PCT_PNL_WEIGHT": 0.5, # Weight of the percentage-based PnL in the "blend" scoring
     # Zyte settings
     "DOWNLOAD_HANDLERS": {
         "http": "scrapy_zyte_api.ScrapyZyteAPIDownloadHandler",
         "https": "scrapy_zyte_api.ScrapyZyteAPIDownloadHandler",
     },
     "DOWNLOADER_MIDDLEWARES": {
+        "wallet_analyzer.middlewares.TieredFetchMiddleware": 590, # Tries the plain HTTP response before browser rendering for the tiered requests
+        "wallet_analyzer.middlewares.PageReadinessMiddleware": 600, # Retries the pages that were not fully loaded with escalating render strategies
+        "wallet_analyzer.middlewares.ScreeningTimeBudgetMiddleware": 940, # Skips the lowest-priority wallets that cannot be screened within SCREENING_TIME_BUDGET_SECS, after the HTTP cache
+        "wallet_analyzer.middlewares.CircuitBreakerMiddleware": 950, # Defers the requests to the sites whose circuit breaker is open
         "scrapy_zyte_api.ScrapyZyteAPIDownloaderMiddleware": 1000,
     },
+    "EXTENSIONS": {
+        "wallet_analyzer.extensions.SeenWalletIndexExtension": 500,
+        "wallet_analyzer.extensions.ScreeningCheckpointExtension": 500,
+        "wallet_analyzer.extensions.AdaptiveConcurrencyExtension": 500,
+        "wallet_analyzer.extensions.StructuredLoggingExtension": 500,
+        "wallet_analyzer.extensions.MetricsExtension": 500,
+        "wallet_analyzer.extensions.ParsePoolExtension": 500,
+    },
+    "SPIDER_MIDDLEWARES": {
+        "wallet_analyzer.middlewares.WalletAnalyzerSpiderMiddleware": 543, # Times the spider callbacks for the metrics extension, and profiles them when CALLBACK_PROFILING_ENABLED is set
+    },
+    "ITEM_PIPELINES": {
+        "wallet_analyzer.pipelines.SQLiteStoragePipeline": 200, # Keeps the history of every run in a SQLite database
+        "wallet_analyzer.pipelines.WalletProfileJoinPipeline": 300, # Joins the wallet screeners' results into one profile per wallet as they are scraped
+        "wallet_analyzer.pipelines.GainerSnapshotPipeline": 400, # Keeps every top gainers leaderboard in a delta-compressed snapshot store
+    },
+    # SQLite history settings (see wallet_analyzer.pipelines.SQLiteStoragePipeline)
+    "STORAGE_ENABLED": False, # Keep the history of every run in STORAGE_DB_PATH (opt-in, e.g. with -s STORAGE_ENABLED=True)
+    "STORAGE_DB_PATH": "wallet_analyzer.sqlite3", # Shared by the spiders and the runs
+    "STORAGE_BATCH_SIZE": 1000, # Rows per write transaction
+    "STORAGE_FLUSH_SECS": 2.0, # Longest time a row waits before being written
+    # Wallet profile join settings (see wallet_analyzer.pipelines.WalletProfileJoinPipeline)
+    "WALLET_PROFILE_JOIN_ENABLED": False, # Enabled by the chained runner, or opt-in for separate runs of the spiders
+    "WALLET_PROFILE_SOURCES": {"dex_check_wallet_screener": "dex_check", "gmgn_ai_wallet_screener": "gmgn"}, # Spider -> prefix of its fields in the profiles. A profile is complete once every source has reported
+    "WALLET_PROFILE_TRADERS_SPIDER": "dex_screener_top_traders", # Spider whose positions are attached to the profiles as trader-level PnL context
+    "WALLET_PROFILE_DB_PATH": "wallet_profiles.sqlite3", # Partial records and complete profiles, shared by the spiders and the runs
+    "WALLET_PROFILE_FEED_PATH": "wallet_profiles.jsonl", # Stream of the complete profiles (the latest line of a wallet is its current profile)
+    "WALLET_PROFILE_MAX_PART_AGE_SECS": 86400, # Only complete a profile from the parts (and attach the positions) updated within the last 24 hours, ignoring those of older runs (0 keeps them all)
+    "WALLET_PROFILE_BATCH_SIZE": 500, # Positions and parts per write transaction
+    "WALLET_PROFILE_FLUSH_SECS": 2.0, # Longest time a position or part waits before being written
+    # Polling settings of the chained runner (see wallet_analyzer.chain)
+    "CHAIN_POLL_INTERVAL_SECS": 0, # Re-poll the top gainers every N seconds until interrupted (0 runs the chain once)
+    "CHAIN_POLL_CHANGE_THRESHOLDS": { # Relative change of a pair's stats, since its top traders were last scraped, that schedules them again
+        "asset_24_hr_txns": 0.25,
+        "asset_24_hr_volume_in_mil": 0.25,
+        "num_makers": 0.25,
+        "asset_liquidity_in_mil": 0.25,
+    },
+    # Top gainers snapshot settings (see wallet_analyzer.pipelines.GainerSnapshotPipeline)
+    "GAINER_SNAPSHOT_ENABLED": False, # Keep every top gainers leaderboard in GAINER_SNAPSHOT_DIR (opt-in, e.g. with -s GAINER_SNAPSHOT_ENABLED=True)
+    "GAINER_SNAPSHOT_DIR": "gainer_snapshots", # Append-only store of the leaderboards, shared by the runs
+    "GAINER_SNAPSHOT_KEYFRAME_INTERVAL": 48, # Snapshots between two full snapshots, i.e. the most snapshots replayed to read a leaderboard
+    # Callback profiling settings (see wallet_analyzer.middlewares.WalletAnalyzerSpiderMiddleware)
+    "CALLBACK_PROFILING_ENABLED": False,
+    "CALLBACK_PROFILING_MODE": "cprofile", # "cprofile" (CPU time per function) or "tracemalloc" (bytes allocated per item and allocation sites) for the sampled responses
+    "CALLBACK_PROFILING_SAMPLE_RATE": 0.05, # Share of the responses whose callback is captured
+    "CALLBACK_PROFILING_TRACEMALLOC_FRAMES": 1, # Frames kept per allocation by tracemalloc, more frames show the callers of the allocation sites but cost more
+    "CALLBACK_PROFILING_SLOWEST": 20, # Number of slowest pages in the report
+    "CALLBACK_PROFILING_DIR": "profiles", # Directory of the reports and cProfile stats
     "REQUEST_FINGERPRINTER_CLASS": "scrapy_zyte_api.ScrapyZyteAPIRequestFingerprinter",
     "TWISTED_REACTOR": "twisted.internet.asyncioreactor.AsyncioSelectorReactor",
     "ZYTE_API_KEY": os.getenv("ZYTE_API_KEY"),
-    "ZYTE_API_LOG_REQUESTS": True,
+    "ZYTE_API_URL": os.getenv("ZYTE_API_URL", "https://api.zyte.com/v1/"), # Point to the local stand-in (wallet_analyzer.zyte_api_stand_in) for offline load tests
+    "ZYTE_API_LOG_REQUESTS": LOG_MODE == "debug", # Log the parameters of every Zyte API request, in debug log mode only
     "ZYTE_API_TRANSPARENT_MODE": True,
     "ZYTE_API_SKIP_HEADERS": ["Cookie", "User-Agent"],
-    "ZYTE_API_RETRY_POLICY": "retry_policies.CUSTOM_RETRY_POLICY"
+    "ZYTE_API_RETRY_POLICY": "wallet_analyzer.retry_policies.CUSTOM_RETRY_POLICY"
 }
\ No newline at end of file
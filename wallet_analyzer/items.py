@@ -2,38 +2,69 @@
 #
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/items.html
+#
+# The items are slotted dataclasses, which take a fraction of the memory of a dict and are exported in field order.
+# They only hold the normalized values. When the KEEP_RAW_FIELDS setting is enabled (for debugging), the spiders emit
+# a subclass built by the extraction plan (see ExtractionPlan.raw_item_cls) that also holds the raw strings as
+# <field>_raw.
+
+from dataclasses import dataclass
+from typing import Optional
+
 
-import scrapy
+@dataclass(slots=True)
+class DexScreenerTopGainers:
+    asset_name: Optional[str] = None
+    asset_name_text: Optional[str] = None
+    asset_url: Optional[str] = None
+    asset_gain_rank: Optional[int] = None
+    asset_network: Optional[str] = None
+    dex: Optional[str] = None
+    asset_price: Optional[float] = None
+    asset_age: Optional[str] = None
+    asset_24_hr_txns: Optional[int] = None
+    asset_24_hr_volume_in_mil: Optional[float] = None
+    num_makers: Optional[int] = None
+    asset_price_change_l5m: Optional[float] = None
+    asset_price_change_l1h: Optional[float] = None
+    asset_price_change_l6h: Optional[float] = None
+    asset_price_change_l24h: Optional[float] = None
+    asset_liquidity_in_mil: Optional[float] = None
+    asset_market_cap_in_mil: Optional[float] = None
 
+@dataclass(slots=True)
+class DexScreenerTopTraders:
+    asset_name: Optional[str] = None
+    asset_url: Optional[str] = None
+    trader_bought_usd: Optional[float] = None
+    trader_bought_crypto: Optional[float] = None
+    trader_buy_txns: Optional[int] = None
+    trader_sold_usd: Optional[float] = None
+    trader_sold_crypto: Optional[float] = None
+    trader_sell_txns: Optional[int] = None
+    trader_pnl: Optional[float] = None
+    sol_scan_url: Optional[str] = None
+    wallet_address: Optional[str] = None
 
-class DexScreenerTopGainers(scrapy.Item):
-    asset_name = scrapy.Field()
-    asset_name_text = scrapy.Field()
-    asset_url = scrapy.Field()
-    asset_gain_rank = scrapy.Field()
-    asset_network = scrapy.Field()
-    dex = scrapy.Field()
-    asset_price = scrapy.Field()
-    asset_age = scrapy.Field()
-    asset_24_hr_txns = scrapy.Field()
-    asset_24_hr_volume_in_mil = scrapy.Field()
-    num_makers = scrapy.Field()
-    asset_price_change_l5m = scrapy.Field()
-    asset_price_change_l1h = scrapy.Field()
-    asset_price_change_l6h = scrapy.Field()
-    asset_price_change_l24h = scrapy.Field()
-    asset_liquidity_in_mil = scrapy.Field()
-    asset_market_cap_in_mil = scrapy.Field()
+@dataclass(slots=True)
+class DexCheckWalletScreener:
+    wallet_address: Optional[str] = None
+    tot_gross_profit: Optional[float] = None
+    realized_gross_profit: Optional[float] = None
+    unrealized_gross_profit: Optional[float] = None
+    tot_roi: Optional[float] = None
+    realized_roi: Optional[float] = None
+    unrealized_roi: Optional[float] = None
+    win_rate: Optional[float] = None
+    num_wins: Optional[int] = None
+    num_losses: Optional[int] = None
+    trading_volume: Optional[float] = None
+    num_trades: Optional[int] = None
+    avg_trade_size: Optional[float] = None
 
-class DexScreenerTopTraders(scrapy.Item):
-    asset_name = scrapy.Field()
-    asset_url = scrapy.Field()
-    trader_bought_usd = scrapy.Field()
-    trader_bought_crypto = scrapy.Field()
-    trader_buy_txns = scrapy.Field()
-    trader_sold_usd = scrapy.Field()
-    trader_sold_crypto = scrapy.Field()
-    trader_sell_txns = scrapy.Field()
-    trader_pnl = scrapy.Field()
-    sol_scan_url = scrapy.Field()
-    wallet_address = scrapy.Field()
\ No newline at end of file
+@dataclass(slots=True)
+class GmgnAiWalletScreener:
+    wallet_address: Optional[str] = None
+    tot_gross_profit: Optional[float] = None
+    tot_roi: Optional[float] = None
+    win_rate: Optional[float] = None
@@ -0,0 +1,142 @@
+# Import packages
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from twisted.web import resource
+
+## Histograms
+class LatencyHistogram:
+    """
+    A histogram of latencies in seconds, with cumulative buckets in the Prometheus way.
+    """
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> List[Tuple[str, int]]:
+        cumulative_counts, total = [], 0
+        for upper_bound, count in zip([*self.buckets, float("inf")], self.counts):
+            total += count
+            cumulative_counts.append(("+Inf" if upper_bound == float("inf") else f"{upper_bound:g}", total))
+        return cumulative_counts
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate a quantile by linear interpolation within its bucket (the upper bound of the last finite bucket if it falls in +Inf).
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        total, lower_bound = 0, 0.0
+        for upper_bound, count in zip(self.buckets, self.counts):
+            if count and total + count >= rank:
+                return lower_bound + (upper_bound - lower_bound) * (rank - total) / count
+            total += count
+            lower_bound = upper_bound
+        return self.buckets[-1] if self.buckets else None
+
+## Registry
+class MetricsRegistry:
+    """
+    The latency histograms, counters and gauges of a crawl, each identified by its name and labels (e.g. spider and site).
+    """
+
+    def __init__(self, buckets: List[float], prefix: str = "wallet_analyzer"):
+        self.buckets = sorted(buckets)
+        self.prefix = prefix
+        self.histograms: Dict[Tuple[str, tuple], LatencyHistogram] = {}
+        self.counters: Dict[Tuple[str, tuple], float] = {}
+        self.gauges: Dict[Tuple[str, tuple], float] = {}
+
+    def observe(self, stage: str, secs: float, **labels) -> None:
+        key = ("stage_latency_seconds", (("stage", stage), *sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram(self.buckets)
+        histogram.observe(secs)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_counter(self, name: str, value: float, **labels) -> None:
+        # For the counters kept elsewhere (e.g. by the retry policy) and copied over
+        self.counters[(name, tuple(sorted(labels.items())))] = value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def to_prometheus(self) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+            for name in sorted({name for name, _ in metrics}):
+                lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+                for (metric_name, labels), value in metrics.items():
+                    if metric_name == name:
+                        lines.append(f"{self.prefix}_{name}{format_labels(labels)} {value:g}")
+        for name in sorted({name for name, _ in self.histograms}):
+            lines.append(f"# TYPE {self.prefix}_{name} histogram")
+            for (metric_name, labels), histogram in self.histograms.items():
+                if metric_name != name:
+                    continue
+                for upper_bound, count in histogram.cumulative_counts():
+                    lines.append(f"{self.prefix}_{name}_bucket{format_labels((*labels, ('le', upper_bound)))} {count}")
+                lines.append(f"{self.prefix}_{name}_sum{format_labels(labels)} {histogram.sum:g}")
+                lines.append(f"{self.prefix}_{name}_count{format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> dict:
+        """
+        A JSON-serializable snapshot of the metrics, with the mean and the estimated p50, p90 and p99 of each histogram.
+        """
+        return {
+            "histograms": [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "mean": histogram.sum / histogram.count if histogram.count else None,
+                    "p50": histogram.quantile(0.5),
+                    "p90": histogram.quantile(0.9),
+                    "p99": histogram.quantile(0.99),
+                    "buckets": dict(histogram.cumulative_counts())
+                }
+                for (name, labels), histogram in self.histograms.items()
+            ],
+            "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self.counters.items()],
+            "gauges": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self.gauges.items()]
+        }
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+## Scrape endpoint
+class MetricsResource(resource.Resource):
+    """
+    Serves the metrics in the Prometheus text format on every path (e.g. /metrics).
+    """
+    isLeaf = True
+
+    def __init__(self, render_metrics):
+        super().__init__()
+        self.render_metrics = render_metrics
+
+    def render_GET(self, request) -> bytes:
+        request.setHeader(b"Content-Type", b"text/plain; version=0.0.4; charset=utf-8")
+        return self.render_metrics().encode("utf-8")
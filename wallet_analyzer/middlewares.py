@@ -3,57 +3,227 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import copy
+import cProfile
+import heapq
+import inspect
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+import uuid
+from collections import Counter, deque
+
+import parsel
 from scrapy import signals
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest, NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet.task import LoopingCall
+
+from wallet_analyzer import extraction, helper_functions, items
+from wallet_analyzer.helper_functions import helper_json_dumps, helper_json_loads, helper_page_ready, helper_url_pattern
+from wallet_analyzer.retry_policies import get_retry_factory
+from wallet_analyzer.structured_logging import RequestLogSampler, helper_log_event
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+_EXHAUSTED = object() # Sentinel of the callback results
+# The code run by the spider callbacks besides the spider modules, whose allocations are reported by the tracemalloc profiling
+CALLBACK_CODE_PATHS = tuple(inspect.getfile(module) for module in (extraction, helper_functions, items)) + (os.path.dirname(parsel.__file__),)
+
 
 class WalletAnalyzerSpiderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the spider middleware does not modify the
-    # passed objects.
+    # Times every spider callback invocation (only while it produces its results, not while they are processed
+    # downstream), for the parse stage of the metrics extension.
+    #
+    # With CALLBACK_PROFILING_ENABLED, it is also an opt-in profiling layer, which can be left on in production:
+    #   - the calls, total and longest time of each callback are kept in the stats
+    #   - the CALLBACK_PROFILING_SLOWEST slowest pages are reported with their URL and wallet address (or asset name)
+    #   - a deterministic sample of CALLBACK_PROFILING_SAMPLE_RATE of the responses is captured, with either cProfile
+    #     (CALLBACK_PROFILING_MODE = "cprofile", the CPU time of each function, e.g. the selectors and the normalizers)
+    #     or tracemalloc ("tracemalloc", the bytes allocated per item, and the allocation sites still alive at the end of
+    #     the callback, per sampled callback). The allocation sites are the growth since a snapshot taken when the
+    #     callback starts, restricted to the code run by the callbacks (the spider's module, the extraction plans, the
+    #     normalizers, the items and parsel), so that the item pipelines, the feed exports and the downloads running in
+    #     between the callback's steps are left out. The other spiders of the process running the same code at the
+    #     same time are still counted
+    # When the spider closes, the report is logged and written to CALLBACK_PROFILING_DIR as JSON, together with the
+    # cProfile stats (.prof, e.g. for snakeviz or pstats).
+    #
+    # Stats: profiling/sampled, profiling/<callback>/calls, profiling/<callback>/secs, profiling/<callback>/max_secs,
+    # and for tracemalloc profiling/<callback>/allocated_bytes and profiling/<callback>/sampled_items.
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        settings = crawler.settings
+        self.profiling = settings.getbool("CALLBACK_PROFILING_ENABLED")
+        self.mode = settings.get("CALLBACK_PROFILING_MODE", "cprofile")
+        self.sampler = RequestLogSampler(settings.getfloat("CALLBACK_PROFILING_SAMPLE_RATE", 0.05))
+        self.num_slowest = settings.getint("CALLBACK_PROFILING_SLOWEST", 20)
+        self.profile_dir = settings.get("CALLBACK_PROFILING_DIR", "profiles")
+        self.tracemalloc_frames = settings.getint("CALLBACK_PROFILING_TRACEMALLOC_FRAMES", 1)
+        if self.mode not in ("cprofile", "tracemalloc"):
+            raise ValueError(f"Unknown CALLBACK_PROFILING_MODE: {self.mode}")
+        self.profiler = cProfile.Profile() if self.profiling and self.mode == "cprofile" else None
+        self.slowest_pages = [] # Min-heap of (secs, sequence number, page)
+        self.num_pages = 0
+        self.num_tracing = 0 # Sampled callbacks in progress, tracemalloc is stopped when the last one ends
+        self.allocation_sites = Counter() # "file:line" -> bytes still allocated at the end of the sampled callbacks
+        self.num_traced = 0
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
-        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
-        return s
+        mw = cls(crawler)
+        if mw.profiling:
+            crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
 
-    def process_spider_input(self, response, spider):
-        # Called for each response that goes through the spider
-        # middleware and into the spider.
+    def process_spider_output(self, response, result, spider):
+        metrics = getattr(self.crawler, "metrics", None)
+        if metrics is None and not self.profiling:
+            for i in result:
+                yield i
+            return
 
-        # Should return None or raise an exception.
-        return None
+        sampled = self.profiling and self.sampler.sample(response.url)
+        baseline = self.start_tracing() if sampled and self.mode == "tracemalloc" else None
+        callback_secs, num_items, allocated_bytes = 0.0, 0, 0
+        results = iter(result)
+        try:
+            while True:
+                traced_bytes = self.begin_capture() if sampled else None
+                start = time.perf_counter()
+                try:
+                    i = next(results, _EXHAUSTED)
+                finally:
+                    callback_secs += time.perf_counter() - start
+                    if sampled:
+                        allocated_bytes += self.end_capture(traced_bytes)
+                if i is _EXHAUSTED:
+                    break
+                num_items += is_item(i)
+                yield i
+        finally:
+            if baseline is not None:
+                self.stop_tracing(baseline, spider)
 
-    def process_spider_output(self, response, result, spider):
-        # Called with the results returned from the Spider, after
-        # it has processed the response.
+        if metrics is not None:
+            metrics.observe("parse", callback_secs, spider=spider.name, site=urlparse_cached(response).hostname)
+        if self.profiling:
+            self.record(response, spider, callback_secs, num_items, sampled, allocated_bytes if sampled and self.mode == "tracemalloc" else None)
 
-        # Must return an iterable of Request, or item objects.
-        for i in result:
-            yield i
+    def begin_capture(self):
+        # Returns the traced memory before the step with tracemalloc
+        if self.profiler is not None:
+            self.profiler.enable()
+            return None
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
 
-    def process_spider_exception(self, response, exception, spider):
-        # Called when a spider or process_spider_input() method
-        # (from other spider middleware) raises an exception.
+    def end_capture(self, traced_bytes):
+        # Returns the bytes allocated (at the peak) during the step with tracemalloc
+        if self.profiler is not None:
+            self.profiler.disable()
+            return 0
+        return tracemalloc.get_traced_memory()[1] - traced_bytes
 
-        # Should return either None or an iterable of Request or item objects.
-        pass
+    def start_tracing(self):
+        # Returns the snapshot of the traced allocations when the callback starts
+        if self.num_tracing == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(self.tracemalloc_frames)
+        self.num_tracing += 1
+        return tracemalloc.take_snapshot()
 
-    def process_start_requests(self, start_requests, spider):
-        # Called with the start requests of the spider, and works
-        # similarly to the process_spider_output() method, except
-        # that it doesn’t have a response associated.
+    def stop_tracing(self, baseline, spider):
+        # Collect the allocation sites of the callback that are still alive at its end (e.g. the items and their values):
+        # the growth since the baseline snapshot, in the code run by the callbacks. The snapshots are only filtered once
+        # grouped by line, as filtering their traces is much slower
+        callback_paths = (inspect.getfile(type(spider)), *CALLBACK_CODE_PATHS)
+        callback_statistics = [
+            statistic for statistic in tracemalloc.take_snapshot().compare_to(baseline, "lineno")
+            if statistic.size_diff > 0 and statistic.traceback[0].filename.startswith(callback_paths)
+        ]
+        for statistic in callback_statistics[:20]:
+            frame = statistic.traceback[0]
+            self.allocation_sites[f"{frame.filename}:{frame.lineno}"] += statistic.size_diff
+        self.num_traced += 1
+        self.num_tracing -= 1
+        if self.num_tracing == 0:
+            tracemalloc.stop()
 
-        # Must return only requests (not items).
-        for r in start_requests:
-            yield r
+    def record(self, response, spider, callback_secs, num_items, sampled, allocated_bytes):
+        stats = self.crawler.stats
+        callback = getattr(response.request, "callback", None) if response.request is not None else None
+        callback_name = getattr(callback, "__name__", "parse")
+        stats.inc_value(f"profiling/{callback_name}/calls", spider=spider)
+        stats.inc_value(f"profiling/{callback_name}/secs", callback_secs, spider=spider)
+        stats.max_value(f"profiling/{callback_name}/max_secs", callback_secs, spider=spider)
+        if sampled:
+            stats.inc_value("profiling/sampled", spider=spider)
+        if allocated_bytes is not None:
+            stats.inc_value(f"profiling/{callback_name}/allocated_bytes", allocated_bytes, spider=spider)
+            stats.inc_value(f"profiling/{callback_name}/sampled_items", num_items, spider=spider)
 
-    def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+        # Keep the slowest pages
+        self.num_pages += 1
+        if len(self.slowest_pages) < self.num_slowest or callback_secs > self.slowest_pages[0][0]:
+            page = {
+                "secs": callback_secs,
+                "callback": callback_name,
+                "url": response.url,
+                "wallet_address": response.meta.get("wallet_address"),
+                "asset_name": response.meta.get("asset_name"),
+                "num_items": num_items,
+                "allocated_bytes_per_item": allocated_bytes / num_items if allocated_bytes is not None and num_items else None
+            }
+            heapq.heappush(self.slowest_pages, (callback_secs, self.num_pages, page))
+            if len(self.slowest_pages) > self.num_slowest:
+                heapq.heappop(self.slowest_pages)
+
+    def spider_closed(self, spider):
+        stats = self.crawler.stats
+        callbacks = {}
+        for key, value in stats.get_stats(spider).items():
+            if key.startswith("profiling/") and key.count("/") == 2:
+                _, callback_name, stat = key.split("/")
+                callbacks.setdefault(callback_name, {})[stat] = value
+        for callback_name, callback_stats in callbacks.items():
+            callback_stats["mean_secs"] = callback_stats["secs"] / callback_stats["calls"]
+            if callback_stats.get("sampled_items"):
+                callback_stats["allocated_bytes_per_item"] = callback_stats["allocated_bytes"] / callback_stats["sampled_items"]
+
+        report = {
+            "spider": spider.name,
+            "mode": self.mode,
+            "callbacks": callbacks,
+            "slowest_pages": [page for _, _, page in sorted(self.slowest_pages, reverse=True)],
+            "top_functions": self.top_functions(25) if self.profiler is not None else None,
+            "top_allocation_sites": [{"site": site, "bytes_per_callback": size / self.num_traced} for site, size in self.allocation_sites.most_common(25)] if self.num_traced else None
+        }
+        os.makedirs(self.profile_dir, exist_ok=True)
+        report_path = os.path.join(self.profile_dir, f"{spider.name}_callbacks.json")
+        with open(report_path, "wb") as f:
+            f.write(helper_json_dumps(report))
+        if self.profiler is not None:
+            self.profiler.dump_stats(os.path.join(self.profile_dir, f"{spider.name}_callbacks.prof"))
+
+        for page in report["slowest_pages"][:5]:
+            helper_log_event(spider, "slow_page", secs=round(page["secs"], 4), callback=page["callback"], url=page["url"], wallet_address=page["wallet_address"], asset_name=page["asset_name"], num_items=page["num_items"])
+        for function in (report["top_functions"] or [])[:5]:
+            helper_log_event(spider, "hot_function", **function)
+        for allocation_site in (report["top_allocation_sites"] or [])[:5]:
+            helper_log_event(spider, "allocation_site", site=allocation_site["site"], bytes_per_callback=round(allocation_site["bytes_per_callback"]))
+        spider.logger.info(f"Wrote the callback profiling report to {report_path}")
+
+    def top_functions(self, num_functions):
+        # The functions with the most own CPU time in the sampled callbacks
+        profile_stats = pstats.Stats(self.profiler)
+        functions = []
+        for (filename, lineno, function_name), (_, num_calls, own_secs, cumulative_secs, _) in profile_stats.stats.items():
+            functions.append({"function": f"{filename}:{lineno}({function_name})", "calls": num_calls, "own_secs": own_secs, "cumulative_secs": cumulative_secs})
+        return sorted(functions, key=lambda function: function["own_secs"], reverse=True)[:num_functions]
 
 
 class WalletAnalyzerDownloaderMiddleware:
@@ -101,3 +271,389 @@ class WalletAnalyzerDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class CircuitBreakerMiddleware:
+    # Holds back the new requests of a site while its circuit breaker (see retry_policies.CustomRetryFactory) is open,
+    # and only lets the probe requests through while it is half-open, instead of sending them to a site that is down.
+    # The retries themselves fail fast in the retry policy. A held back request leaves the downloader (IgnoreRequest),
+    # so that it does not take a CONCURRENT_REQUESTS slot from the other sites, and is sent back to the scheduler once
+    # the breaker may have half-opened. The spider is kept open while requests are held back.
+    #
+    # The retry policy keeps process-wide counters (retries by reason, time spent waiting in backoff, exhausted retry
+    # budget, breaker state transitions, ...), which are copied to the crawl stats under retry_policy/<site>/ for the
+    # sites crawled by the spider every stats_interval_secs while the crawl runs, and when it closes.
+    #
+    # Stats: retry_policy/<site>/breaker/deferred, retry_policy/<site>/breaker/deferred_secs, and
+    # retry_policy/<site>/breaker/held_back_at_close for the held back requests that were dropped by the spider closing.
+
+    stats_interval_secs = 15
+
+    def __init__(self, crawler, retry_factory):
+        self.crawler = crawler
+        self.retry_factory = retry_factory
+        self.sites = set()
+        self.stats_at_open = {}
+        self.held_back = {} # id(request) -> (request, delayed call sending it back to the scheduler)
+        self.publish_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        # Only the retry policies built by CustomRetryFactory have circuit breakers
+        retry_factory = get_retry_factory(crawler.settings.get("ZYTE_API_RETRY_POLICY"))
+        if retry_factory is None:
+            raise NotConfigured
+        mw = cls(crawler, retry_factory)
+        crawler.signals.connect(mw.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(mw.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    def spider_opened(self, spider):
+        self.stats_at_open = dict(self.retry_factory.stats)
+        self.publish_loop = LoopingCall(self.publish_stats, spider)
+        self.publish_loop.start(self.stats_interval_secs, now=False)
+
+    def process_request(self, request, spider):
+        site = urlparse_cached(request).hostname
+        self.sites.add(site)
+        circuit_breaker = self.retry_factory.circuit_breakers.get(site)
+        if circuit_breaker is None:
+            return None
+
+        delay = circuit_breaker.admission_delay(time.monotonic())
+        self.retry_factory.record_transitions(site, circuit_breaker)
+        if delay <= 0:
+            return None
+
+        # Send the request back to the scheduler once the breaker may have half-opened, and free its downloader slot
+        from twisted.internet import reactor
+        self.crawler.stats.inc_value(f"retry_policy/{site}/breaker/deferred", spider=spider)
+        self.crawler.stats.inc_value(f"retry_policy/{site}/breaker/deferred_secs", delay, spider=spider)
+        self.held_back[id(request)] = (request, reactor.callLater(delay, self.reschedule, request))
+        raise IgnoreRequest(f"Circuit breaker of {site} open, request held back for {delay:.1f}s: {request.url}")
+
+    def reschedule(self, request):
+        del self.held_back[id(request)]
+        self.crawler.engine.crawl(request.replace(dont_filter=True))
+
+    def spider_idle(self, spider):
+        if self.held_back:
+            raise DontCloseSpider
+
+    def publish_stats(self, spider):
+        for key, value in self.retry_factory.stats.items():
+            site = key.split("/")[1]
+            delta = value - self.stats_at_open.get(key, 0)
+            if site in self.sites and delta:
+                self.crawler.stats.set_value(key, delta, spider=spider)
+
+    def spider_closed(self, spider):
+        if self.publish_loop is not None and self.publish_loop.running:
+            self.publish_loop.stop()
+        for request, delayed_call in self.held_back.values():
+            delayed_call.cancel()
+            self.crawler.stats.inc_value(f"retry_policy/{urlparse_cached(request).hostname}/breaker/held_back_at_close", spider=spider)
+        self.held_back.clear()
+        self.publish_stats(spider)
+
+
+class ScreeningTimeBudgetMiddleware:
+    # Finishes the wallet screening within SCREENING_TIME_BUDGET_SECS of the spider opening, e.g. before a deadline on a
+    # slow Zyte API day. The wallet requests are prioritized by trader score, so they leave the scheduler best first.
+    # The throughput (wallets completed per second over the last throughput_window_secs) is estimated from the screened
+    # wallets, i.e. the downloaded wallet pages whose item was scraped, and a wallet request is skipped when the requests ahead of it in the downloader and itself cannot be
+    # completed at that throughput before the deadline. As time runs out, the lowest-priority wallets are skipped
+    # instead of being sent and cut off halfway.
+    #
+    # The skipped wallets are reported in rank order (best trader score first) in the JSON Lines file
+    # SCREENING_SKIPPED_WALLETS_PATH when the spider closes, so they can be queued for the next run. The cached pages
+    # are never skipped, since this middleware comes after the HTTP cache.
+    #
+    # Stats: time_budget/skipped, and time_budget/throughput (wallets per second) when the first wallet is skipped.
+
+    throughput_window_secs = 120
+    min_completions = 5 # Completed wallets needed before the throughput is trusted
+
+    def __init__(self, crawler, budget_secs):
+        self.crawler = crawler
+        self.budget_secs = budget_secs
+        self.skipped_wallets_path = crawler.settings.get("SCREENING_SKIPPED_WALLETS_PATH", "%(name)s_skipped_wallets.jsonl")
+        self.deadline = None
+        self.started_at = None
+        self.completed_at = deque()
+        self.skipped_wallets = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        budget_secs = crawler.settings.getfloat("SCREENING_TIME_BUDGET_SECS", 0)
+        if budget_secs <= 0:
+            raise NotConfigured
+        mw = cls(crawler, budget_secs)
+        crawler.signals.connect(mw.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(mw.item_scraped, signal=signals.item_scraped)
+        return mw
+
+    def spider_opened(self, spider):
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + self.budget_secs
+
+    def throughput(self, now):
+        while self.completed_at and self.completed_at[0] < now - self.throughput_window_secs:
+            self.completed_at.popleft()
+        if len(self.completed_at) < self.min_completions:
+            return None
+        # From the oldest completion of the window, so that the latency of the first requests does not count as idle time
+        return len(self.completed_at) / max(now - self.completed_at[0], 1e-3)
+
+    def item_scraped(self, item, response, spider):
+        # Only count the wallet pages that were downloaded and made it to an item, not the pages that were not ready
+        # (retried or dropped) nor those served from the cache
+        if "wallet_address" in response.meta and "cached" not in response.flags:
+            self.completed_at.append(time.monotonic())
+
+    def process_request(self, request, spider):
+        wallet_address = request.meta.get("wallet_address")
+        if wallet_address is None:
+            return None
+        now = time.monotonic()
+        if now < self.deadline:
+            throughput = self.throughput(now)
+            if throughput is None or now + len(self.crawler.engine.downloader.active) / throughput <= self.deadline:
+                return None
+
+        # Skip the wallet, which cannot be screened before the deadline
+        if not self.skipped_wallets:
+            throughput = self.throughput(now)
+            self.crawler.stats.set_value("time_budget/throughput", round(throughput or 0.0, 3), spider=spider)
+            helper_log_event(spider, "time_budget_exhausted", level=logging.WARNING, budget_secs=self.budget_secs, elapsed_secs=round(now - self.started_at, 1), throughput=round(throughput or 0.0, 3))
+        self.skipped_wallets[wallet_address] = (request.meta.get("trader_score"), request.meta.get("wallet_count"))
+        self.crawler.stats.inc_value("time_budget/skipped", spider=spider)
+        raise IgnoreRequest(f"Not enough time left to screen the wallet {wallet_address}")
+
+    def spider_closed(self, spider):
+        if not self.skipped_wallets:
+            return
+        # Best trader score first, then in the order of the selection
+        ranked_wallets = sorted(
+            self.skipped_wallets.items(),
+            key=lambda entry: (entry[1][0] is None, -(entry[1][0] or 0.0), entry[1][1] if entry[1][1] is not None else float("inf"))
+        )
+        path = self.skipped_wallets_path % {"name": spider.name}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            for rank, (wallet_address, (trader_score, wallet_count)) in enumerate(ranked_wallets, start=1):
+                f.write(helper_json_dumps({"rank": rank, "wallet_address": wallet_address, "trader_score": trader_score, "wallet_count": wallet_count}) + b"\n")
+        helper_log_event(spider, "wallets_skipped", level=logging.WARNING, num_wallets=len(ranked_wallets), path=path, first_wallets=[wallet_address for wallet_address, _ in ranked_wallets[:10]])
+
+
+class PageReadinessMiddleware:
+    # Checks that the browser-rendered pages of a spider are fully loaded, with the spider's readiness_xpath, before
+    # they reach the callback. A page that is not ready is requested again with an escalating render strategy, one per
+    # attempt, from READINESS_STRATEGIES:
+    #   - longer_timeout: multiply the timeouts of the waitForSelector actions by READINESS_TIMEOUT_MULTIPLIER
+    #   - extra_wait: also append a waitForTimeout action of READINESS_EXTRA_WAIT_SECS
+    #   - fresh_session: also render the page in a new Zyte API session
+    # The page is dropped once READINESS_MAX_ATTEMPTS attempts (including the first one) have failed, instead of being
+    # exported as an all-None row, so the wallet is not marked as screened and is requested again by the next run.
+    #
+    # In production log mode, the Zyte API action logs of the checked pages are kept in the spider's action log buffer
+    # (see StructuredLoggingExtension), and only written for the pages that are not ready or whose request failed.
+    #
+    # Stats: readiness/checked, readiness/ready and readiness/not_ready (in total and per strategy, "initial" for the
+    # first attempt), readiness/retries/<strategy>, readiness/gave_up, and
+    # readiness/ready_rate and readiness/first_attempt_ready_rate when the spider closes.
+
+    max_action_timeout = 15 # Longest timeout accepted by the Zyte API actions, in seconds
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.max_attempts = crawler.settings.getint("READINESS_MAX_ATTEMPTS", 4)
+        self.strategies = crawler.settings.getlist("READINESS_STRATEGIES", ["longer_timeout", "extra_wait", "fresh_session"])
+        self.timeout_multiplier = crawler.settings.getfloat("READINESS_TIMEOUT_MULTIPLIER", 2.0)
+        self.extra_wait_secs = crawler.settings.getfloat("READINESS_EXTRA_WAIT_SECS", 5.0)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("READINESS_ENABLED", True):
+            raise NotConfigured
+        mw = cls(crawler)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    def process_response(self, request, response, spider):
+        # Only check the browser-rendered pages of the spiders that define a readiness selector
+        readiness_xpath = getattr(spider, "readiness_xpath", None)
+        automap = request.meta.get("zyte_api_automap")
+        if readiness_xpath is None or not isinstance(automap, dict) or not automap.get("browserHtml") or not hasattr(response, "xpath"):
+            return response
+
+        stats = self.crawler.stats
+        attempt = request.meta.get("readiness_attempt", 1)
+        strategy = request.meta.get("readiness_strategy", "initial")
+        stats.inc_value("readiness/checked", spider=spider)
+        action_log_buffer = getattr(spider, "action_log_buffer", None)
+        if action_log_buffer is not None:
+            action_log_buffer.record(request.url, attempt, getattr(response, "raw_api_response", {}).get("actions"))
+        if helper_page_ready(spider, response):
+            stats.inc_value("readiness/ready", spider=spider)
+            stats.inc_value(f"readiness/ready/{strategy}", spider=spider)
+            return response
+
+        stats.inc_value("readiness/not_ready", spider=spider)
+        stats.inc_value(f"readiness/not_ready/{strategy}", spider=spider)
+        if attempt >= self.max_attempts or not self.strategies:
+            stats.inc_value("readiness/gave_up", spider=spider)
+            self.flush_action_logs(request, spider, reason="not_ready")
+            helper_log_event(spider, "page_dropped", level=logging.ERROR, reason="not_ready", attempts=attempt, url=response.url)
+            raise IgnoreRequest(f"Page not ready after {attempt} attempts: {response.url}")
+
+        # Escalate the render strategy, staying on the last one if there are more attempts than strategies
+        next_strategy = self.strategies[min(attempt, len(self.strategies)) - 1]
+        stats.inc_value(f"readiness/retries/{next_strategy}", spider=spider)
+        self.flush_action_logs(request, spider, reason="not_ready")
+        helper_log_event(spider, "page_retried", level=logging.WARNING, reason="not_ready", strategy=next_strategy, attempt=attempt + 1, max_attempts=self.max_attempts, url=response.url)
+        # Escalate from the parameters of the first attempt, as the strategies add to each other
+        base_automap = request.meta.get("readiness_base_automap", automap)
+        meta = dict(request.meta, readiness_attempt=attempt + 1, readiness_strategy=next_strategy, readiness_base_automap=base_automap)
+        meta["zyte_api_automap"] = self.escalate(base_automap, self.strategies.index(next_strategy) + 1)
+        return request.replace(meta=meta, dont_filter=True)
+
+    def process_exception(self, request, exception, spider):
+        # Write the action logs of the earlier attempts of a request that failed, but keep them for the requests that
+        # were not sent (e.g. held back by the circuit breaker), which are requested again
+        if isinstance(exception, IgnoreRequest):
+            return None
+        self.flush_action_logs(request, spider, reason=type(exception).__name__)
+        return None
+
+    def flush_action_logs(self, request, spider, reason):
+        action_log_buffer = getattr(spider, "action_log_buffer", None)
+        if action_log_buffer is None:
+            return
+        for attempt, actions in action_log_buffer.flush(request.url):
+            helper_log_event(spider, "zyte_actions", level=logging.WARNING, reason=reason, attempt=attempt, url=request.url, actions=actions)
+
+    def escalate(self, automap, level):
+        # Build the Zyte API parameters of the given escalation level, each level adding to the previous ones
+        automap = copy.deepcopy(automap)
+        actions = automap.get("actions", [])
+        actions = [actions] if isinstance(actions, dict) else actions
+        for strategy in self.strategies[:level]:
+            if strategy == "longer_timeout":
+                for action in actions:
+                    if action.get("action") == "waitForSelector":
+                        action["timeout"] = min(self.max_action_timeout, action.get("timeout", 5) * self.timeout_multiplier)
+            elif strategy == "extra_wait":
+                actions.append({"action": "waitForTimeout", "timeout": min(self.max_action_timeout, self.extra_wait_secs), "onError": "return"})
+            elif strategy == "fresh_session":
+                automap["session"] = {"id": str(uuid.uuid4())}
+        automap["actions"] = actions
+        return automap
+
+    def spider_closed(self, spider):
+        stats = self.crawler.stats
+        num_checked = stats.get_value("readiness/checked", 0, spider=spider)
+        num_initial_ready = stats.get_value("readiness/ready/initial", 0, spider=spider)
+        num_initial = num_initial_ready + stats.get_value("readiness/not_ready/initial", 0, spider=spider)
+        if num_checked:
+            stats.set_value("readiness/ready_rate", stats.get_value("readiness/ready", 0, spider=spider) / num_checked, spider=spider)
+        if num_initial:
+            stats.set_value("readiness/first_attempt_ready_rate", num_initial_ready / num_initial, spider=spider)
+
+
+class TieredFetchMiddleware:
+    # Fetches the pages of the tiered requests with the plain HTTP response body of the Zyte API first, which is much
+    # faster and cheaper than browser rendering, and only falls back to the browser rendering (with its actions) when
+    # the spider's readiness_xpath is missing from the HTTP response. Requests are tiered when their fetch_mode meta key,
+    # or else the fetch_mode attribute of their spider, is "tiered".
+    #
+    # The tier that worked last time is remembered per URL pattern (see helper_url_pattern), so that the later requests
+    # of a page type that needs a browser go straight to browser rendering. The memory is kept in
+    # TIERED_FETCH_MEMORY_PATH across runs, and the HTTP tier is tried again once a browser entry is older than
+    # TIERED_FETCH_REPROBE_SECS, in case the page has become server-rendered.
+    #
+    # Stats: tiered_fetch/http/requests, tiered_fetch/http/ready, tiered_fetch/http/fallback and
+    # tiered_fetch/browser/remembered (requests sent straight to browser rendering).
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.path = crawler.settings.get("TIERED_FETCH_MEMORY_PATH", "tiered_fetch_memory.json")
+        self.reprobe_secs = crawler.settings.getint("TIERED_FETCH_REPROBE_SECS", 86400)
+        self.memory = {} # URL pattern -> {"tier": "http" or "browser", "updated_at": timestamp}
+        self.updated_patterns = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("TIERED_FETCH_ENABLED", True):
+            raise NotConfigured
+        mw = cls(crawler)
+        crawler.signals.connect(mw.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    def load_memory(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "rb") as f:
+            return helper_json_loads(f.read())
+
+    def spider_opened(self, spider):
+        self.memory = self.load_memory()
+
+    def spider_closed(self, spider):
+        # Merge with the entries saved by the other spiders in the meantime, keeping the latest entry of each pattern
+        if not self.updated_patterns:
+            return
+        memory = self.load_memory()
+        for pattern in self.updated_patterns:
+            if pattern not in memory or memory[pattern]["updated_at"] <= self.memory[pattern]["updated_at"]:
+                memory[pattern] = self.memory[pattern]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(helper_json_dumps(memory))
+        os.replace(tmp_path, self.path)
+
+    def remember(self, url, tier):
+        pattern = helper_url_pattern(url)
+        self.memory[pattern] = {"tier": tier, "updated_at": time.time()}
+        self.updated_patterns.add(pattern)
+
+    def process_request(self, request, spider):
+        # Only tier the browser-rendered requests of the spiders that define a readiness selector, once
+        automap = request.meta.get("zyte_api_automap")
+        fetch_mode = request.meta.get("fetch_mode", getattr(spider, "fetch_mode", "browser"))
+        if fetch_mode != "tiered" or "fetch_tier" in request.meta or getattr(spider, "readiness_xpath", None) is None or not isinstance(automap, dict) or not automap.get("browserHtml"):
+            return None
+
+        stats = self.crawler.stats
+        entry = self.memory.get(helper_url_pattern(request.url))
+        if entry is not None and entry["tier"] == "browser" and time.time() - entry["updated_at"] < self.reprobe_secs:
+            request.meta["fetch_tier"] = "browser"
+            stats.inc_value("tiered_fetch/browser/remembered", spider=spider)
+            return None
+
+        # Keep the browser parameters for the fallback
+        request.meta["fetch_tier"] = "http"
+        request.meta["tiered_browser_automap"] = automap
+        request.meta["zyte_api_automap"] = {"httpResponseBody": True, "httpResponseHeaders": True}
+        stats.inc_value("tiered_fetch/http/requests", spider=spider)
+        return None
+
+    def process_response(self, request, response, spider):
+        if request.meta.get("fetch_tier") != "http":
+            return response
+
+        stats = self.crawler.stats
+        if helper_page_ready(spider, response):
+            stats.inc_value("tiered_fetch/http/ready", spider=spider)
+            self.remember(request.url, "http")
+            return response
+
+        # The required nodes are only rendered by the browser
+        stats.inc_value("tiered_fetch/http/fallback", spider=spider)
+        self.remember(request.url, "browser")
+        helper_log_event(spider, "fetch_fallback", sample_key=request.url, reason="readiness_selector_missing", tier="browser", url=request.url)
+        meta = dict(request.meta, fetch_tier="browser", zyte_api_automap=request.meta["tiered_browser_automap"])
+        return request.replace(meta=meta, dont_filter=True)
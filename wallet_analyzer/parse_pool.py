@@ -0,0 +1,146 @@
+# Import packages
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+from typing import Optional
+
+from parsel import Selector
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet import defer
+
+from wallet_analyzer.structured_logging import helper_log_event
+
+## Worker side
+_PLANS = {} # The extraction plans already imported by the worker process
+
+def helper_resolve_plan(plan_path: str):
+    """
+    A function to import an extraction plan from its path, e.g. "wallet_analyzer.spiders.gmgn_ai_wallet_screener:GmgnAiWalletScreenerSpider.wallet_data_plan",
+    once per worker process. The plans are compiled when their spider class is defined, so they are rebuilt by the import instead of being pickled.
+    """
+    plan = _PLANS.get(plan_path)
+    if plan is None:
+        module_name, attribute_path = plan_path.split(":")
+        plan = import_module(module_name)
+        for attribute in attribute_path.split("."):
+            plan = getattr(plan, attribute)
+        _PLANS[plan_path] = plan
+    return plan
+
+def helper_extract_in_worker(plan_path: str, body: bytes, encoding: str, keep_raw: bool, readiness_xpath: Optional[str] = None):
+    """
+    A function, run in the worker processes, to parse a page and extract the normalized fields of the page (or of each of its rows) into plain dicts.
+    The body is decoded by the worker too. Returns the dicts, or None if the page fails the readiness_xpath check, and the time spent, in seconds.
+    """
+    start = time.perf_counter()
+    plan = helper_resolve_plan(plan_path)
+    selector = Selector(body=body, encoding=encoding, type="html")
+    if readiness_xpath is not None and selector.xpath(readiness_xpath).get() is None:
+        return None, time.perf_counter() - start
+    if plan.row_xpath is not None:
+        values = list(plan.extract_rows(selector, keep_raw=keep_raw))
+    else:
+        values = [plan.extract(selector, keep_raw=keep_raw)]
+    return values, time.perf_counter() - start
+
+## Shared executor
+# One executor per process, shared by the crawlers of the chained runner so that they use the cores once between them
+_EXECUTOR = None
+_EXECUTOR_USERS = 0
+
+def helper_acquire_executor(num_workers: int) -> ProcessPoolExecutor:
+    """
+    A function to start the process-wide executor, or join it if it has already been started (with its number of workers).
+    The workers are spawned rather than forked, as the crawling process runs the reactor's threads.
+    """
+    global _EXECUTOR, _EXECUTOR_USERS
+    if _EXECUTOR is None:
+        _EXECUTOR = ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("spawn"))
+    _EXECUTOR_USERS += 1
+    return _EXECUTOR
+
+def helper_release_executor() -> None:
+    """
+    A function to leave the process-wide executor, which is shut down once its last user has left.
+    """
+    global _EXECUTOR, _EXECUTOR_USERS
+    _EXECUTOR_USERS -= 1
+    if _EXECUTOR_USERS <= 0 and _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=False, cancel_futures=True)
+        _EXECUTOR, _EXECUTOR_USERS = None, 0
+
+## Parse pool
+class ParsePool:
+    """
+    Hands the HTML of the responses to worker processes, which decode it, build the selector and run the extraction plans, so that the reactor thread
+    only builds the items from the returned dicts. Keeps the number of pages waiting for (or being parsed by) a worker, i.e. the queue depth.
+
+    The readiness middlewares only look for the spider's readiness_marker in the body of the pages parsed by the pool (see helper_page_ready),
+    so the workers check the full readiness_xpath, and the pages that fail it are dropped (counted as parse_pool/not_ready) instead of being
+    exported as all-None rows.
+    """
+
+    def __init__(self, spider, num_workers: Optional[int] = None, stats=None, metrics=None):
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.executor = helper_acquire_executor(self.num_workers)
+        self.stats = stats
+        self.metrics = metrics
+        self.spider = spider
+        self.queue_depth = 0
+
+    def extract_items(self, plan_name: str, response, keep_raw: bool = False, **extra_fields) -> defer.Deferred:
+        """
+        Extract the items of a response with the spider's plan in a worker process. Returns a Deferred that fires with the list of items
+        (with the extra fields, e.g. taken from the request meta), which a callback can return as its result.
+        """
+        spider_cls = type(self.spider)
+        plan = getattr(spider_cls, plan_name)
+        plan_path = f"{spider_cls.__module__}:{spider_cls.__qualname__}.{plan_name}"
+        submitted_at = time.perf_counter()
+        readiness_xpath = getattr(self.spider, "readiness_xpath", None)
+        future = self.executor.submit(helper_extract_in_worker, plan_path, response.body, response.encoding, keep_raw, readiness_xpath)
+        self.update_queue_depth(1)
+
+        # Fire the Deferred in the reactor thread once the worker is done
+        from twisted.internet import reactor # The reactor installed by the crawler process
+        d = defer.Deferred()
+        future.add_done_callback(lambda future: reactor.callFromThread(self.complete, future, d, submitted_at, response))
+        item_cls = plan.raw_item_cls if keep_raw else plan.item_cls
+        return d.addCallback(lambda values: [item_cls(**extra_fields, **item_values) for item_values in values])
+
+    def complete(self, future, d: defer.Deferred, submitted_at: float, response) -> None:
+        self.update_queue_depth(-1)
+        try:
+            values, worker_secs = future.result()
+        except BaseException as exc: # Including the pages cancelled when the pool is shut down
+            if self.stats is not None:
+                self.stats.inc_value("parse_pool/errors", spider=self.spider)
+            d.errback(exc)
+            return
+        if values is None:
+            if self.stats is not None:
+                self.stats.inc_value("parse_pool/not_ready", spider=self.spider)
+            helper_log_event(self.spider, "page_dropped", level=logging.ERROR, reason="not_ready_in_worker", url=response.url)
+            values = []
+        if self.stats is not None:
+            self.stats.inc_value("parse_pool/pages", spider=self.spider)
+            self.stats.inc_value("parse_pool/worker_secs", worker_secs, spider=self.spider)
+        if self.metrics is not None:
+            site = urlparse_cached(response).hostname
+            self.metrics.observe("parse_worker", worker_secs, spider=self.spider.name, site=site)
+            self.metrics.observe("parse_pool_wait", time.perf_counter() - submitted_at - worker_secs, spider=self.spider.name, site=site)
+        d.callback(values)
+
+    def update_queue_depth(self, delta: int) -> None:
+        self.queue_depth += delta
+        if self.stats is not None:
+            self.stats.set_value("parse_pool/queue_depth", self.queue_depth, spider=self.spider)
+            self.stats.max_value("parse_pool/max_queue_depth", self.queue_depth, spider=self.spider)
+        if self.metrics is not None:
+            self.metrics.set_gauge("parse_pool_queue_depth", self.queue_depth, spider=self.spider.name)
+
+    def close(self) -> None:
+        helper_release_executor()
@@ -3,11 +3,231 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
+import os
+import time
+import uuid
+from datetime import datetime, timezone
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import threads
 
+from wallet_analyzer.helper_functions import helper_json_dumps
+from wallet_analyzer.items import DexScreenerTopGainers
+from wallet_analyzer.signals import chain_cycle_started
+from wallet_analyzer.snapshots import GainerSnapshotStore
+from wallet_analyzer.storage import SQLiteHistoryWriter, helper_storage_table
+from wallet_analyzer.wallet_selection import helper_is_trader_who_bought_and_sold
+from wallet_analyzer.wallet_profiles import WalletProfileWriter
+
+
+class SQLiteStoragePipeline:
+    # Opt-in with STORAGE_ENABLED. Keeps the history of every run in the SQLite database at STORAGE_DB_PATH, while the
+    # JSON Lines feeds of each run are overwritten by the next one: the top gainers, the top traders and the wallet stats of every source (see
+    # storage.STORAGE_TABLES), with one row per run and key, i.e. (pair URL, run), (pair URL, wallet address, run) and
+    # (wallet address, source, run), the source being the spider name. The runs are listed in the runs table. In the
+    # polling mode of the chained runner, every poll cycle starts a new run (on the chain_cycle_started signal), so that
+    # the cycles do not overwrite each other's rows. The rows of the previous cycle that are still being scraped when the
+    # next one starts are recorded in the next cycle's run.
+    #
+    # The rows are written by a writer thread (see storage.SQLiteHistoryWriter), in batches of STORAGE_BATCH_SIZE rows or
+    # every STORAGE_FLUSH_SECS, so the reactor never waits for the database. Use storage.load_wallet_history to get the
+    # stats of a wallet across its last runs.
+    #
+    # Stats: storage/rows_written, storage/batches and storage/runs.
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.writer = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("STORAGE_ENABLED"):
+            raise NotConfigured
+        pipeline = cls(crawler)
+        crawler.signals.connect(pipeline.chain_cycle_started, signal=chain_cycle_started)
+        return pipeline
+
+    def open_spider(self, spider):
+        self.start_writer(spider)
+
+    def start_writer(self, spider):
+        settings = self.crawler.settings
+        run_id = f"{spider.name}-{datetime.now(tz=timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.writer = SQLiteHistoryWriter(
+            path=settings.get("STORAGE_DB_PATH", "wallet_analyzer.sqlite3"),
+            run_id=run_id,
+            spider_name=spider.name,
+            batch_size=settings.getint("STORAGE_BATCH_SIZE", 1000),
+            flush_secs=settings.getfloat("STORAGE_FLUSH_SECS", 2.0)
+        )
+        self.writer.start()
+
+    def close_spider(self, spider):
+        return self.stop_writer(spider, self.writer)
+
+    def chain_cycle_started(self, spider, cycle):
+        # Close the run of the previous cycle in the background, and start the cycle's run
+        writer = self.writer
+        self.start_writer(spider)
+        self.stop_writer(spider, writer)
+
+    def stop_writer(self, spider, writer):
+        # Let the writer finish in a thread of the reactor's pool
+        d = threads.deferToThread(writer.stop)
+        d.addCallback(lambda _: self.record_stats(spider, writer))
+        return d
+
+    def record_stats(self, spider, writer):
+        self.crawler.stats.inc_value("storage/rows_written", writer.num_rows_written, spider=spider)
+        self.crawler.stats.inc_value("storage/batches", writer.num_batches, spider=spider)
+        self.crawler.stats.inc_value("storage/runs", spider=spider)
+
+    def process_item(self, item, spider):
+        table = helper_storage_table(item)
+        if table is not None and self.writer.error is None:
+            self.writer.put(table, table.row(item, source=spider.name, run_id=self.writer.run_id))
+        return item
+
+
+class WalletProfileJoinPipeline:
+    # Joins the results of the wallet screeners (WALLET_PROFILE_SOURCES, e.g. DexCheck and GMGN) into one profile per
+    # wallet as they are scraped, instead of joining their feeds offline once every run has finished. Enabled by the
+    # chained runner, and by WALLET_PROFILE_JOIN_ENABLED for separate runs. The partial
+    # records and the complete profiles are kept in the SQLite database at WALLET_PROFILE_DB_PATH, which is shared by the
+    # spiders of the chained runner as well as by separate runs. The top traders spider (WALLET_PROFILE_TRADERS_SPIDER)
+    # feeds the positions of each wallet, attached to its profile as trader-level PnL context.
+    #
+    # As soon as every source has reported a wallet within WALLET_PROFILE_MAX_PART_AGE_SECS, its profile is upserted into
+    # the wallet_profiles table and appended to the JSON Lines stream WALLET_PROFILE_FEED_PATH, with the positions scraped
+    # within the same window. The older parts and positions, e.g. of earlier runs, are ignored. A wallet that is
+    # screened again is appended again, so the latest line of a wallet is its current profile. The items themselves pass
+    # through unchanged to the spider's feeds.
+    #
+    # The positions and parts are written by a writer thread (see wallet_profiles.WalletProfileWriter), in batches of
+    # WALLET_PROFILE_BATCH_SIZE or every WALLET_PROFILE_FLUSH_SECS, so the reactor never waits for the database.
+    #
+    # Stats: wallet_profiles/positions, wallet_profiles/parts, wallet_profiles/skipped (records without any stat) and
+    # wallet_profiles/completed (when the spider closes).
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        settings = crawler.settings
+        self.db_path = settings.get("WALLET_PROFILE_DB_PATH", "wallet_profiles.sqlite3")
+        self.sources = settings.getdict("WALLET_PROFILE_SOURCES")
+        self.traders_spider = settings.get("WALLET_PROFILE_TRADERS_SPIDER", "dex_screener_top_traders")
+        self.feed_path = settings.get("WALLET_PROFILE_FEED_PATH")
+        self.max_part_age_secs = settings.getfloat("WALLET_PROFILE_MAX_PART_AGE_SECS", 86400)
+        self.batch_size = settings.getint("WALLET_PROFILE_BATCH_SIZE", 500)
+        self.flush_secs = settings.getfloat("WALLET_PROFILE_FLUSH_SECS", 2.0)
+        self.writer = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("WALLET_PROFILE_JOIN_ENABLED"):
+            raise NotConfigured
+        return cls(crawler)
+
+    def open_spider(self, spider):
+        if spider.name not in self.sources and spider.name != self.traders_spider:
+            return
+        feed_path = self.feed_path if spider.name in self.sources else None
+        if feed_path:
+            os.makedirs(os.path.dirname(feed_path) or ".", exist_ok=True)
+        self.writer = WalletProfileWriter(
+            path=self.db_path,
+            sources=self.sources,
+            spider_name=spider.name,
+            max_part_age_secs=self.max_part_age_secs,
+            feed_path=feed_path,
+            batch_size=self.batch_size,
+            flush_secs=self.flush_secs
+        )
+        self.writer.start()
+
+    def close_spider(self, spider):
+        if self.writer is None:
+            return None
+        # Let the writer finish in a thread of the reactor's pool
+        d = threads.deferToThread(self.writer.stop)
+        d.addCallback(lambda _: self.crawler.stats.set_value("wallet_profiles/completed", self.writer.num_completed, spider=spider))
+        return d
+
+    def process_item(self, item, spider):
+        if self.writer is None or self.writer.error is not None:
+            return item
+        adapter = ItemAdapter(item)
+        stats = self.crawler.stats
+
+        if spider.name == self.traders_spider:
+            if helper_is_trader_who_bought_and_sold(adapter) and adapter.get("asset_url") is not None:
+                self.writer.put_position((adapter["wallet_address"], adapter["asset_url"], adapter.get("asset_name"), adapter.get("trader_pnl"),
+                                          adapter.get("trader_bought_usd"), adapter.get("trader_sold_usd"), time.time()))
+                stats.inc_value("wallet_profiles/positions", spider=spider)
+            return item
+
+        # Only the records with at least one stat count as a report of the source
+        wallet_address = adapter.get("wallet_address")
+        record = {field_name: value for field_name, value in adapter.items() if field_name != "wallet_address" and not field_name.endswith("_raw")}
+        if wallet_address is None or all(value is None for value in record.values()):
+            stats.inc_value("wallet_profiles/skipped", spider=spider)
+            return item
+
+        self.writer.put_part(wallet_address, self.sources[spider.name], record)
+        stats.inc_value("wallet_profiles/parts", spider=spider)
+        return item
+
+
+class GainerSnapshotPipeline:
+    # Opt-in with GAINER_SNAPSHOT_ENABLED. Keeps every top gainers leaderboard in the append-only snapshot store at
+    # GAINER_SNAPSHOT_DIR (see snapshots.GainerSnapshotStore), keyed by pair URL and snapshot time, to study the momentum
+    # of the pairs. Only the fields of a pair that changed since its previous snapshot are stored, with a full snapshot
+    # every GAINER_SNAPSHOT_KEYFRAME_INTERVAL snapshots, so any leaderboard (leaderboard_at) or the time series of a
+    # pair (pair_series) is read without replaying the whole history.
+    #
+    # A leaderboard is appended once the spider is idle, i.e. once all its rows have been scraped, so that every poll of
+    # the polling chained runner adds its own snapshot. It is timestamped with the time its first row was scraped. A
+    # run without any top gainer does not add a snapshot.
+    #
+    # Stats: gainer_snapshots/snapshots, and gainer_snapshots/pairs and gainer_snapshots/bytes (the size of the block)
+    # of the last snapshot.
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.directory = crawler.settings.get("GAINER_SNAPSHOT_DIR", "gainer_snapshots")
+        self.keyframe_interval = crawler.settings.getint("GAINER_SNAPSHOT_KEYFRAME_INTERVAL", 48)
+        self.store = None
+        self.items = []
+        self.captured_at = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("GAINER_SNAPSHOT_ENABLED"):
+            raise NotConfigured
+        pipeline = cls(crawler)
+        crawler.signals.connect(pipeline.append_snapshot, signal=signals.spider_idle)
+        return pipeline
+
+    def append_snapshot(self, spider):
+        if not self.items:
+            return
+        if self.store is None:
+            self.store = GainerSnapshotStore(self.directory, keyframe_interval=self.keyframe_interval)
+        self.store.append(self.captured_at, self.items)
+        stats = self.crawler.stats
+        stats.inc_value("gainer_snapshots/snapshots", spider=spider)
+        stats.set_value("gainer_snapshots/pairs", len(self.items), spider=spider)
+        stats.set_value("gainer_snapshots/bytes", self.store.index[-1][2], spider=spider)
+        self.items, self.captured_at = [], None
+
+    def close_spider(self, spider):
+        self.append_snapshot(spider)
 
-class WalletAnalyzerPipeline:
     def process_item(self, item, spider):
+        # The debugging items with raw fields subclass the item dataclass, and their raw fields are not stored
+        if isinstance(item, DexScreenerTopGainers):
+            self.captured_at = self.captured_at or time.time()
+            self.items.append(item)
         return item
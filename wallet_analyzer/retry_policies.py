@@ -1,10 +1,146 @@
+import logging
+import time
+from collections import Counter, deque
+from urllib.parse import urlparse
+
+from scrapy.utils.misc import load_object
 from tenacity import retry_if_exception, RetryCallState
 from zyte_api.aio.errors import RequestError
 from zyte_api.aio.retry import RetryFactory
 
+logger = logging.getLogger(__name__)
+
+# Callables notified of every failed Zyte API attempt handled by the retry policy, with the exception of the attempt
+# (e.g. by the adaptive concurrency extension, which backs off on throttling and errors). They are called within the
+# retry policy, so an observer that fails is logged and skipped rather than failing the request.
+RETRY_OBSERVERS = []
+
 def is_http_521(exc: BaseException) -> bool:
     return isinstance(exc, RequestError) and (exc.status == 521 or exc.status == 500)
 
+def is_throttling(exc: BaseException) -> bool:
+    return isinstance(exc, RequestError) and exc.status == 429
+
+def get_site(url) -> str:
+    # The target site of a Zyte API query, e.g. gmgn.ai
+    return urlparse(url or "").hostname or "unknown"
+
+def get_retry_factory(retry_policy):
+    # The CustomRetryFactory that built a retry policy (the ZYTE_API_RETRY_POLICY setting, an object or its import path), else None
+    if isinstance(retry_policy, str):
+        retry_policy = load_object(retry_policy)
+    return getattr(retry_policy, "retry_factory", None)
+
+class RetryBudget:
+    # Caps the retries shared by all the requests at a ratio of the successful attempts over a sliding window, with a
+    # minimum number of retries per window, so that an outage cannot turn every in-flight request into a retry loop.
+    # The window is kept as per-second buckets.
+
+    def __init__(self, ratio: float, window_secs: int, min_retries: int):
+        self.ratio = ratio
+        self.window_secs = window_secs
+        self.min_retries = min_retries
+        self.buckets = deque() # (second, successes, retries)
+        self.successes = 0
+        self.retries = 0
+
+    def _record(self, now: float, successes: int, retries: int):
+        second = int(now)
+        while self.buckets and self.buckets[0][0] <= second - self.window_secs:
+            _, old_successes, old_retries = self.buckets.popleft()
+            self.successes -= old_successes
+            self.retries -= old_retries
+        if self.buckets and self.buckets[-1][0] == second:
+            _, bucket_successes, bucket_retries = self.buckets.pop()
+            successes, retries = successes + bucket_successes, retries + bucket_retries
+            self.successes -= bucket_successes
+            self.retries -= bucket_retries
+        self.buckets.append((second, successes, retries))
+        self.successes += successes
+        self.retries += retries
+
+    def record_success(self, now: float):
+        self._record(now, successes=1, retries=0)
+
+    def try_spend(self, now: float) -> bool:
+        # Spend one retry if the budget allows it
+        self._record(now, successes=0, retries=0)
+        if self.retries >= max(self.min_retries, self.ratio * self.successes):
+            return False
+        self._record(now, successes=0, retries=1)
+        return True
+
+class CircuitBreaker:
+    # Trips (opens) after failure_threshold errors of a site within window_secs. While open, the retries of the site
+    # fail fast and its new requests are deferred by the circuit breaker middleware. After open_secs the breaker
+    # half-opens and lets num_probes probe attempts through: a success closes it, a failure opens it again.
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, window_secs: float, open_secs: float, num_probes: int):
+        self.failure_threshold = failure_threshold
+        self.window_secs = window_secs
+        self.open_secs = open_secs
+        self.num_probes = num_probes
+        self.state = self.CLOSED
+        self.failures = deque()
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.transitions = []
+
+    def _set_state(self, state: str, now: float):
+        if state != self.state:
+            self.state = state
+            self.transitions.append(state)
+        if state == self.OPEN:
+            self.opened_at = now
+            self.probes_in_flight = 0
+
+    def _refresh(self, now: float):
+        # Half-open once the breaker has been open long enough, or re-admit probes that never came back
+        if self.state == self.OPEN and now - self.opened_at >= self.open_secs:
+            self._set_state(self.HALF_OPEN, now)
+            self.opened_at = now
+        elif self.state == self.HALF_OPEN and now - self.opened_at >= self.open_secs:
+            self.opened_at = now
+            self.probes_in_flight = 0
+
+    def is_open(self, now: float) -> bool:
+        self._refresh(now)
+        return self.state == self.OPEN
+
+    def admission_delay(self, now: float) -> float:
+        """
+        Seconds to wait before sending a new request to the site, 0 if it can be sent now (possibly as a probe).
+        """
+        self._refresh(now)
+        if self.state == self.CLOSED:
+            return 0.0
+        if self.state == self.OPEN:
+            return self.opened_at + self.open_secs - now
+        if self.probes_in_flight < self.num_probes:
+            self.probes_in_flight += 1
+            return 0.0
+        return min(1.0, self.open_secs)
+
+    def record_success(self, now: float):
+        # Only a probe closes the breaker, not a late success of a request sent before it opened
+        self._refresh(now)
+        if self.state == self.HALF_OPEN:
+            self._set_state(self.CLOSED, now)
+            self.failures.clear()
+
+    def record_failure(self, now: float):
+        self._refresh(now)
+        if self.state == self.HALF_OPEN:
+            self._set_state(self.OPEN, now)
+            return
+        self.failures.append(now)
+        while self.failures and self.failures[0] <= now - self.window_secs:
+            self.failures.popleft()
+        if self.state == self.CLOSED and len(self.failures) >= self.failure_threshold:
+            self._set_state(self.OPEN, now)
+
 class CustomRetryFactory(RetryFactory):
 
     retry_condition = (
@@ -12,14 +148,99 @@ class CustomRetryFactory(RetryFactory):
         | retry_if_exception(is_http_521)
     )
 
+    # Shared retry budget: the retries (except the throttling ones, handled by the adaptive concurrency) are capped at
+    # 20% of the successful attempts of the last minute, with at least 10 retries per minute
+    retry_budget_ratio = 0.2
+    retry_budget_window_secs = 60
+    retry_budget_min_retries = 10
+
+    # Per-site circuit breaker: opens after 5 errors (500/521) within 30 seconds, half-opens after 60 seconds with 2 probes
+    breaker_failure_threshold = 5
+    breaker_window_secs = 30
+    breaker_open_secs = 60
+    breaker_num_probes = 2
+
+    def __init__(self):
+        self.retry_budget = RetryBudget(ratio=self.retry_budget_ratio, window_secs=self.retry_budget_window_secs, min_retries=self.retry_budget_min_retries)
+        self.circuit_breakers = {}
+        self.stats = Counter() # Process-wide counters, copied to the crawl stats by the circuit breaker middleware
+
+    def get_circuit_breaker(self, site: str) -> CircuitBreaker:
+        if site not in self.circuit_breakers:
+            self.circuit_breakers[site] = CircuitBreaker(
+                failure_threshold=self.breaker_failure_threshold,
+                window_secs=self.breaker_window_secs,
+                open_secs=self.breaker_open_secs,
+                num_probes=self.breaker_num_probes
+            )
+        return self.circuit_breakers[site]
+
+    def record_transitions(self, site: str, circuit_breaker: CircuitBreaker):
+        for state in circuit_breaker.transitions:
+            self.stats[f"retry_policy/{site}/breaker/{state}"] += 1
+        circuit_breaker.transitions.clear()
+
+    def retry(self, retry_state: RetryCallState) -> bool:
+        # Called by tenacity for the outcome of every attempt, so the successes feed the retry budget and the circuit breakers
+        now = time.monotonic()
+        if not retry_state.outcome.failed:
+            self.retry_budget.record_success(now)
+            result = retry_state.outcome.result()
+            site = get_site(result.get("url") if isinstance(result, dict) else None)
+            circuit_breaker = self.circuit_breakers.get(site)
+            if circuit_breaker is not None:
+                circuit_breaker.record_success(now)
+                self.record_transitions(site, circuit_breaker)
+        return self.retry_condition(retry_state)
+
     def wait(self, retry_state: RetryCallState) -> float:
         if is_http_521(retry_state.outcome.exception()):
             return self.temporary_download_error_wait(retry_state=retry_state)
         return super().wait(retry_state)
 
     def stop(self, retry_state: RetryCallState) -> bool:
-        if is_http_521(retry_state.outcome.exception()):
-            return self.temporary_download_error_stop(retry_state)
-        return super().stop(retry_state)
+        exc = retry_state.outcome.exception()
+        for observer in RETRY_OBSERVERS:
+            try:
+                observer(exc)
+            except Exception:
+                logger.exception(f"The retry observer {observer!r} failed")
+                self.stats["retry_policy/observer_errors"] += 1
+
+        # Trip the circuit breaker of the site on a burst of errors, and fail fast while it is open
+        now = time.monotonic()
+        site = get_site((getattr(exc, "query", None) or {}).get("url"))
+        circuit_breaker = self.get_circuit_breaker(site)
+        if is_http_521(exc):
+            circuit_breaker.record_failure(now)
+            self.record_transitions(site, circuit_breaker)
+        if circuit_breaker.is_open(now):
+            self.stats[f"retry_policy/{site}/breaker/fail_fast"] += 1
+            return True
+
+        if is_http_521(exc):
+            stop = self.temporary_download_error_stop(retry_state)
+        else:
+            stop = super().stop(retry_state)
+        if stop:
+            self.stats[f"retry_policy/{site}/gave_up"] += 1
+            return True
+
+        # Spend the shared retry budget (the throttling retries are left to the adaptive concurrency)
+        if not is_throttling(exc) and not self.retry_budget.try_spend(now):
+            self.stats[f"retry_policy/{site}/budget_exhausted"] += 1
+            return True
+
+        reason = getattr(exc, "status", None) or type(exc).__name__
+        self.stats[f"retry_policy/{site}/retries"] += 1
+        self.stats[f"retry_policy/{site}/retries/{reason}"] += 1
+        self.stats[f"retry_policy/{site}/backoff_wait_secs"] += retry_state.upcoming_sleep
+        return False
+
+    def build(self):
+        retrying = super().build()
+        retrying.retry = self.retry
+        retrying.retry_factory = self # Lets the circuit breaker middleware reach the circuit breakers and the counters
+        return retrying
 
-CUSTOM_RETRY_POLICY = CustomRetryFactory().build()
\ No newline at end of file
+CUSTOM_RETRY_POLICY = CustomRetryFactory().build()
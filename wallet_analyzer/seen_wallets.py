@@ -0,0 +1,214 @@
+# Import packages
+import hashlib
+import logging
+import math
+import os
+import queue
+import sqlite3
+import struct
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+## Bloom filter
+class BloomFilter:
+    """
+    A compact, probabilistic set of strings. A negative answer is always correct, a positive one is wrong with a probability of about error_rate.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key: str):
+        # Derive all the bit positions from one 128-bit digest (Kirsch-Mitzenmacher double hashing)
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def save(self, path: str, watermark: float) -> None:
+        """
+        Save the bits to path, together with a watermark describing the state of the data they were built from.
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack("<QBd", self.num_bits, self.num_hashes, watermark) + self.bits)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> Optional[float]:
+        """
+        Load the bits saved at path and return their watermark. Returns None if the file is missing or was saved with a different size.
+        """
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+        header_size = struct.calcsize("<QBd")
+        num_bits, num_hashes, watermark = struct.unpack("<QBd", data[:header_size])
+        if num_bits != self.num_bits or num_hashes != self.num_hashes or len(data) - header_size != len(self.bits):
+            return None
+        self.bits = bytearray(data[header_size:])
+        return watermark
+
+## Writer thread
+class SeenWalletWriter(threading.Thread):
+    """
+    Writes the screening times of a source to the seen-wallet index in a thread of its own, so that the reactor never waits for the database
+    (or for the lock of another process writing to it). They are queued, and written one transaction per batch, once batch_size of them are
+    waiting or flush_secs have passed. The screening times still waiting when the process is killed are lost, so those wallets are screened again.
+    """
+
+    _STOP = object()
+
+    def __init__(self, path: str, source: str, batch_size: int = 500, flush_secs: float = 2.0):
+        super().__init__(name=f"seen-wallets-{source}", daemon=True)
+        self.path = path
+        self.source = source
+        self.batch_size = batch_size
+        self.flush_secs = flush_secs
+        self.entries = queue.SimpleQueue()
+        self.num_written = 0
+        self.num_batches = 0
+        self.error = None
+
+    def put(self, wallet_address: str, screened_at: float) -> None:
+        self.entries.put((self.source, wallet_address, screened_at))
+
+    def stop(self) -> None:
+        """
+        Write the waiting entries and close the database. Blocks until done, so call it from a thread (e.g. with deferToThread).
+        """
+        self.entries.put(self._STOP)
+        self.join()
+
+    def run(self):
+        connection = None
+        try:
+            connection = sqlite3.connect(self.path, timeout=30)
+
+            # Wait for the entries, at most flush_secs after the first waiting entry
+            batch, first_waiting_at = [], None
+            while True:
+                try:
+                    entry = self.entries.get(timeout=None if first_waiting_at is None else max(0.0, first_waiting_at + self.flush_secs - time.monotonic()))
+                except queue.Empty:
+                    entry = None
+                if entry is self._STOP:
+                    break
+                if entry is not None:
+                    batch.append(entry)
+                    first_waiting_at = first_waiting_at or time.monotonic()
+                if len(batch) >= self.batch_size or (batch and time.monotonic() - first_waiting_at >= self.flush_secs):
+                    self.flush(connection, batch)
+                    batch, first_waiting_at = [], None
+            if batch:
+                self.flush(connection, batch)
+        except Exception as exc:
+            self.error = exc
+            logger.exception(f"The seen-wallet writer of {self.source} failed")
+        finally:
+            if connection is not None:
+                connection.close()
+
+    def flush(self, connection: sqlite3.Connection, batch: list) -> None:
+        with connection:
+            connection.executemany(
+                "INSERT INTO seen_wallets (source, wallet_address, last_screened_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (source, wallet_address) DO UPDATE SET last_screened_at = excluded.last_screened_at",
+                batch
+            )
+        self.num_written += len(batch)
+        self.num_batches += 1
+
+## Seen-wallet index
+class SeenWalletIndex:
+    """
+    A persistent index of the last time each wallet was screened by a source (spider). The SQLite database is shared across runs and spiders.
+    A Bloom filter per source answers most lookups for never-screened wallets without touching the database.
+    The screening times are written in batches by a SeenWalletWriter, while the wallets marked during the run are known from memory at once.
+    """
+
+    def __init__(self, path: str, source: str, freshness_secs: int, bloom_capacity: int = 1000000, bloom_error_rate: float = 0.01,
+                 batch_size: int = 500, flush_secs: float = 2.0):
+        self.path = path
+        self.source = source
+        self.bloom_path = f"{path}.{source}.bloom"
+        self.freshness_secs = freshness_secs
+        self.checked_wallets = {} # Freshness of the wallets already checked during this run
+        self.num_skipped = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS seen_wallets ("
+            "source TEXT NOT NULL, wallet_address TEXT NOT NULL, last_screened_at REAL NOT NULL, "
+            "PRIMARY KEY (source, wallet_address)) WITHOUT ROWID"
+        )
+        self.connection.commit()
+
+        # Load the Bloom filter. Rebuild it from the database if it is missing, was sized differently, or was saved
+        # before the latest screening (e.g. after a crash)
+        self.bloom = BloomFilter(capacity=bloom_capacity, error_rate=bloom_error_rate)
+        if self.bloom.load(self.bloom_path) != self._watermark():
+            self.bloom = BloomFilter(capacity=bloom_capacity, error_rate=bloom_error_rate)
+            for (wallet_address,) in self.connection.execute("SELECT wallet_address FROM seen_wallets WHERE source = ?", (source,)):
+                self.bloom.add(wallet_address)
+
+        self.writer = SeenWalletWriter(path, source, batch_size=batch_size, flush_secs=flush_secs)
+        self.writer.start()
+
+    def _watermark(self) -> float:
+        row = self.connection.execute("SELECT MAX(last_screened_at) FROM seen_wallets WHERE source = ?", (self.source,)).fetchone()
+        return row[0] or 0.0
+
+    def last_screened_at(self, wallet_address: str) -> Optional[float]:
+        if wallet_address not in self.bloom:
+            return None
+        row = self.connection.execute(
+            "SELECT last_screened_at FROM seen_wallets WHERE source = ? AND wallet_address = ?", (self.source, wallet_address)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def is_fresh(self, wallet_address: str, now: Optional[float] = None) -> bool:
+        """
+        Check whether the wallet was screened by the source within the freshness window. Each wallet is only looked up once per run.
+        """
+        if self.freshness_secs <= 0:
+            return False
+        if wallet_address in self.checked_wallets:
+            return self.checked_wallets[wallet_address]
+
+        last_screened_at = self.last_screened_at(wallet_address)
+        is_fresh = last_screened_at is not None and (now or time.time()) - last_screened_at < self.freshness_secs
+        self.checked_wallets[wallet_address] = is_fresh
+        self.num_skipped += is_fresh
+        return is_fresh
+
+    def mark_screened(self, wallet_address: str, screened_at: Optional[float] = None) -> None:
+        self.writer.put(wallet_address, screened_at or time.time())
+        self.bloom.add(wallet_address)
+        self.checked_wallets[wallet_address] = True
+
+    def stop_writer(self) -> None:
+        """
+        Write the waiting screening times. Blocks until done, so call it from a thread (e.g. with deferToThread) on the reactor.
+        """
+        if self.writer.is_alive():
+            self.writer.stop()
+
+    def close(self) -> None:
+        self.stop_writer()
+        self.bloom.save(self.bloom_path, watermark=self._watermark())
+        self.connection.close()
@@ -63,7 +63,7 @@ ROBOTSTXT_OBEY = False
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 #ITEM_PIPELINES = {
-#    "wallet_analyzer.pipelines.WalletAnalyzerPipeline": 300,
+#    "wallet_analyzer.pipelines.SQLiteStoragePipeline": 200,
 #}
 
 # Enable and configure the AutoThrottle extension (disabled by default)
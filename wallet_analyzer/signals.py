@@ -0,0 +1,8 @@
+# Define here the custom signals of the project
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/signals.html
+
+# Sent by the polling chained runner (see wallet_analyzer.chain) to every open spider when a poll cycle starts, with
+# the cycle number: chain_cycle_started(spider, cycle)
+chain_cycle_started = object()
@@ -0,0 +1,250 @@
+# Import packages
+import bisect
+import mmap
+import os
+import struct
+from dataclasses import fields
+from typing import Iterable, List, Optional, Tuple, get_args, get_type_hints
+
+from itemadapter import ItemAdapter
+
+from wallet_analyzer.helper_functions import helper_json_dumps, helper_json_loads
+from wallet_analyzer.items import DexScreenerTopGainers
+
+# Index entry of a snapshot: timestamp, offset and length of its block in snapshots.bin, and whether it is a keyframe
+INDEX_ENTRY = struct.Struct("<dQIB")
+RECORD_HEADER = struct.Struct("<II") # Change mask, null mask
+STRING_LENGTH = struct.Struct("<H")
+
+## Schema
+def helper_snapshot_schema(item_cls=DexScreenerTopGainers, key_field: str = "asset_url") -> List[Tuple[str, str]]:
+    """
+    A function to list the (field name, type code) of the snapshot fields from the item dataclass: "q" for integers, "d" for floats and "s" for strings.
+    The key field (the pair URL) is stored once, in the pair dictionary.
+    """
+    hints = get_type_hints(item_cls)
+    schema = []
+    for field in fields(item_cls):
+        if field.name == key_field:
+            continue
+        types = [arg for arg in get_args(hints[field.name]) if arg is not type(None)] or [hints[field.name]]
+        schema.append((field.name, {int: "q", float: "d"}.get(types[0], "s")))
+    return schema
+
+## Snapshot store
+class GainerSnapshotStore:
+    """
+    An append-only time series of the top gainers leaderboards, keyed by pair (URL) and snapshot timestamp. Only the fields of a pair
+    that changed since its previous snapshot are stored, in a compact binary block per snapshot, with a full snapshot (keyframe) every
+    keyframe_interval snapshots, so that reading any leaderboard only replays the snapshots since the keyframe before it. Each block
+    starts with a directory of its pairs sorted by pair id, so that the time series of one pair only decodes that pair's records.
+
+    Layout of the directory:
+        schema.json      the fields and their types
+        pairs.txt        the pair URLs, one per line, the line number being the pair id
+        snapshots.bin    the snapshot blocks: number of pairs, directory of (pair id, record offset), then the records
+                         (change mask, null mask, then the changed values that are not None)
+        snapshots.idx    one INDEX_ENTRY per snapshot, written last, so that a snapshot exists once its index entry does
+    """
+
+    def __init__(self, directory: str, keyframe_interval: int = 48, key_field: str = "asset_url", item_cls=DexScreenerTopGainers):
+        self.directory = directory
+        self.keyframe_interval = keyframe_interval
+        self.key_field = key_field
+        self.schema = helper_snapshot_schema(item_cls, key_field)
+        if len(self.schema) > 32:
+            raise ValueError("The snapshot records support at most 32 fields")
+        os.makedirs(directory, exist_ok=True)
+        self.schema_path = os.path.join(directory, "schema.json")
+        self.pairs_path = os.path.join(directory, "pairs.txt")
+        self.data_path = os.path.join(directory, "snapshots.bin")
+        self.index_path = os.path.join(directory, "snapshots.idx")
+
+        # Refuse to mix the records of different schemas
+        if os.path.exists(self.schema_path):
+            with open(self.schema_path, "rb") as f:
+                if [tuple(field) for field in helper_json_loads(f.read())] != self.schema:
+                    raise ValueError(f"The snapshot store {directory} was written with another schema, use a new directory")
+        else:
+            with open(self.schema_path, "wb") as f:
+                f.write(helper_json_dumps(self.schema))
+
+        self.pair_urls: List[str] = []
+        if os.path.exists(self.pairs_path):
+            with open(self.pairs_path, encoding="utf-8") as f:
+                self.pair_urls = [line.rstrip("\n") for line in f if line.endswith("\n")]
+        self.pair_ids = {pair_url: pair_id for pair_id, pair_url in enumerate(self.pair_urls)}
+        self.index = self.load_index()
+
+    def load_index(self) -> List[Tuple[float, int, int, int]]:
+        # Drop a partially written index entry, and the data written after the last complete snapshot (e.g. after a crash)
+        index = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+            num_entries = len(data) // INDEX_ENTRY.size
+            index = [INDEX_ENTRY.unpack_from(data, i * INDEX_ENTRY.size) for i in range(num_entries)]
+            if len(data) != num_entries * INDEX_ENTRY.size:
+                with open(self.index_path, "rb+") as f:
+                    f.truncate(num_entries * INDEX_ENTRY.size)
+        data_size = index[-1][1] + index[-1][2] if index else 0
+        if os.path.exists(self.data_path) and os.path.getsize(self.data_path) != data_size:
+            with open(self.data_path, "rb+") as f:
+                f.truncate(data_size)
+        return index
+
+    ## Writing
+    def append(self, timestamp: float, items: Iterable) -> None:
+        """
+        Append the leaderboard captured at timestamp, which must be later than the last snapshot's.
+        """
+        if self.index and timestamp <= self.index[-1][0]:
+            raise ValueError(f"The snapshot at {timestamp} is not later than the last one, at {self.index[-1][0]}")
+        rows = {}
+        for item in items:
+            adapter = ItemAdapter(item)
+            if adapter.get(self.key_field) is not None:
+                rows[adapter[self.key_field]] = tuple(adapter.get(field_name) for field_name, _ in self.schema)
+
+        # Register the new pairs
+        new_pair_urls = [pair_url for pair_url in rows if pair_url not in self.pair_ids]
+        if new_pair_urls:
+            with open(self.pairs_path, "a", encoding="utf-8") as f:
+                for pair_url in new_pair_urls:
+                    self.pair_ids[pair_url] = len(self.pair_urls)
+                    self.pair_urls.append(pair_url)
+                    f.write(pair_url + "\n")
+
+        # Encode each pair against its previous values since the last keyframe
+        is_keyframe = len(self.index) % self.keyframe_interval == 0
+        state = {} if is_keyframe else self.replay(len(self.index) - 1)[0]
+        entries = sorted((self.pair_ids[pair_url], values) for pair_url, values in rows.items())
+        records = [self.encode_record(values, state.get(pair_id)) for pair_id, values in entries]
+        header_size = 4 + 8 * len(entries)
+        directory, offset = [], header_size
+        for (pair_id, _), record in zip(entries, records):
+            directory.extend((pair_id, offset))
+            offset += len(record)
+        block = struct.pack(f"<I{len(directory)}I", len(entries), *directory) + b"".join(records)
+
+        data_offset = self.index[-1][1] + self.index[-1][2] if self.index else 0
+        with open(self.data_path, "ab") as f:
+            f.write(block)
+        entry = (timestamp, data_offset, len(block), int(is_keyframe))
+        with open(self.index_path, "ab") as f:
+            f.write(INDEX_ENTRY.pack(*entry))
+        self.index.append(entry)
+
+    def encode_record(self, values: tuple, previous: Optional[tuple]) -> bytes:
+        change_mask, null_mask, parts = 0, 0, []
+        for i, ((_, type_code), value) in enumerate(zip(self.schema, values)):
+            if previous is not None and previous[i] == value:
+                continue
+            change_mask |= 1 << i
+            if value is None:
+                null_mask |= 1 << i
+            elif type_code == "s":
+                encoded = str(value).encode("utf-8")[:65535]
+                parts.append(STRING_LENGTH.pack(len(encoded)) + encoded)
+            else:
+                parts.append(struct.pack("<" + type_code, value))
+        return RECORD_HEADER.pack(change_mask, null_mask) + b"".join(parts)
+
+    ## Reading
+    def decode_record(self, data, offset: int, previous: Optional[tuple]) -> tuple:
+        change_mask, null_mask = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        values = []
+        for i, (_, type_code) in enumerate(self.schema):
+            if not change_mask & (1 << i):
+                values.append(previous[i] if previous is not None else None)
+            elif null_mask & (1 << i):
+                values.append(None)
+            elif type_code == "s":
+                (length,) = STRING_LENGTH.unpack_from(data, offset)
+                values.append(bytes(data[offset + 2:offset + 2 + length]).decode("utf-8"))
+                offset += 2 + length
+            else:
+                (value,) = struct.unpack_from("<" + type_code, data, offset)
+                values.append(value)
+                offset += 8
+        return tuple(values)
+
+    def read_directory(self, data, block_offset: int) -> Tuple[List[int], List[int]]:
+        (num_pairs,) = struct.unpack_from("<I", data, block_offset)
+        directory = struct.unpack_from(f"<{2 * num_pairs}I", data, block_offset + 4)
+        return list(directory[0::2]), list(directory[1::2])
+
+    def open_data(self):
+        # Memory-map the snapshot blocks, without copying them
+        f = open(self.data_path, "rb")
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+
+    def replay(self, snapshot_number: int) -> Tuple[dict, List[int]]:
+        """
+        Rebuild the values of every pair seen since the keyframe before a snapshot, and the pairs in that snapshot.
+        """
+        if snapshot_number < 0:
+            return {}, []
+        keyframe_number = snapshot_number
+        while not self.index[keyframe_number][3]:
+            keyframe_number -= 1
+        data = self.open_data()
+        try:
+            state, present = {}, []
+            for _, block_offset, _, _ in self.index[keyframe_number:snapshot_number + 1]:
+                pair_ids, offsets = self.read_directory(data, block_offset)
+                for pair_id, offset in zip(pair_ids, offsets):
+                    state[pair_id] = self.decode_record(data, block_offset + offset, state.get(pair_id))
+                present = pair_ids
+            return state, present
+        finally:
+            data.close()
+
+    def timestamps(self) -> List[float]:
+        return [entry[0] for entry in self.index]
+
+    def leaderboard_at(self, timestamp: float) -> List[dict]:
+        """
+        The leaderboard of the last snapshot taken at or before timestamp, sorted by gain rank.
+        """
+        snapshot_number = bisect.bisect_right(self.timestamps(), timestamp) - 1
+        if snapshot_number < 0:
+            return []
+        state, present = self.replay(snapshot_number)
+        rows = [self.to_row(pair_id, state[pair_id], self.index[snapshot_number][0]) for pair_id in present]
+        return sorted(rows, key=lambda row: (row.get("asset_gain_rank") is None, row.get("asset_gain_rank")))
+
+    def pair_series(self, pair_url: str, start: Optional[float] = None, end: Optional[float] = None) -> List[dict]:
+        """
+        The values of a pair in each snapshot it appears in, between start and end (inclusive), oldest first.
+        """
+        pair_id = self.pair_ids.get(pair_url)
+        if pair_id is None or not self.index:
+            return []
+        data = self.open_data()
+        try:
+            series, previous = [], None
+            for timestamp, block_offset, _, is_keyframe in self.index:
+                if end is not None and timestamp > end:
+                    break
+                if is_keyframe:
+                    previous = None
+                pair_ids, offsets = self.read_directory(data, block_offset)
+                position = bisect.bisect_left(pair_ids, pair_id)
+                if position == len(pair_ids) or pair_ids[position] != pair_id:
+                    continue
+                previous = self.decode_record(data, block_offset + offsets[position], previous)
+                if start is None or timestamp >= start:
+                    series.append(self.to_row(pair_id, previous, timestamp))
+            return series
+        finally:
+            data.close()
+
+    def to_row(self, pair_id: int, values: tuple, timestamp: float) -> dict:
+        row = {"snapshot_at": timestamp, self.key_field: self.pair_urls[pair_id]}
+        row.update(zip((field_name for field_name, _ in self.schema), values))
+        return row
@@ -2,3 +2,106 @@
 #
 # Please refer to the documentation for information on how to create and manage
 # your spiders.
+
+# Import libraries
+import logging
+import scrapy
+from wallet_analyzer.wallet_selection import helper_score_priority, stream_top_wallets
+from wallet_analyzer.checkpoint import helper_resumable_feeds
+from wallet_analyzer.structured_logging import helper_log_event
+
+## Wallet screeners
+class WalletScreenerSpider(scrapy.Spider):
+    """
+    The shared behaviour of the wallet screeners, which render the stats page of each selected wallet on a site and extract it with the
+    subclass's wallet_data_plan. The subclasses define the name, custom_settings, base_url (formatted with the wallet address),
+    wallet_data_plan, spider_actions (the Zyte API actions of each request), and readiness_xpath and readiness_marker.
+    It has no name, so the spider loader does not list it as a spider of its own.
+    """
+
+    chained = False # Set by the chained pipeline runner, which schedules the requests as new top traders are scraped
+
+    @classmethod
+    def update_settings(cls, settings):
+        super().update_settings(settings)
+        # In resumable mode, append to the feed instead of overwriting it
+        if settings.getbool("SCREENING_RESUME_ENABLED"):
+            settings.set("FEEDS", helper_resumable_feeds(settings.getdict("FEEDS")), priority="spider")
+
+    def start_requests(self):
+        # In chained mode, the requests are scheduled by the upstream top traders spider
+        if self.chained:
+            return
+
+        # In resumable mode, resume the interrupted run with its wallet selection, skipping the wallets already in the feed
+        screening_checkpoint = getattr(self, "screening_checkpoint", None)
+        completed_wallets = set()
+        if screening_checkpoint is not None and screening_checkpoint.is_resumed:
+            wallets_to_analyze = screening_checkpoint.selected_wallets
+            completed_wallets = screening_checkpoint.completed_wallets
+            self.logger.info(f"Resuming the interrupted run: {len(completed_wallets)} out of {len(wallets_to_analyze)} wallets have already been screened")
+        else:
+            # Select the top wallets from the top traders feed, in descending score order, leaving out the wallets screened recently
+            wallet_selection_path = self.settings.get("WALLET_SELECTION_PATH")
+            self.logger.info(f"Selecting the top wallets from the top traders feed {wallet_selection_path}")
+            seen_wallet_index = getattr(self, "seen_wallet_index", None)
+            wallets_to_analyze = stream_top_wallets(
+                path=wallet_selection_path,
+                top_k=self.settings.getint("WALLET_SELECTION_TOP_K") or None,
+                scoring=self.settings.get("WALLET_SELECTION_SCORING"),
+                pct_pnl_weight=self.settings.getfloat("WALLET_SELECTION_PCT_PNL_WEIGHT"),
+                skip_wallet=seen_wallet_index.is_fresh if seen_wallet_index is not None else None
+            )
+            if seen_wallet_index is not None:
+                self.logger.info(f"Skipped {seen_wallet_index.num_skipped} wallets screened within the last {seen_wallet_index.freshness_secs} seconds")
+            if screening_checkpoint is not None:
+                screening_checkpoint.save_selection(wallets_to_analyze)
+
+        # Count the progress from the wallets already screened
+        wallet_count = len(completed_wallets)
+        for wl, trader_score in wallets_to_analyze:
+            if wl in completed_wallets:
+                continue
+            wallet_count += 1
+            helper_log_event(self, "wallet_request", sample_key=wl, wallet_address=wl, trader_score=round(trader_score, 2), wallet_count=wallet_count, tot_num_wallets=len(wallets_to_analyze))
+            yield self.build_wallet_request(wallet_address=wl, wallet_count=wallet_count, tot_num_wallets=len(wallets_to_analyze), trader_score=trader_score)
+
+    def build_wallet_request(self, wallet_address, wallet_count, tot_num_wallets, trader_score=None):
+        # Build the request that renders the wallet's stats page, prioritized by the trader score so that the best wallets are screened first
+        return scrapy.Request(
+            url=self.base_url.format(wallet_address=wallet_address),
+            callback=self.parse_wallet_data,
+            meta={
+                "zyte_api_automap": {
+                    "browserHtml": True,
+                    "javascript": True,
+                    "actions": self.spider_actions
+                },
+                "wallet_address": wallet_address,
+                "wallet_count": wallet_count,
+                "tot_num_wallets": tot_num_wallets,
+                "trader_score": trader_score
+            },
+            priority=helper_score_priority(trader_score)
+        )
+
+    def parse_wallet_data(self, response):
+        # Extract the meta data
+        resp_wallet_address = response.meta["wallet_address"]
+        resp_wallet_count = response.meta["wallet_count"]
+        resp_tot_num_wallets = response.meta["tot_num_wallets"]
+
+        # Log the raw logs of the Zyte API when debugging. In production log mode, they are only written for the pages that were not fully loaded
+        if self.logger.isEnabledFor(logging.DEBUG):
+            actions = (getattr(response, "raw_api_response", None) or {}).get("actions")
+            helper_log_event(self, "zyte_actions", level=logging.DEBUG, wallet_address=resp_wallet_address, wallet_count=resp_wallet_count, tot_num_wallets=resp_tot_num_wallets, actions=actions)
+
+        # Log a status message. The pages that were not fully loaded have been retried (or dropped) by the page readiness middleware
+        helper_log_event(self, "wallet_parsed", sample_key=resp_wallet_address, wallet_address=resp_wallet_address, wallet_count=resp_wallet_count, tot_num_wallets=resp_tot_num_wallets)
+
+        # Extract and normalize all the fields of the page in one pass, in a worker process when the parse pool is enabled, with the raw strings only when debugging
+        keep_raw = self.settings.getbool("KEEP_RAW_FIELDS")
+        parse_pool = getattr(self, "parse_pool", None)
+        if parse_pool is not None:
+            return parse_pool.extract_items("wallet_data_plan", response, keep_raw=keep_raw, wallet_address=resp_wallet_address)
+        return [self.wallet_data_plan.extract_item(response, keep_raw=keep_raw, wallet_address=resp_wallet_address)]
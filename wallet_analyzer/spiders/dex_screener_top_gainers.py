@@ -2,137 +2,87 @@
 import scrapy
 from wallet_analyzer.inputs import custom_scrapy_settings
 from wallet_analyzer.helper_functions import *
-import re
+from wallet_analyzer.extraction import ExtractionPlan, FieldSpec
+from wallet_analyzer.items import DexScreenerTopGainers
+
+# The anchor keys of the cells of a top gainers row
+TOKEN_CELL = "ds-table-data-cell ds-dex-table-row-col-token"
 
 class DexScreenerTopGainersSpider(scrapy.Spider):
     name = "dex_screener_top_gainers"
     custom_settings = custom_scrapy_settings.copy() # Define the custom settings of the spider
     custom_settings["LOG_FILE"] = "dex_screener_top_gainers.log"
+    custom_settings["HTTPCACHE_EXPIRATION_SECS"] = 300 # The leaderboard changes within minutes
     custom_settings["FEEDS"] = {
-        'dex_screener_top_gainers.json': {
-            'format': 'json',
+        'dex_screener_top_gainers.jsonl': {
+            'format': 'jsonlines',
             'overwrite': True
         }
     }
+    if pa is not None: # Also export a columnar feed when pyarrow is installed, for the column-wise readers
+        custom_settings["FEEDS"]['dex_screener_top_gainers.parquet'] = {
+            'format': 'parquet',
+            'overwrite': True
+        }
+    readiness_xpath = "//div[@class='ds-dex-table ds-dex-table-top']/a" # Only present once the page has been fully loaded, checked by the page readiness middleware
+    readiness_marker = 'ds-dex-table ds-dex-table-top"><a' # A substring of the readiness node, looked for instead of evaluating the XPath when the pages are parsed by the parse pool
+    fetch_mode = "tiered" # Try the plain HTTP response first, and only render the listing in a browser if the rows are missing from it
     base_url = "https://dexscreener.com/gainers/solana?min24HSells=30&min24HTxns=300&min24HVol=500000&minLiq=250000&minMarketCap=1000000&order=desc&rankBy=priceChangeH24" # Volume > 500k, Liquidity > 250k, MCap > 1M
 
+    # The fields of each top gainers row. The cells of a row are anchored once, by their class, and each field is read relative to its cell
+    top_gainers_plan = ExtractionPlan(
+        row_xpath="//div[@class='ds-dex-table ds-dex-table-top']/a",
+        anchor_xpath="./div[starts-with(@class, 'ds-table-data-cell')]",
+        anchor_key_xpath="string(@class)",
+        fields=[
+            FieldSpec("asset_name", "./span[contains(@class, 'ds-dex-table-row-base-token-symbol')]/text()", anchor=TOKEN_CELL),
+            FieldSpec("asset_name_text", ".//div[@class='ds-table-data-cell ds-dex-table-row-col-token']/div[@class='ds-dex-table-row-base-token-name']/span/text()[1]"),
+            FieldSpec("asset_url", "./@href", helper_dex_screener_url, keep_raw=False),
+            FieldSpec("asset_gain_rank", ".//span[@class='ds-dex-table-row-badge-pair-no']/text()[2]", helper_normalize_integer), # 24-hour gain rank
+            FieldSpec("asset_network", "./img[@class='ds-dex-table-row-chain-icon']/@title", anchor=TOKEN_CELL),
+            FieldSpec("dex", "./img[@class='ds-dex-table-row-dex-icon']/@title", anchor=TOKEN_CELL),
+            FieldSpec("asset_price", "./text()[2]", helper_normalize_number, anchor="ds-table-data-cell ds-dex-table-row-col-price"), # Latest price in dollars
+            FieldSpec("asset_age", "./span/text()", anchor="ds-table-data-cell ds-dex-table-row-col-pair-age"), # Age in hours
+            FieldSpec("asset_24_hr_txns", "./text()", helper_normalize_integer, anchor="ds-table-data-cell ds-dex-table-row-col-txns"),
+            FieldSpec("asset_24_hr_volume_in_mil", "./text()[2]", helper_normalize_numbers_in_vol_liq_mcap, anchor="ds-table-data-cell ds-dex-table-row-col-volume"),
+            FieldSpec("num_makers", "./text()", helper_normalize_integer, anchor="ds-table-data-cell ds-dex-table-row-col-makers"),
+            FieldSpec("asset_price_change_l5m", "./span/text()", helper_normalize_numbers_in_pct_gains, anchor="ds-table-data-cell ds-dex-table-row-col-price-change-m5"),
+            FieldSpec("asset_price_change_l1h", "./span/text()", helper_normalize_numbers_in_pct_gains, anchor="ds-table-data-cell ds-dex-table-row-col-price-change-h1"),
+            FieldSpec("asset_price_change_l6h", "./span/text()", helper_normalize_numbers_in_pct_gains, anchor="ds-table-data-cell ds-dex-table-row-col-price-change-h6"),
+            FieldSpec("asset_price_change_l24h", "./span/text()", helper_normalize_numbers_in_pct_gains, anchor="ds-table-data-cell ds-dex-table-row-col-price-change-h24"),
+            FieldSpec("asset_liquidity_in_mil", "./text()[2]", helper_normalize_numbers_in_vol_liq_mcap, anchor="ds-table-data-cell ds-dex-table-row-col-liquidity"),
+            FieldSpec("asset_market_cap_in_mil", "./text()[2]", helper_normalize_numbers_in_vol_liq_mcap, anchor="ds-table-data-cell ds-dex-table-row-col-market-cap"),
+        ],
+        item_cls=DexScreenerTopGainers
+    )
+
     ## Start scraping
     def start_requests(self):
         # Send a request to the base URL
         self.logger.info("Sending a request to the base URL")
-        yield scrapy.Request(
+        yield self.build_top_gainers_request()
+
+    def build_top_gainers_request(self, refresh=False):
+        # Build the request of the listing. A refresh (a re-poll by the chained runner) bypasses the HTTP cache and the duplicate filter
+        return scrapy.Request(
             url=self.base_url,
             callback=self.parse_top_gainers,
             meta={
                 "zyte_api_automap": {
                     "browserHtml": True,
                 },
-            }
+                "dont_cache": refresh
+            },
+            dont_filter=refresh
         )
 
     def parse_top_gainers(self, response):
         # Log a status message
         self.logger.info("Parsing the response from the base URL")
 
-        # Extract a list of results
-        results = response.xpath("//div[@class='ds-dex-table ds-dex-table-top']/a")
-
-        # Parse the response
-        for res in results:
-            # Extract the asset name
-            asset_name = res.xpath("./div[@class='ds-table-data-cell ds-dex-table-row-col-token']/span[contains(@class, 'ds-dex-table-row-base-token-symbol')]/text()").get()
-            
-            # Extract the asset name text
-            asset_name_text = res.xpath(".//div[@class='ds-table-data-cell ds-dex-table-row-col-token']/div[@class='ds-dex-table-row-base-token-name']/span/text()[1]").get()
-            
-            # Extract the asset URL
-            asset_url = "https://dexscreener.com" + res.xpath("./@href").get()
-
-            # Extract the 24-hour gain rank
-            asset_gain_rank_raw = res.xpath(".//span[@class='ds-dex-table-row-badge-pair-no']/text()[2]").get()
-            asset_gain_rank = helper_treat_none_before_data_type_change(value=asset_gain_rank_raw, data_type="int")
-            
-            # Extract the network
-            asset_network = res.xpath("./div[@class='ds-table-data-cell ds-dex-table-row-col-token']/img[@class='ds-dex-table-row-chain-icon']/@title").get()
-
-            # Extract the DEX
-            dex = res.xpath("./div[@class='ds-table-data-cell ds-dex-table-row-col-token']/img[@class='ds-dex-table-row-dex-icon']/@title").get()
-            
-            # Extract the latest price in dollars
-            asset_price_raw = res.xpath("./div[@class='ds-table-data-cell ds-dex-table-row-col-price']/text()[2]").get()
-            if asset_price_raw is not None:
-                asset_price = re.sub(pattern=",", repl="", string=asset_price_raw)
-                asset_price = helper_treat_none_before_data_type_change(value=asset_price, data_type="float")
-            
-            # Extract the asset age in hours
-            asset_age = res.xpath("./div[@class='ds-table-data-cell ds-dex-table-row-col-pair-age']/span/text()").get()
-            
-            # Extract the asset's number of transactions in the last 24 hours
-            asset_24_hr_txns_raw = res.xpath("./div[@class='ds-table-data-cell ds-dex-table-row-col-txns']/text()").get()
-            asset_24_hr_txns = helper_treat_none_before_data_type_change(value=re.sub(pattern=",", repl="", string=asset_24_hr_txns_raw), data_type="int")
-            
-            # Extract the asset's volume in the last 24 hours
-            asset_24_hr_volume_in_mil_raw = res.xpath("./div[@class='ds-table-data-cell ds-dex-table-row-col-volume']/text()[2]").get()
-            asset_24_hr_volume_in_mil = helper_normalize_numbers_in_vol_liq_mcap(value=asset_24_hr_volume_in_mil_raw)
-            
-            # Extract the asset's volume in the last 24 hours
-            num_makers_raw = res.xpath("./div[@class='ds-table-data-cell ds-dex-table-row-col-makers']/text()").get()
-            num_makers = helper_treat_none_before_data_type_change(value=re.sub(pattern=",", repl="", string=num_makers_raw), data_type="int")
-            
-            # Extract the asset's price change in the last 5 minutes
-            asset_price_change_l5m_raw = res.xpath("./div[@class='ds-table-data-cell ds-dex-table-row-col-price-change-m5']/span/text()").get()
-            asset_price_change_l5m = helper_normalize_numbers_in_pct_gains(value=asset_price_change_l5m_raw)
-            
-            # Extract the asset's price change in the last hour
-            asset_price_change_l1h_raw = res.xpath("./div[@class='ds-table-data-cell ds-dex-table-row-col-price-change-h1']/span/text()").get()
-            asset_price_change_l1h = helper_normalize_numbers_in_pct_gains(value=asset_price_change_l1h_raw)
-            
-            # Extract the asset's price change in the last 6 hours
-            asset_price_change_l6h_raw = res.xpath("./div[@class='ds-table-data-cell ds-dex-table-row-col-price-change-h6']/span/text()").get()
-            asset_price_change_l6h = helper_normalize_numbers_in_pct_gains(value=asset_price_change_l6h_raw)
-            
-            # Extract the asset's price change in the last 24 hours
-            asset_price_change_l24h_raw = res.xpath("./div[@class='ds-table-data-cell ds-dex-table-row-col-price-change-h24']/span/text()").get()
-            asset_price_change_l24h = helper_normalize_numbers_in_pct_gains(value=asset_price_change_l24h_raw)
-            
-            # Extract the asset's liquidity
-            asset_liquidity_in_mil_raw = res.xpath("./div[@class='ds-table-data-cell ds-dex-table-row-col-liquidity']/text()[2]").get()
-            asset_liquidity_in_mil = helper_normalize_numbers_in_vol_liq_mcap(value=asset_liquidity_in_mil_raw)
-            
-            # Extract the asset's market cap
-            asset_market_cap_in_mil_raw = res.xpath("./div[@class='ds-table-data-cell ds-dex-table-row-col-market-cap']/text()[2]").get()
-            asset_market_cap_in_mil = helper_normalize_numbers_in_vol_liq_mcap(value=asset_market_cap_in_mil_raw)
-
-            # Yield the output dictionary
-            output_dict = {
-                "asset_name": asset_name,
-                "asset_name_text": asset_name_text,
-                "asset_url": asset_url,
-                "asset_gain_rank_raw": asset_gain_rank_raw,
-                "asset_gain_rank": asset_gain_rank,
-                "asset_network": asset_network,
-                "dex": dex,
-                "asset_price_raw": asset_price_raw,
-                "asset_price": asset_price,
-                "asset_age": asset_age,
-                "asset_24_hr_txns_raw": asset_24_hr_txns_raw,
-                "asset_24_hr_txns": asset_24_hr_txns,
-                "asset_24_hr_volume_in_mil_raw": asset_24_hr_volume_in_mil_raw,
-                "asset_24_hr_volume_in_mil": asset_24_hr_volume_in_mil,
-                "num_makers_raw": num_makers_raw,
-                "num_makers": num_makers,
-                "asset_price_change_l5m_raw": asset_price_change_l5m_raw,
-                "asset_price_change_l1h_raw": asset_price_change_l1h_raw,
-                "asset_price_change_l6h_raw": asset_price_change_l6h_raw,
-                "asset_price_change_l24h_raw": asset_price_change_l24h_raw,
-                "asset_price_change_l5m": asset_price_change_l5m,
-                "asset_price_change_l1h": asset_price_change_l1h,
-                "asset_price_change_l6h": asset_price_change_l6h,
-                "asset_price_change_l24h": asset_price_change_l24h,
-                "asset_liquidity_in_mil_raw": asset_liquidity_in_mil_raw,
-                "asset_liquidity_in_mil": asset_liquidity_in_mil,
-                "asset_market_cap_in_mil_raw": asset_market_cap_in_mil_raw,
-                "asset_market_cap_in_mil": asset_market_cap_in_mil
-            }
-
-            yield output_dict
\ No newline at end of file
+        # Extract all the fields of each row in one pass, in a worker process when the parse pool is enabled, with the raw strings only when debugging
+        keep_raw = self.settings.getbool("KEEP_RAW_FIELDS")
+        parse_pool = getattr(self, "parse_pool", None)
+        if parse_pool is not None:
+            return parse_pool.extract_items("top_gainers_plan", response, keep_raw=keep_raw)
+        return self.top_gainers_plan.extract_row_items(response, keep_raw=keep_raw)
@@ -2,147 +2,124 @@
 import scrapy
 from wallet_analyzer.inputs import custom_scrapy_settings  # Импорт ПЕРЕД использованием
 from wallet_analyzer.helper_functions import *
-import json
-import pandas as pd
+from wallet_analyzer.extraction import ExtractionPlan, FieldSpec
+from wallet_analyzer.items import DexScreenerTopTraders
+from wallet_analyzer.structured_logging import helper_log_event
+
+# The anchor keys of the bought and sold cells of a top traders row
+BOUGHT_CELL = "chakra-text custom-rcecxm"
+SOLD_CELL = "chakra-text custom-dv3t8y"
 
 class DexScreenerTopTradersSpider(scrapy.Spider):
     name = "dex_screener_top_traders"
     custom_settings = custom_scrapy_settings.copy() # Define the custom settings of the spider
     custom_settings["LOG_FILE"] = "dex_screener_top_traders.log"
+    custom_settings["HTTPCACHE_EXPIRATION_SECS"] = 900 # The top traders of a pair change within a quarter of an hour
     custom_settings["FEEDS"] = {
-        'dex_screener_top_traders.json': {
-            'format': 'json',
+        'dex_screener_top_traders.jsonl': {
+            'format': 'jsonlines',
             'overwrite': True
         }
     }
-    
+    if pa is not None: # Also export a columnar feed when pyarrow is installed, for the column-wise readers
+        custom_settings["FEEDS"]['dex_screener_top_traders.parquet'] = {
+            'format': 'parquet',
+            'overwrite': True
+        }
+    readiness_xpath = "//span[text() = 'bought']" # Only present once the page has been fully loaded, checked by the page readiness middleware
+    readiness_marker = ">bought<" # A substring of the readiness node, looked for instead of evaluating the XPath when the pages are parsed by the parse pool
+    chained = False # Set by the chained pipeline runner, which schedules the requests as the top gainers are scraped
+
+    # The fields of each top traders row. The bought and sold cells of a row are anchored once, by their class
+    top_traders_plan = ExtractionPlan(
+        row_xpath="//span[text() = 'bought']/../../following-sibling::div",
+        anchor_xpath=f".//span[@class='{BOUGHT_CELL}' or @class='{SOLD_CELL}']",
+        anchor_key_xpath="string(@class)",
+        fields=[
+            FieldSpec("trader_bought_usd", "./text()", helper_normalize_numbers_in_txn_data, anchor=BOUGHT_CELL),
+            FieldSpec("trader_bought_crypto", "./following-sibling::span/span[1]/text()", helper_normalize_numbers_in_txn_data, anchor=BOUGHT_CELL),
+            FieldSpec("trader_buy_txns", "./following-sibling::span/span[3]/text()", helper_normalize_integer, anchor=BOUGHT_CELL),
+            FieldSpec("trader_sold_usd", "./text()", helper_normalize_numbers_in_txn_data, anchor=SOLD_CELL),
+            FieldSpec("trader_sold_crypto", "./following-sibling::span/span[1]/text()", helper_normalize_numbers_in_txn_data, anchor=SOLD_CELL),
+            FieldSpec("trader_sell_txns", "./following-sibling::span/span[3]/text()", helper_normalize_integer, anchor=SOLD_CELL),
+            FieldSpec("trader_pnl", ".//div[@class='custom-1e9y0rl']/text()", helper_normalize_numbers_in_txn_data),
+            FieldSpec("sol_scan_url", ".//a[@aria-label='Open in block explorer']/@href"),
+            FieldSpec("wallet_address", source="sol_scan_url", normalizer=helper_extract_wallet_address, keep_raw=False),
+        ],
+        item_cls=DexScreenerTopTraders
+    )
+
     def start_requests(self):
-        # Open the JSON file dex_screener_top_gainers.json
-        self.logger.info("Opening the JSON file dex_screener_top_gainers.json")
-        with open("dex_screener_top_gainers.json", "r") as f:
-            # Load the JSON file
-            df_top_gainers = json.load(f)
-        
-            # Change the top_gainers to a pandas data frame
-            df_top_gainers = pd.DataFrame(df_top_gainers)
+        # In chained mode, the requests are scheduled by the upstream top gainers spider
+        if self.chained:
+            return
+
+        # Stream the JSON Lines file dex_screener_top_gainers.jsonl one top gainer at a time
+        self.logger.info("Streaming the JSON Lines file dex_screener_top_gainers.jsonl")
+        for top_gainer in helper_stream_json_lines("dex_screener_top_gainers.jsonl"):
+            asset_name = top_gainer["asset_name"]
+            asset_url = top_gainer["asset_url"]
 
-        # Send a request to each individual asset URL
-        for asset_name, asset_url in zip(df_top_gainers["asset_name"], df_top_gainers["asset_url"]):
             # Send a request to the asset URL
-            self.logger.info(f"Sending a request to the asset name {asset_name} with URL: {asset_url}")
-            yield scrapy.Request(
-                url=asset_url,
-                callback=self.parse_top_traders,
-                meta={
-                    "zyte_api_automap": {
-                        "browserHtml": True,
-                        "javascript": True,
-                        "actions": [
-                            # Wait for the Top Traders Button
-                            {
-                                "action": "waitForSelector",
-                                "timeout": 10,
-                                "onError": "return",
-                                "selector": {
-                                    "type": "xpath",
-                                    "value": "//button[text() = 'Top Traders']",
-                                    "state": "attached"
-                                }
-                            },
-                            # Click on the Top Traders Button
-                            {
-                                "action": "click",
-                                "delay": 0,
-                                "button": "left",
-                                "onError": "return",
-                                "selector": {
-                                    "type": "xpath",
-                                    "value": "//button[text() = 'Top Traders']",
-                                    "state": "attached"
-                                }
-                            },
-                        ]
-                    },
+            helper_log_event(self, "asset_request", sample_key=asset_url, asset_name=asset_name, asset_url=asset_url)
+            yield self.build_top_traders_request(asset_name=asset_name, asset_url=asset_url)
+
+    def build_top_traders_request(self, asset_name, asset_url, refresh=False):
+        # Build the request that renders the Top Traders tab of the asset. A refresh (of a pair already scraped by the
+        # polling chained runner) bypasses the HTTP cache and the duplicate filter
+        return scrapy.Request(
+            url=asset_url,
+            callback=self.parse_top_traders,
+            meta={
+                "zyte_api_automap": {
+                    "browserHtml": True,
+                    "javascript": True,
+                    "actions": [
+                        # Wait for the Top Traders Button
+                        {
+                            "action": "waitForSelector",
+                            "timeout": 10,
+                            "onError": "return",
+                            "selector": {
+                                "type": "xpath",
+                                "value": "//button[text() = 'Top Traders']",
+                                "state": "attached"
+                            }
+                        },
+                        # Click on the Top Traders Button
+                        {
+                            "action": "click",
+                            "delay": 0,
+                            "button": "left",
+                            "onError": "return",
+                            "selector": {
+                                "type": "xpath",
+                                "value": "//button[text() = 'Top Traders']",
+                                "state": "attached"
+                            }
+                        },
+                    ]
+                },
 
-                    # Meta data
-                    "asset_name": asset_name,
-                    "asset_url": asset_url
-                }
-            )
+                # Meta data
+                "asset_name": asset_name,
+                "asset_url": asset_url,
+                "dont_cache": refresh
+            },
+            dont_filter=refresh
+        )
 
     def parse_top_traders(self, response):
         # Log a status message
-        self.logger.info(f"Parsing the response of the asset {response.meta['asset_name']} with URL {response.meta['asset_url']}")
+        helper_log_event(self, "asset_parsed", sample_key=response.meta["asset_url"], asset_name=response.meta["asset_name"], asset_url=response.meta["asset_url"])
         
-        # Extract the top traders list of results
-        top_trader_results = response.xpath("//span[text() = 'bought']/../../following-sibling::div")
-
         # Extract the meta data
         asset_name = response.meta["asset_name"]
         asset_url = response.meta["asset_url"]
 
-        # Parse the response
-        for tr in top_trader_results:
-            # Extract the trader bought amount in USD
-            trader_bought_usd_raw = tr.xpath(".//span[@class='chakra-text custom-rcecxm']/text()").get()
-            trader_bought_usd = helper_normalize_numbers_in_txn_data(value=trader_bought_usd_raw)
-
-            # Extract the trader bought amount in crypto units
-            trader_bought_crypto_raw = tr.xpath(".//span[@class='chakra-text custom-rcecxm']/following-sibling::span/span[1]/text()").get()
-            trader_bought_crypto = helper_normalize_numbers_in_txn_data(value=trader_bought_crypto_raw)
-            
-            # Extract the number of buy TXNs
-            trader_buy_txns_raw = tr.xpath(".//span[@class='chakra-text custom-rcecxm']/following-sibling::span/span[3]/text()").get()
-            trader_buy_txns = helper_normalize_numbers_in_txn_data(value=trader_buy_txns_raw)
-            trader_buy_txns = helper_treat_none_before_data_type_change(value=trader_buy_txns, data_type="int")
-
-            # Extract the trader sold amount in USD
-            trader_sold_usd_raw = tr.xpath(".//span[@class='chakra-text custom-dv3t8y']/text()").get()
-            trader_sold_usd = helper_normalize_numbers_in_txn_data(value=trader_sold_usd_raw)
-            
-            # Extract the trader sold amount in crypto units
-            trader_sold_crypto_raw = tr.xpath(".//span[@class='chakra-text custom-dv3t8y']/following-sibling::span/span[1]/text()").get()
-            trader_sold_crypto = helper_normalize_numbers_in_txn_data(value=trader_sold_crypto_raw)
-            
-            # Extract the number of sell TXNs
-            trader_sell_txns_raw = tr.xpath(".//span[@class='chakra-text custom-dv3t8y']/following-sibling::span/span[3]/text()").get()
-            trader_sell_txns = helper_normalize_numbers_in_txn_data(value=trader_sell_txns_raw)
-            trader_sell_txns = helper_treat_none_before_data_type_change(value=trader_sell_txns, data_type="int")
-            
-            # Extract the PnL
-            trader_pnl_raw = tr.xpath(".//div[@class='custom-1e9y0rl']/text()").get()
-            trader_pnl = helper_normalize_numbers_in_txn_data(value=trader_pnl_raw)
-
-            # Extract the SOL scan URL
-            sol_scan_url = tr.xpath(".//a[@aria-label='Open in block explorer']/@href").get()
-
-            # Extract the wallet_address
-            if sol_scan_url is not None:
-                wallet_address = re.findall(pattern=r"(?<=account\/).*", string=sol_scan_url)[0]
-            else:
-                wallet_address = None
-
-            # Yield the output dictionary
-            output_dict = {
-                "asset_name": asset_name,
-                "asset_url": asset_url,
-                "trader_bought_usd_raw": trader_bought_usd_raw,
-                "trader_bought_usd": trader_bought_usd,
-                "trader_bought_crypto_raw": trader_bought_crypto_raw,
-                "trader_bought_crypto": trader_bought_crypto,
-                "trader_buy_txns_raw": trader_buy_txns_raw,
-                "trader_buy_txns": trader_buy_txns,
-                "trader_sold_usd_raw": trader_sold_usd_raw,
-                "trader_sold_usd_raw": trader_sold_usd_raw,
-                "trader_sold_usd": trader_sold_usd,
-                "trader_sold_crypto_raw": trader_sold_crypto_raw,
-                "trader_sold_crypto": trader_sold_crypto,
-                "trader_sell_txns_raw": trader_sell_txns_raw,
-                "trader_sell_txns": trader_sell_txns,
-                "trader_pnl_raw": trader_pnl_raw,
-                "trader_pnl": trader_pnl,
-                "sol_scan_url": sol_scan_url,
-                "wallet_address": wallet_address
-            }
-
-            yield output_dict
\ No newline at end of file
+        # Extract all the fields of each trader in one pass, in a worker process when the parse pool is enabled, with the raw strings only when debugging
+        keep_raw = self.settings.getbool("KEEP_RAW_FIELDS")
+        parse_pool = getattr(self, "parse_pool", None)
+        if parse_pool is not None:
+            return parse_pool.extract_items("top_traders_plan", response, keep_raw=keep_raw, asset_name=asset_name, asset_url=asset_url)
+        return self.top_traders_plan.extract_row_items(response, keep_raw=keep_raw, asset_name=asset_name, asset_url=asset_url)
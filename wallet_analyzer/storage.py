@@ -0,0 +1,181 @@
+# Import packages
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from dataclasses import fields
+from typing import Dict, List, Optional, Sequence, get_args, get_type_hints
+
+from wallet_analyzer.items import DexCheckWalletScreener, DexScreenerTopGainers, DexScreenerTopTraders, GmgnAiWalletScreener
+
+logger = logging.getLogger(__name__)
+
+## Tables
+def helper_sqlite_type(type_hint) -> str:
+    """
+    A function to map the type hint of an item field (e.g. Optional[float]) to the SQLite column type.
+    """
+    types = [arg for arg in get_args(type_hint) if arg is not type(None)] or [type_hint]
+    return {int: "INTEGER", float: "REAL", str: "TEXT"}.get(types[0], "TEXT")
+
+class StorageTable:
+    """
+    A history table of one or more item types, with one row per key and run. Its columns are the fields of the item dataclasses, so that
+    the items of several sources with overlapping fields (e.g. the DexCheck and GMGN wallet stats) share one table.
+    """
+
+    def __init__(self, name: str, item_classes: Sequence[type], key_columns: Sequence[str], index_columns: Sequence[str] = ()):
+        self.name = name
+        self.item_classes = tuple(item_classes)
+        self.key_columns = [*key_columns, "run_id"]
+        self.index_columns = index_columns
+        self.field_names = []
+        self.column_types = {}
+        for item_cls in item_classes:
+            hints = get_type_hints(item_cls)
+            for field in fields(item_cls):
+                if field.name not in self.column_types:
+                    self.field_names.append(field.name)
+                    self.column_types[field.name] = helper_sqlite_type(hints[field.name])
+        self.columns = [*self.field_names, "source", "run_id"]
+        self.upsert_sql = self.upsert_statement()
+
+    def create_statements(self) -> List[str]:
+        column_definitions = ", ".join(f"{column} {self.column_types.get(column, 'TEXT')}" for column in self.columns)
+        statements = [f"CREATE TABLE IF NOT EXISTS {self.name} ({column_definitions}, PRIMARY KEY ({', '.join(self.key_columns)}))"]
+        for column in self.index_columns:
+            statements.append(f"CREATE INDEX IF NOT EXISTS {self.name}_{column} ON {self.name} ({column})")
+        return statements
+
+    def upsert_statement(self) -> str:
+        updates = ", ".join(f"{column} = excluded.{column}" for column in self.columns if column not in self.key_columns)
+        return (
+            f"INSERT INTO {self.name} ({', '.join(self.columns)}) VALUES ({', '.join('?' * len(self.columns))}) "
+            f"ON CONFLICT ({', '.join(self.key_columns)}) DO UPDATE SET {updates}"
+        )
+
+    def row(self, item, source: str, run_id: str) -> tuple:
+        # The raw fields of the debugging items (<field>_raw) are not stored
+        return (*(getattr(item, field_name, None) for field_name in self.field_names), source, run_id)
+
+STORAGE_TABLES = [
+    StorageTable("top_gainers", [DexScreenerTopGainers], key_columns=["asset_url"], index_columns=["asset_name"]),
+    StorageTable("top_traders", [DexScreenerTopTraders], key_columns=["asset_url", "wallet_address"], index_columns=["wallet_address", "asset_name"]),
+    StorageTable("wallet_stats", [DexCheckWalletScreener, GmgnAiWalletScreener], key_columns=["wallet_address", "source"], index_columns=["wallet_address"]),
+]
+
+def helper_storage_table(item, tables: Sequence[StorageTable] = STORAGE_TABLES) -> Optional[StorageTable]:
+    """
+    A function to find the table of an item, including the debugging items with raw fields, which subclass the item dataclasses.
+    """
+    for table in tables:
+        if isinstance(item, table.item_classes):
+            return table
+    return None
+
+def helper_create_tables(connection: sqlite3.Connection, tables: Sequence[StorageTable] = STORAGE_TABLES) -> None:
+    """
+    A function to create the run and history tables, and their indexes, if they do not exist yet.
+    """
+    connection.execute("CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, spider TEXT NOT NULL, started_at REAL NOT NULL, finished_at REAL)")
+    connection.execute("CREATE INDEX IF NOT EXISTS runs_spider_started_at ON runs (spider, started_at)")
+    for table in tables:
+        for statement in table.create_statements():
+            connection.execute(statement)
+    connection.commit()
+
+## Writer
+class SQLiteHistoryWriter(threading.Thread):
+    """
+    Writes the rows of a run to the SQLite history database in a thread of its own, so that the reactor never waits for the database.
+    The rows are queued, and upserted with executemany, one transaction per batch, once batch_size rows are waiting or flush_secs have passed.
+    """
+
+    _STOP = object()
+
+    def __init__(self, path: str, run_id: str, spider_name: str, batch_size: int = 1000, flush_secs: float = 2.0):
+        super().__init__(name=f"sqlite-history-{spider_name}", daemon=True)
+        self.path = path
+        self.run_id = run_id
+        self.spider_name = spider_name
+        self.batch_size = batch_size
+        self.flush_secs = flush_secs
+        self.rows = queue.SimpleQueue()
+        self.num_rows_written = 0
+        self.num_batches = 0
+        self.error = None
+
+    def put(self, table: StorageTable, row: tuple) -> None:
+        self.rows.put((table, row))
+
+    def stop(self) -> None:
+        """
+        Write the waiting rows and close the database. Blocks until done, so call it from a thread (e.g. with deferToThread).
+        """
+        self.rows.put(self._STOP)
+        self.join()
+
+    def run(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            helper_create_tables(connection)
+            connection.execute("INSERT OR REPLACE INTO runs (run_id, spider, started_at) VALUES (?, ?, ?)", (self.run_id, self.spider_name, time.time()))
+            connection.commit()
+
+            # Wait for the rows, at most flush_secs after the first waiting row
+            batches: Dict[StorageTable, List[tuple]] = {}
+            num_waiting, first_waiting_at = 0, None
+            while True:
+                try:
+                    entry = self.rows.get(timeout=None if first_waiting_at is None else max(0.0, first_waiting_at + self.flush_secs - time.monotonic()))
+                except queue.Empty:
+                    entry = None
+                if entry is self._STOP:
+                    break
+                if entry is not None:
+                    table, row = entry
+                    batches.setdefault(table, []).append(row)
+                    num_waiting += 1
+                    first_waiting_at = first_waiting_at or time.monotonic()
+                if num_waiting >= self.batch_size or (num_waiting and time.monotonic() - first_waiting_at >= self.flush_secs):
+                    self.flush(connection, batches)
+                    batches, num_waiting, first_waiting_at = {}, 0, None
+            if num_waiting:
+                self.flush(connection, batches)
+
+            connection.execute("UPDATE runs SET finished_at = ? WHERE run_id = ?", (time.time(), self.run_id))
+            connection.commit()
+        except Exception as exc:
+            self.error = exc
+            logger.exception(f"The SQLite history writer of {self.spider_name} failed")
+        finally:
+            connection.close()
+
+    def flush(self, connection: sqlite3.Connection, batches: Dict[StorageTable, List[tuple]]) -> None:
+        with connection:
+            for table, rows in batches.items():
+                connection.executemany(table.upsert_sql, rows)
+                self.num_rows_written += len(rows)
+        self.num_batches += 1
+
+## Queries
+def load_wallet_history(path: str, wallet_address: str, num_runs: int = 30) -> List[dict]:
+    """
+    A function to load the stats of a wallet from its last num_runs screening runs (per source), most recent first.
+    """
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    try:
+        rows = connection.execute(
+            "SELECT * FROM ("
+            "SELECT wallet_stats.*, runs.started_at, ROW_NUMBER() OVER (PARTITION BY wallet_stats.source ORDER BY runs.started_at DESC) AS run_rank "
+            "FROM wallet_stats JOIN runs USING (run_id) WHERE wallet_stats.wallet_address = ?"
+            ") WHERE run_rank <= ? ORDER BY started_at DESC",
+            (wallet_address, num_runs)
+        ).fetchall()
+    finally:
+        connection.close()
+    return [dict(row) for row in rows]
@@ -0,0 +1,85 @@
+# Import packages
+import logging
+import zlib
+from collections import deque
+from typing import Any, List, Optional, Tuple
+
+from wallet_analyzer.helper_functions import helper_json_dumps
+
+## Structured events
+class StructuredMessage:
+    """
+    A log event with named fields, rendered as a logfmt line (e.g. "event=wallet_parsed wallet_address=5Q54... wallet_count=3"),
+    with the lists and dicts as compact JSON.
+    The line is only built if a handler actually emits the record, so filtered out events cost almost nothing.
+    """
+    __slots__ = ("event", "fields")
+
+    def __init__(self, event: str, fields: dict):
+        self.event = event
+        self.fields = fields
+
+    def __str__(self) -> str:
+        parts = [f"event={self.event}"]
+        for key, value in self.fields.items():
+            if isinstance(value, (list, dict)):
+                # Compact JSON, written as is
+                parts.append(f"{key}={helper_json_dumps(value).decode('utf-8')}")
+                continue
+            if isinstance(value, float):
+                value = f"{value:.6g}"
+            else:
+                value = str(value)
+            if not value or " " in value or '"' in value:
+                value = '"' + value.replace('"', '\\"') + '"'
+            parts.append(f"{key}={value}")
+        return " ".join(parts)
+
+def helper_log_event(spider, event: str, level: int = logging.INFO, sample_key: Optional[str] = None, **fields: Any) -> None:
+    """
+    A function to log a structured event with the spider's logger. The per-request events pass their request's key (e.g. the wallet address) as sample_key, so that in production mode only a sample of the requests is logged, always the same ones.
+    """
+    logger = spider.logger
+    if not logger.isEnabledFor(level):
+        return
+    log_sampler = getattr(spider, "log_sampler", None)
+    if sample_key is not None and log_sampler is not None and not log_sampler.sample(sample_key):
+        return
+    logger.log(level, StructuredMessage(event, fields))
+
+## Sampling
+class RequestLogSampler:
+    """
+    A deterministic sampler of the per-request events, keeping a request if the hash of its key falls within the sample rate.
+    """
+
+    def __init__(self, rate: float):
+        self.threshold = int(max(0.0, min(1.0, rate)) * pow(2, 32))
+
+    def sample(self, key: str) -> bool:
+        return zlib.crc32(key.encode("utf-8")) < self.threshold
+
+## Zyte API action logs
+class ActionLogRingBuffer:
+    """
+    A bounded buffer of the latest Zyte API action logs, one entry per browser-rendered response, so that the full action
+    logs of a page can still be written once the page turns out to be incomplete or its request fails, without logging
+    the action logs of every page.
+    """
+
+    def __init__(self, size: int):
+        self.entries = deque(maxlen=size) # (url, attempt, actions)
+        self.num_flushed = 0
+
+    def record(self, url: str, attempt: int, actions: Optional[list]) -> None:
+        self.entries.append((url, attempt, actions))
+
+    def flush(self, url: str) -> List[Tuple[int, Optional[list]]]:
+        """
+        Remove and return the buffered (attempt, actions) entries of a URL, oldest first.
+        """
+        flushed = [(attempt, actions) for entry_url, attempt, actions in self.entries if entry_url == url]
+        if flushed:
+            self.entries = deque((entry for entry in self.entries if entry[0] != url), maxlen=self.entries.maxlen)
+            self.num_flushed += len(flushed)
+        return flushed
@@ -0,0 +1,221 @@
+# Import packages
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from wallet_analyzer.helper_functions import helper_json_dumps, helper_json_loads
+
+logger = logging.getLogger(__name__)
+
+## Wallet profile store
+class WalletProfileStore:
+    """
+    An incremental join of the wallet screeners' results into one profile per wallet, kept in a SQLite database shared by the spiders,
+    whether they run in the same process (chained) or in separate ones.
+    Each source (wallet screener) upserts its partial record of a wallet, and the profile is completed (and upserted) as soon as every
+    source has reported, with the wallet's positions from the top traders spider attached as trader-level PnL context.
+    Only the parts and positions updated within the last max_part_age_secs count (0 keeps them all), so that the records of earlier runs
+    neither complete a profile nor add to its trader-level PnL. The older positions are pruned when the store is opened.
+    """
+
+    def __init__(self, path: str, sources: Dict[str, str], max_part_age_secs: float = 0):
+        self.path = path
+        self.sources = sources # Spider name -> source name, which prefixes the source's fields in the profiles
+        self.max_part_age_secs = max_part_age_secs
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None) # The transactions are explicit
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS trader_positions ("
+            "wallet_address TEXT NOT NULL, asset_url TEXT NOT NULL, asset_name TEXT, trader_pnl REAL, "
+            "trader_bought_usd REAL, trader_sold_usd REAL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (wallet_address, asset_url)) WITHOUT ROWID"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS wallet_profile_parts ("
+            "wallet_address TEXT NOT NULL, source TEXT NOT NULL, record TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (wallet_address, source)) WITHOUT ROWID"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS wallet_profiles ("
+            "wallet_address TEXT PRIMARY KEY, profile TEXT NOT NULL, completed_at REAL NOT NULL) WITHOUT ROWID"
+        )
+        if self.max_part_age_secs > 0:
+            self.connection.execute("DELETE FROM trader_positions WHERE updated_at < ?", (time.time() - self.max_part_age_secs,))
+
+    def fresh_since(self, now: float) -> float:
+        # The oldest update time of the parts and positions that still count
+        return now - self.max_part_age_secs if self.max_part_age_secs > 0 else float("-inf")
+
+    def add_positions(self, positions: Sequence[tuple]) -> None:
+        """
+        Upsert the positions of top traders in assets, as (wallet address, asset URL, asset name, PnL, bought USD, sold USD, updated at) tuples,
+        in one transaction, so that re-scraping an asset does not count it twice.
+        """
+        self.connection.execute("BEGIN")
+        try:
+            self.connection.executemany(
+                "INSERT INTO trader_positions (wallet_address, asset_url, asset_name, trader_pnl, trader_bought_usd, trader_sold_usd, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (wallet_address, asset_url) DO UPDATE SET "
+                "asset_name = excluded.asset_name, trader_pnl = excluded.trader_pnl, trader_bought_usd = excluded.trader_bought_usd, "
+                "trader_sold_usd = excluded.trader_sold_usd, updated_at = excluded.updated_at",
+                positions
+            )
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def trader_context(self, wallet_address: str, since: float) -> dict:
+        """
+        The trader-level PnL context of a wallet, aggregated over the assets it was a top trader of, from the positions updated since a time.
+        """
+        num_assets, tot_trader_pnl, tot_bought_usd, tot_sold_usd, best_trader_pnl = self.connection.execute(
+            "SELECT COUNT(*), SUM(trader_pnl), SUM(trader_bought_usd), SUM(trader_sold_usd), MAX(trader_pnl) "
+            "FROM trader_positions WHERE wallet_address = ? AND updated_at >= ?", (wallet_address, since)
+        ).fetchone()
+        best_asset = self.connection.execute(
+            "SELECT asset_name FROM trader_positions WHERE wallet_address = ? AND updated_at >= ? ORDER BY trader_pnl DESC LIMIT 1", (wallet_address, since)
+        ).fetchone()
+        return {
+            "num_assets_traded": num_assets,
+            "tot_trader_pnl": tot_trader_pnl,
+            "tot_trader_bought_usd": tot_bought_usd,
+            "tot_trader_sold_usd": tot_sold_usd,
+            "best_trader_pnl": best_trader_pnl,
+            "best_asset_name": best_asset[0] if best_asset is not None else None
+        }
+
+    def merge(self, parts: Sequence[Tuple[str, str, Mapping]]) -> List[dict]:
+        """
+        Upsert the partial records of wallets, as (wallet address, source, record) tuples, in one transaction. Returns the profiles of the wallets
+        whose sources have now all reported within the freshness window.
+        The transaction is taken before the reads, so that when two processes report the last sources concurrently, the later one completes the profile.
+        """
+        now = time.time()
+        since = self.fresh_since(now)
+        profiles = []
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.connection.executemany(
+                "INSERT INTO wallet_profile_parts (wallet_address, source, record, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (wallet_address, source) DO UPDATE SET record = excluded.record, updated_at = excluded.updated_at",
+                [(wallet_address, source, helper_json_dumps(dict(record)).decode("utf-8"), now) for wallet_address, source, record in parts]
+            )
+            for wallet_address in dict.fromkeys(wallet_address for wallet_address, _, _ in parts):
+                records = {
+                    part_source: helper_json_loads(part_record)
+                    for part_source, part_record in self.connection.execute(
+                        "SELECT source, record FROM wallet_profile_parts WHERE wallet_address = ? AND updated_at >= ?", (wallet_address, since)
+                    )
+                }
+                if not set(self.sources.values()) <= records.keys():
+                    continue
+
+                # Prefix the fields of each source, in the order of the sources
+                profile = {"wallet_address": wallet_address}
+                for part_source in self.sources.values():
+                    for field_name, value in records[part_source].items():
+                        profile[f"{part_source}_{field_name}"] = value
+                profile.update(self.trader_context(wallet_address, since))
+                profile["profiled_at"] = now
+                self.connection.execute(
+                    "INSERT INTO wallet_profiles (wallet_address, profile, completed_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (wallet_address) DO UPDATE SET profile = excluded.profile, completed_at = excluded.completed_at",
+                    (wallet_address, helper_json_dumps(profile).decode("utf-8"), now)
+                )
+                profiles.append(profile)
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return profiles
+
+    def close(self) -> None:
+        self.connection.close()
+
+## Writer thread
+class WalletProfileWriter(threading.Thread):
+    """
+    Writes the positions and partial records of a spider to the wallet profile store in a thread of its own, so that the reactor never waits for the
+    database (or for the lock of another process writing to it). They are queued, and written one transaction per batch, once batch_size of them
+    are waiting or flush_secs have passed. The completed profiles are appended to the JSON Lines stream at feed_path, if any.
+    """
+
+    _STOP = object()
+
+    def __init__(self, path: str, sources: Dict[str, str], spider_name: str, max_part_age_secs: float = 0, feed_path: Optional[str] = None,
+                 batch_size: int = 500, flush_secs: float = 2.0):
+        super().__init__(name=f"wallet-profiles-{spider_name}", daemon=True)
+        self.path = path
+        self.sources = sources
+        self.spider_name = spider_name
+        self.max_part_age_secs = max_part_age_secs
+        self.feed_path = feed_path
+        self.batch_size = batch_size
+        self.flush_secs = flush_secs
+        self.entries = queue.SimpleQueue()
+        self.num_completed = 0
+        self.error = None
+
+    def put_position(self, position: tuple) -> None:
+        self.entries.put(("position", position))
+
+    def put_part(self, wallet_address: str, source: str, record: Mapping) -> None:
+        self.entries.put(("part", (wallet_address, source, record)))
+
+    def stop(self) -> None:
+        """
+        Write the waiting entries and close the database. Blocks until done, so call it from a thread (e.g. with deferToThread).
+        """
+        self.entries.put(self._STOP)
+        self.join()
+
+    def run(self):
+        store, feed = None, None
+        try:
+            store = WalletProfileStore(self.path, self.sources, self.max_part_age_secs)
+            feed = open(self.feed_path, "ab") if self.feed_path else None
+
+            # Wait for the entries, at most flush_secs after the first waiting entry
+            batches = {"position": [], "part": []}
+            num_waiting, first_waiting_at = 0, None
+            while True:
+                try:
+                    entry = self.entries.get(timeout=None if first_waiting_at is None else max(0.0, first_waiting_at + self.flush_secs - time.monotonic()))
+                except queue.Empty:
+                    entry = None
+                if entry is self._STOP:
+                    break
+                if entry is not None:
+                    kind, value = entry
+                    batches[kind].append(value)
+                    num_waiting += 1
+                    first_waiting_at = first_waiting_at or time.monotonic()
+                if num_waiting >= self.batch_size or (num_waiting and time.monotonic() - first_waiting_at >= self.flush_secs):
+                    self.flush(store, feed, batches)
+                    batches, num_waiting, first_waiting_at = {"position": [], "part": []}, 0, None
+            if num_waiting:
+                self.flush(store, feed, batches)
+        except Exception as exc:
+            self.error = exc
+            logger.exception(f"The wallet profile writer of {self.spider_name} failed")
+        finally:
+            if store is not None:
+                store.close()
+            if feed is not None:
+                feed.close()
+
+    def flush(self, store: WalletProfileStore, feed, batches: Dict[str, list]) -> None:
+        # The positions first, so that the profiles completed in the same batch include them
+        if batches["position"]:
+            store.add_positions(batches["position"])
+        if batches["part"]:
+            profiles = store.merge(batches["part"])
+            self.num_completed += len(profiles)
+            if feed is not None and profiles:
+                feed.write(b"".join(helper_json_dumps(profile) + b"\n" for profile in profiles)) # One write per batch, so the lines of concurrent runs do not interleave
+                feed.flush()
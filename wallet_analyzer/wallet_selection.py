@@ -0,0 +1,169 @@
+# Import packages
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Mapping, Optional, Tuple
+import numpy as np
+
+from wallet_analyzer.helper_functions import helper_stream_columnar_batches, helper_stream_json_lines
+
+# The columns of the top traders feed used by the selection
+TRADER_COLUMNS = ["wallet_address", "trader_bought_usd", "trader_sold_usd", "trader_pnl"]
+
+## Input filtering
+def helper_is_trader_who_bought_and_sold(trader: Mapping) -> bool:
+    """
+    A function to check whether a top trader has a wallet address and both bought and sold the asset.
+    """
+    return (
+        trader.get("wallet_address") is not None
+        and trader.get("trader_bought_usd") is not None
+        and trader.get("trader_sold_usd") is not None
+    )
+
+def helper_stream_traders_who_bought_and_sold(traders: Iterable[dict]) -> Iterable[dict]:
+    """
+    A function to filter the top traders to the ones with a wallet address who both bought and sold the asset.
+    """
+    for trader in traders:
+        if helper_is_trader_who_bought_and_sold(trader):
+            yield trader
+
+## Scoring functions
+def helper_signed_log(values: np.ndarray) -> np.ndarray:
+    """
+    A function to compress values of very different magnitudes (USD amounts and percentages) onto a comparable, sign-preserving log scale.
+    """
+    return np.sign(values) * np.log1p(np.abs(values))
+
+def score_abs_pnl(trader_pnl: np.ndarray, trader_bought_usd: np.ndarray, pct_pnl_weight: float) -> np.ndarray:
+    """
+    A function to score the traders by their absolute PnL in USD.
+    """
+    return trader_pnl
+
+def score_pct_pnl(trader_pnl: np.ndarray, trader_bought_usd: np.ndarray, pct_pnl_weight: float) -> np.ndarray:
+    """
+    A function to score the traders by their percentage-based PnL.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (trader_pnl / trader_bought_usd) * 100
+
+def score_blend(trader_pnl: np.ndarray, trader_bought_usd: np.ndarray, pct_pnl_weight: float) -> np.ndarray:
+    """
+    A function to score the traders by a weighted blend of their percentage-based and absolute PnL, both on a signed log scale.
+    """
+    pct_pnl = score_pct_pnl(trader_pnl, trader_bought_usd, pct_pnl_weight)
+    return pct_pnl_weight * helper_signed_log(pct_pnl) + (1 - pct_pnl_weight) * helper_signed_log(trader_pnl)
+
+SCORING_FUNCTIONS = {
+    "abs_pnl": score_abs_pnl,
+    "pct_pnl": score_pct_pnl,
+    "blend": score_blend,
+}
+
+def helper_trader_score(trader: Mapping, scoring: str = "pct_pnl", pct_pnl_weight: float = 0.5) -> Optional[float]:
+    """
+    A function to score a single trader who bought and sold, e.g. as it is scraped by the chained runner. Returns None if the score is not finite.
+    """
+    trader_pnl = np.array([trader.get("trader_pnl")], dtype=np.float64)
+    trader_bought_usd = np.array([trader["trader_bought_usd"]], dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = SCORING_FUNCTIONS[scoring](np.nan_to_num(trader_pnl, nan=0.0), trader_bought_usd, pct_pnl_weight)[0]
+    return float(score) if np.isfinite(score) else None
+
+## Request priorities
+def helper_score_priority(trader_score: Optional[float]) -> int:
+    """
+    A function to map a trader score to a Scrapy request priority, so that the best wallets are downloaded first. The score is put on a signed log scale
+    and rounded to tenths, which keeps the order of the scores while bounding the number of priority levels, as the scheduler keeps one queue per level.
+    """
+    if trader_score is None:
+        return 0
+    return int(round(10 * float(helper_signed_log(np.array([trader_score]))[0])))
+
+## Top-K selection
+def select_top_wallets(wallet_addresses: np.ndarray, scores: np.ndarray, top_k: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    A function to select the top K unique wallets by score, in descending score order. Wallets that appear several times keep their best score.
+    Only the candidate rows are sorted: np.argpartition selects them in linear time, and the candidate pool only grows if duplicated wallets leave fewer than K unique ones.
+    """
+    # Drop the rows without a finite score
+    is_valid = np.isfinite(scores)
+    wallet_addresses, scores = wallet_addresses[is_valid], scores[is_valid]
+    num_rows = len(scores)
+    if top_k is None or top_k > num_rows:
+        top_k = num_rows
+
+    num_candidates = top_k
+    while True:
+        # Partially select the best candidate rows, then sort only those
+        if num_candidates < num_rows:
+            candidates = np.argpartition(-scores, num_candidates - 1)[:num_candidates]
+        else:
+            candidates = np.arange(num_rows)
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        # Keep the first (best) row of each wallet
+        _, first_rows = np.unique(wallet_addresses[candidates], return_index=True)
+        candidates = candidates[np.sort(first_rows)]
+        if len(candidates) >= top_k or num_candidates >= num_rows:
+            break
+        num_candidates = min(num_candidates * 2, num_rows)
+
+    candidates = candidates[:top_k]
+    return wallet_addresses[candidates], scores[candidates]
+
+## Input streaming
+def helper_stream_json_lines_trader_chunks(path: str, chunk_size: int, skip_wallet: Optional[Callable[[str], bool]]) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    A function to stream the traders who bought and sold from a JSON Lines feed as chunks of wallet address, PnL, and bought USD columns.
+    """
+    traders = helper_stream_traders_who_bought_and_sold(helper_stream_json_lines(path))
+    if skip_wallet is not None:
+        traders = (trader for trader in traders if not skip_wallet(trader["wallet_address"]))
+    while True:
+        chunk = list(islice(traders, chunk_size))
+        if not chunk:
+            break
+        wallet_addresses = np.array([trader["wallet_address"] for trader in chunk], dtype=object)
+        trader_pnl = np.array([trader.get("trader_pnl") for trader in chunk], dtype=np.float64)
+        trader_bought_usd = np.array([trader["trader_bought_usd"] for trader in chunk], dtype=np.float64)
+        yield wallet_addresses, trader_pnl, trader_bought_usd
+
+def helper_stream_columnar_trader_chunks(path: str, chunk_size: int, skip_wallet: Optional[Callable[[str], bool]]) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    A function to stream the traders who bought and sold from a Parquet or Arrow IPC feed as chunks of wallet address, PnL, and bought USD columns, reading only these columns.
+    """
+    for batch in helper_stream_columnar_batches(path, columns=TRADER_COLUMNS, batch_size=chunk_size):
+        wallet_addresses = np.array(batch["wallet_address"], dtype=object)
+        trader_bought_usd = np.array(batch["trader_bought_usd"], dtype=np.float64)
+        trader_sold_usd = np.array(batch["trader_sold_usd"], dtype=np.float64)
+        is_selected = (wallet_addresses != None) & ~np.isnan(trader_bought_usd) & ~np.isnan(trader_sold_usd)
+        if skip_wallet is not None:
+            is_selected &= np.fromiter((not (is_valid and skip_wallet(wallet_address)) for wallet_address, is_valid in zip(wallet_addresses, is_selected)), dtype=bool, count=len(wallet_addresses))
+        if is_selected.any():
+            yield wallet_addresses[is_selected], np.array(batch["trader_pnl"], dtype=np.float64)[is_selected], trader_bought_usd[is_selected]
+
+## Top-K streaming
+def stream_top_wallets(path: str, top_k: Optional[int] = 250, scoring: str = "pct_pnl", pct_pnl_weight: float = 0.5, chunk_size: int = 100000, skip_wallet: Optional[Callable[[str], bool]] = None) -> List[Tuple[str, float]]:
+    """
+    A function to stream a top traders feed (JSON Lines, or Parquet/Arrow IPC by extension) in chunks and select the top K wallets by the chosen scoring function.
+    Only the running top K wallets and one chunk are held in memory at a time. The wallets for which skip_wallet returns True are left out before the selection.
+    """
+    scoring_function = SCORING_FUNCTIONS[scoring]
+    top_wallet_addresses, top_scores = np.empty(0, dtype=object), np.empty(0, dtype=np.float64)
+    if path.endswith(".parquet") or path.endswith(".arrow"):
+        chunks = helper_stream_columnar_trader_chunks(path, chunk_size=chunk_size, skip_wallet=skip_wallet)
+    else:
+        chunks = helper_stream_json_lines_trader_chunks(path, chunk_size=chunk_size, skip_wallet=skip_wallet)
+    for wallet_addresses, trader_pnl, trader_bought_usd in chunks:
+        # Score the traders of the chunk
+        scores = scoring_function(np.nan_to_num(trader_pnl, nan=0.0), trader_bought_usd, pct_pnl_weight)
+
+        # Merge the chunk with the running top K wallets
+        top_wallet_addresses, top_scores = select_top_wallets(
+            wallet_addresses=np.concatenate([top_wallet_addresses, wallet_addresses]),
+            scores=np.concatenate([top_scores, scores]),
+            top_k=top_k
+        )
+
+    return list(zip(top_wallet_addresses.tolist(), top_scores.tolist()))
@@ -0,0 +1,220 @@
+# A local stand-in for the Zyte API extract endpoint, for offline load and retry testing without spending credits
+#
+# Usage, from the directory that contains scrapy.cfg:
+#     python -m wallet_analyzer.zyte_api_stand_in --port 8899 --latency lognormal --latency-mean 2 --error-rate-521 0.05
+#
+# Then point the spiders at it through the ZYTE_API_URL setting (or environment variable), with any API key:
+#     ZYTE_API_URL=http://127.0.0.1:8899/v1/ ZYTE_API_KEY=stand-in scrapy crawl dex_screener_top_gainers
+#
+# The stand-in speaks the request and response shape of POST /v1/extract used by ScrapyZyteAPIDownloadHandler. It
+# serves the saved browserHtml fixtures of the parse benchmark (or any directory with the same file names) by target
+# site, together with a result for each requested action. Each response is delayed by a sampled latency, and 429, 500
+# and 521 errors are injected with the configured probabilities. Requests beyond the concurrency cap are rejected with
+# a 429, like the Zyte API does when the account's concurrency allowance is exceeded.
+#
+# The random draws of a request only depend on the seed, the target URL and the attempt number of that URL, so the
+# same crawl sees the same latencies and errors (hence the same retries) on every run, whatever the request order.
+# GET /stats returns the counters of the stand-in, e.g. to check the retry behavior after a load test.
+
+# Import libraries
+import argparse
+import asyncio
+import hashlib
+import math
+import os
+import random
+import re
+from base64 import b64encode
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+# The saved browserHtml fixtures of the parse benchmark
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "fixtures")
+
+# The fixture served for each target site, first match wins
+FIXTURE_ROUTES = [
+    (re.compile(r"^https?://dexscreener\.com/gainers/"), "dex_screener_top_gainers"),
+    (re.compile(r"^https?://dexscreener\.com/"), "dex_screener_top_traders"),
+    (re.compile(r"^https?://dexcheck\.ai/"), "dex_check_wallet_screener"),
+    (re.compile(r"^https?://gmgn\.ai/"), "gmgn_ai_wallet_screener"),
+]
+SOL_SCAN_ACCOUNT_PATTERN = re.compile(r"(?<=solscan\.io/account/)\w+")
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+# The error responses of the Zyte API
+ERROR_RESPONSES = {
+    429: {"type": "/limits/over-user-limit", "title": "User has too many concurrent requests", "status": 429},
+    500: {"type": "/server/internal-error", "title": "Internal Server Error", "status": 500},
+    521: {"type": "/download/internal-error", "title": "Internal Error During Download", "status": 521},
+}
+
+
+## Helper functions
+def helper_sample_latency(rng: random.Random, distribution: str, mean: float, sigma: float) -> float:
+    """
+    A function to sample a response latency in seconds from the given distribution.
+    """
+    if mean <= 0:
+        return 0.0
+    if distribution == "fixed":
+        return mean
+    if distribution == "uniform":
+        return rng.uniform(max(0.0, mean - sigma), mean + sigma)
+    if distribution == "exponential":
+        return rng.expovariate(1 / mean)
+    if distribution == "lognormal":
+        # Parametrized by its mean and the sigma of the underlying normal distribution, for a long right tail
+        return rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+    raise ValueError(f"Unknown latency distribution: {distribution}")
+
+def helper_vary_wallet_addresses(browser_html: str, url: str) -> str:
+    """
+    A function to give the top traders of each pair their own wallet addresses, derived from the pair URL, so a load test screens as many wallets as a real crawl.
+    """
+    counter = iter(range(pow(10, 9)))
+
+    def replace(match):
+        digest = hashlib.sha256(f"{url}:{next(counter)}".encode("utf-8")).digest()
+        return "".join(BASE58_ALPHABET[byte % len(BASE58_ALPHABET)] for byte in digest + digest[:12])
+
+    return SOL_SCAN_ACCOUNT_PATTERN.sub(replace, browser_html)
+
+
+class ZyteAPIStandIn:
+    def __init__(self, fixtures_dir=FIXTURES_DIR, latency="fixed", latency_mean=0.0, latency_sigma=0.5, error_rates=None, not_loaded_rate=0.0, http_not_loaded_rate=0.0, max_concurrency=0, vary_wallets=True, seed=0):
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.latency_sigma = latency_sigma
+        self.error_rates = error_rates or {} # Probability of each injected error status
+        self.not_loaded_rate = not_loaded_rate # Probability of serving the not fully loaded version of a page
+        self.http_not_loaded_rate = http_not_loaded_rate # Same, for the plain HTTP responses (e.g. pages that need JavaScript)
+        self.max_concurrency = max_concurrency # 0 means unlimited
+        self.vary_wallets = vary_wallets
+        self.seed = seed
+        self.fixtures = {}
+        self.attempts = defaultdict(int)
+        self.in_flight = 0
+        self.stats = Counter()
+
+    def load_fixture(self, name):
+        # Read each fixture once
+        if name not in self.fixtures:
+            path = os.path.join(self.fixtures_dir, f"{name}.html")
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    self.fixtures[name] = f.read()
+            else:
+                self.fixtures[name] = None
+        return self.fixtures[name]
+
+    def render(self, url, rng, not_loaded_rate):
+        # Pick the fixture of the target site, or its not fully loaded version
+        for pattern, name in FIXTURE_ROUTES:
+            if pattern.search(url):
+                break
+        else:
+            return "<html><head></head><body></body></html>"
+        browser_html = None
+        if rng.random() < not_loaded_rate:
+            browser_html = self.load_fixture(f"{name}_not_loaded")
+            self.stats["not_loaded"] += 1
+        if browser_html is None:
+            browser_html = self.load_fixture(name) or "<html><head></head><body></body></html>"
+            if self.vary_wallets and name == "dex_screener_top_traders":
+                browser_html = helper_vary_wallet_addresses(browser_html, url)
+        return browser_html
+
+    async def extract(self, request):
+        query = await request.json()
+        url = query.get("url", "")
+        self.stats["requests"] += 1
+
+        # Reject the requests beyond the concurrency cap right away
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            self.stats["status/429"] += 1
+            self.stats["concurrency_rejections"] += 1
+            return web.json_response(ERROR_RESPONSES[429], status=429)
+
+        self.in_flight += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.in_flight)
+        try:
+            # Draw the latency and the outcome of this attempt of the URL
+            self.attempts[url] += 1
+            rng = random.Random(f"{self.seed}:{url}:{self.attempts[url]}")
+            latency = helper_sample_latency(rng, self.latency, self.latency_mean, self.latency_sigma)
+            if latency > 0:
+                await asyncio.sleep(latency)
+
+            draw = rng.random()
+            for status, error_rate in sorted(self.error_rates.items()):
+                if draw < error_rate:
+                    self.stats[f"status/{status}"] += 1
+                    return web.json_response(ERROR_RESPONSES[status], status=status)
+                draw -= error_rate
+
+            # Build the response, with the outputs that were requested
+            browser_html = self.render(url, rng, self.not_loaded_rate if query.get("browserHtml") else self.http_not_loaded_rate)
+            api_response = {"url": url, "statusCode": 200}
+            if query.get("browserHtml"):
+                api_response["browserHtml"] = browser_html
+            if query.get("httpResponseBody"):
+                api_response["httpResponseBody"] = b64encode(browser_html.encode("utf-8")).decode("ascii")
+            if query.get("httpResponseHeaders") or query.get("httpResponseBody"):
+                api_response["httpResponseHeaders"] = [{"name": "content-type", "value": "text/html; charset=utf-8"}]
+            if query.get("actions"):
+                api_response["actions"] = [
+                    {"action": action.get("action"), "elapsedTime": latency / len(query["actions"]), "status": "success"}
+                    for action in query["actions"]
+                ]
+            self.stats["status/200"] += 1
+            return web.json_response(api_response)
+        finally:
+            self.in_flight -= 1
+
+    async def get_stats(self, request):
+        return web.json_response(dict(self.stats, in_flight=self.in_flight, unique_urls=len(self.attempts), retried_urls=sum(attempts > 1 for attempts in self.attempts.values())))
+
+    def build_app(self):
+        app = web.Application(client_max_size=pow(2, 24))
+        app.router.add_post("/v1/extract", self.extract)
+        app.router.add_get("/stats", self.get_stats)
+        return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Zyte API extract endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--fixtures-dir", default=FIXTURES_DIR, help="Directory of the saved browserHtml fixtures")
+    parser.add_argument("--latency", choices=["fixed", "uniform", "exponential", "lognormal"], default="fixed", help="Latency distribution")
+    parser.add_argument("--latency-mean", type=float, default=0.0, help="Mean latency in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Half-width of the uniform distribution, or sigma of the lognormal one")
+    parser.add_argument("--error-rate-429", type=float, default=0.0)
+    parser.add_argument("--error-rate-500", type=float, default=0.0)
+    parser.add_argument("--error-rate-521", type=float, default=0.0)
+    parser.add_argument("--not-loaded-rate", type=float, default=0.0, help="Probability of serving the not fully loaded version of a page")
+    parser.add_argument("--http-not-loaded-rate", type=float, default=0.0, help="Probability of serving the not fully loaded version of a page as a plain HTTP response")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="Concurrent requests allowed before answering 429 (0 means unlimited)")
+    parser.add_argument("--same-wallets", action="store_true", help="Serve the same wallet addresses for every pair")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    stand_in = ZyteAPIStandIn(
+        fixtures_dir=args.fixtures_dir,
+        latency=args.latency,
+        latency_mean=args.latency_mean,
+        latency_sigma=args.latency_sigma,
+        error_rates={429: args.error_rate_429, 500: args.error_rate_500, 521: args.error_rate_521},
+        not_loaded_rate=args.not_loaded_rate,
+        http_not_loaded_rate=args.http_not_loaded_rate,
+        max_concurrency=args.max_concurrency,
+        vary_wallets=not args.same_wallets,
+        seed=args.seed
+    )
+    web.run_app(stand_in.build_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()